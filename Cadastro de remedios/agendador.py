@@ -0,0 +1,120 @@
+"""
+Agendador de tarefas por horário.
+
+Uma única thread guarda as tarefas em um heap ordenado pelo horário de
+execução e dorme até a próxima, em vez de acordar de tempos em tempos para
+conferir se algo mudou. Cada tarefa tem um nome: agendar de novo com o
+mesmo nome substitui o horário anterior (é assim que uma mudança de
+estoque antecipa a verificação de alertas).
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Espera máxima entre duas conferências do relógio. Cobre mudanças de hora
+# e o computador suspenso; acordar só confere o heap, não consulta o banco.
+ESPERA_MAXIMA_S = 3600
+
+
+def proxima_meia_noite(agora=None):
+    """Horário (timestamp) da próxima meia-noite local."""
+    agora = agora or datetime.now()
+    return datetime.combine(agora.date() + timedelta(days=1), datetime.min.time()).timestamp()
+
+
+def meia_noite_de(dia):
+    """Horário (timestamp) do início do dia 'dia' (um date), no fuso local."""
+    return datetime.combine(dia, datetime.min.time()).timestamp()
+
+
+class Agendador:
+    """Thread única que executa tarefas nomeadas no horário marcado."""
+
+    def __init__(self, relogio=time.time, espera_maxima=ESPERA_MAXIMA_S):
+        self.relogio = relogio
+        self.espera_maxima = espera_maxima
+        self._heap = []
+        self._tarefas = {} # nome -> entrada do heap ainda válida
+        self._contador = itertools.count()
+        self._condicao = threading.Condition()
+        self._parar = False
+        self._thread = None
+
+    def iniciar(self):
+        """Inicia a thread do agendador."""
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def agendar(self, nome, quando, funcao):
+        """Marca 'funcao()' para o horário 'quando' (timestamp), substituindo a tarefa de mesmo nome."""
+        with self._condicao:
+            self._descartar(nome)
+            entrada = [quando, next(self._contador), nome, funcao]
+            self._tarefas[nome] = entrada
+            heapq.heappush(self._heap, entrada)
+            if self._heap[0] is entrada:
+                self._condicao.notify() # A tarefa nova é a próxima: reavalia a espera
+
+    def agendar_em(self, nome, segundos, funcao):
+        """Marca 'funcao()' para daqui a 'segundos'."""
+        self.agendar(nome, self.relogio() + segundos, funcao)
+
+    def cancelar(self, nome):
+        with self._condicao:
+            self._descartar(nome)
+
+    def horario(self, nome):
+        """Horário marcado para a tarefa (None se não houver)."""
+        with self._condicao:
+            entrada = self._tarefas.get(nome)
+            return entrada[0] if entrada else None
+
+    def parar(self, timeout=5):
+        """Encerra a thread (tarefas pendentes são descartadas)."""
+        if self._thread is None:
+            return
+        with self._condicao:
+            self._parar = True
+            self._condicao.notify()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _descartar(self, nome):
+        entrada = self._tarefas.pop(nome, None)
+        if entrada is not None:
+            entrada[3] = None # Fica no heap, mas é ignorada quando chegar a vez
+
+    def _proxima(self):
+        """Espera e retira a próxima tarefa vencida (None ao parar)."""
+        with self._condicao:
+            while not self._parar:
+                while self._heap and self._heap[0][3] is None:
+                    heapq.heappop(self._heap)
+
+                agora = self.relogio()
+                if self._heap and self._heap[0][0] <= agora:
+                    _, _, nome, funcao = heapq.heappop(self._heap)
+                    del self._tarefas[nome]
+                    return nome, funcao
+
+                espera = self.espera_maxima
+                if self._heap:
+                    espera = min(espera, self._heap[0][0] - agora)
+                self._condicao.wait(espera)
+            return None
+
+    def _loop(self):
+        while True:
+            proxima = self._proxima()
+            if proxima is None:
+                return
+            nome, funcao = proxima
+            try:
+                funcao()
+            except Exception as e:
+                logger.exception("Erro na tarefa agendada '%s': %s", nome, e)
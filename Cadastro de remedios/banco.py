@@ -0,0 +1,113 @@
+"""
+Gerenciador de conexões com o banco SQLite.
+
+Cada thread recebe a sua própria conexão, aberta na primeira vez que pede
+e reaproveitada depois disso. Todas as conexões usam WAL, para que a
+verificação de notificações consiga ler enquanto a interface grava, e
+medem o tempo de cada comando nas métricas do diagnóstico.
+"""
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+from diagnostico import metricas
+
+BUSY_TIMEOUT_MS = 5000 # Quanto uma conexão espera por uma trava antes de desistir
+TAMANHO_NOME_SQL = 70 # Caracteres do comando usados como nome da métrica
+MAX_NOMES_SQL = 2000 # Comandos diferentes com o nome guardado em cache
+
+logger = logging.getLogger(__name__)
+_nomes_sql = {}
+
+
+def nome_metrica_sql(sql):
+    """Nome da métrica de um comando: 'sql: ' e o começo do comando, com os espaços normalizados."""
+    nome = _nomes_sql.get(sql)
+    if nome is None:
+        nome = "sql: " + re.sub(r"\s+", " ", sql).strip()[:TAMANHO_NOME_SQL]
+        if len(_nomes_sql) < MAX_NOMES_SQL:
+            _nomes_sql[sql] = nome
+    return nome
+
+
+class ConexaoMedida(sqlite3.Connection):
+    """Conexão que registra o tempo de cada execute/executemany e de cada commit explícito."""
+
+    def execute(self, sql, parametros=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            metricas.registrar(nome_metrica_sql(sql), (time.perf_counter() - inicio) * 1000)
+
+    def executemany(self, sql, parametros):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            metricas.registrar(nome_metrica_sql(sql), (time.perf_counter() - inicio) * 1000)
+
+    def commit(self):
+        inicio = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            metricas.registrar("sql: COMMIT", (time.perf_counter() - inicio) * 1000)
+
+
+class GerenciadorConexoes:
+    """Entrega uma conexão SQLite por thread, configurada e reaproveitada."""
+
+    def __init__(self, caminho, busy_timeout_ms=BUSY_TIMEOUT_MS):
+        self.caminho = caminho
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._conexoes = []
+        self._trava = threading.Lock()
+
+    def conexao(self):
+        """Retorna a conexão da thread atual, abrindo-a se for a primeira vez."""
+        conn = getattr(self._local, "conexao", None)
+        if conn is None:
+            conn = self._abrir()
+            self._local.conexao = conn
+            with self._trava:
+                self._conexoes.append(conn)
+        return conn
+
+    def _abrir(self):
+        # check_same_thread=False só para que fechar_todas() possa fechar
+        # as conexões das outras threads na saída; cada uma só é usada pela sua.
+        conn = sqlite3.connect(
+            self.caminho, timeout=self.busy_timeout_ms / 1000, check_same_thread=False, factory=ConexaoMedida
+        )
+
+        modo = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        if modo.lower() != "wal":
+            # Ex.: sistemas de arquivos de rede, onde o SQLite não consegue usar WAL
+            logger.warning("Não foi possível ativar o modo WAL (modo atual: %s).", modo)
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def fechar_conexao_da_thread(self):
+        """Fecha a conexão da thread atual (para threads que vão terminar)."""
+        conn = getattr(self._local, "conexao", None)
+        if conn is not None:
+            self._local.conexao = None
+            with self._trava:
+                self._conexoes.remove(conn)
+            conn.close()
+
+    def fechar_todas(self):
+        """Fecha as conexões de todas as threads."""
+        with self._trava:
+            conexoes, self._conexoes = self._conexoes, []
+        for conn in conexoes:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error("Erro ao fechar conexão: %s", e)
@@ -0,0 +1,140 @@
+"""
+Teste de carga da API HTTP/JSON (servidor_api.py) sobre um banco gerado.
+
+Inicia o servidor em outro processo (em uma porta livre, sobre uma cópia do
+banco do tamanho pedido) e abre 'clientes' conexões keep-alive, cada uma em
+uma thread, que fazem requisições sem pausa durante 'segundos': páginas da
+lista (metade ordenadas pelo fim previsto), previsões de remédios
+aleatórios e, na fração 'escritas', somas ao estoque. Mostra as requisições
+por segundo e as latências (p50, p95, p99) de cada tipo.
+
+Com mais clientes que trabalhadores no servidor, as conexões a mais
+esperam uma thread livre: o normal é usar clientes <= trabalhadores.
+
+Uso:
+  python benchmarks/bench_api.py [--tamanho 100000] [--clientes 8] [--trabalhadores 8]
+                                 [--segundos 10] [--escritas 0.1] [--dados pasta]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from gerar_banco import gerar
+
+PASTA_PROGRAMA = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPO_MAX_INICIO_S = 120 # O primeiro início migra o banco gerado para o esquema atual
+
+
+def iniciar_servidor(caminho, trabalhadores):
+    """Inicia servidor_api.py em uma porta livre. Retorna o processo e a porta."""
+    processo = subprocess.Popen(
+        [sys.executable, os.path.join(PASTA_PROGRAMA, "servidor_api.py"),
+         "--porta", "0", "--banco", caminho, "--trabalhadores", str(trabalhadores)],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, cwd=PASTA_PROGRAMA
+    )
+    inicio = time.monotonic()
+    for linha in processo.stdout:
+        if linha.startswith("Servindo em "):
+            return processo, int(linha.rsplit(":", 1)[1])
+        if time.monotonic() - inicio > TEMPO_MAX_INICIO_S:
+            break
+    processo.kill()
+    raise RuntimeError("O servidor não informou a porta.")
+
+
+def cliente(porta, tamanho, fim, escritas, semente, tempos):
+    """Uma conexão keep-alive fazendo requisições até 'fim'; acrescenta (tipo, ms) a 'tempos'."""
+    gerador = random.Random(semente)
+    conexao = http.client.HTTPConnection("127.0.0.1", porta)
+    proximo = {"": None, "fim": None} # 'proximo' da última página de cada ordem
+    medidas = []
+    while time.monotonic() < fim:
+        sorteio = gerador.random()
+        if sorteio < escritas:
+            tipo, metodo = "escrita", "POST"
+            caminho = f"/remedios/{gerador.randint(1, tamanho)}/estoque"
+            corpo = json.dumps({"quantidade": 1})
+        elif sorteio < escritas + (1 - escritas) / 2:
+            tipo, metodo, corpo = "lista", "GET", None
+            ordem = gerador.choice(("", "fim"))
+            caminho = f"/remedios?ordem={ordem}"
+            if proximo[ordem] is not None:
+                caminho += f"&depois={proximo[ordem]}"
+        else:
+            tipo, metodo, corpo = "previsao", "GET", None
+            caminho = f"/remedios/{gerador.randint(1, tamanho)}/previsao"
+
+        inicio = time.perf_counter()
+        conexao.request(metodo, caminho, corpo, {"Content-Type": "application/json"} if corpo else {})
+        resposta = conexao.getresponse()
+        dados = resposta.read()
+        medidas.append((tipo, (time.perf_counter() - inicio) * 1000))
+        if resposta.status != 200:
+            raise RuntimeError(f"{metodo} {caminho}: {resposta.status} {dados[:200]!r}")
+        if tipo == "lista":
+            proximo[ordem] = json.loads(dados)["proximo"]
+    conexao.close()
+    tempos.extend(medidas)
+
+
+def percentil(valores, fracao):
+    return valores[min(len(valores) - 1, int(len(valores) * fracao))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga da API HTTP/JSON local.")
+    parser.add_argument("--tamanho", type=int, default=100_000, help="Remédios no banco gerado")
+    parser.add_argument("--clientes", type=int, default=8, help="Conexões simultâneas")
+    parser.add_argument("--trabalhadores", type=int, default=8, help="Threads do servidor")
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--escritas", type=float, default=0.1, help="Fração das requisições que somam ao estoque")
+    parser.add_argument("--dados", help="Pasta onde guardar/reaproveitar os bancos gerados")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta_execucao:
+        pasta_dados = args.dados or pasta_execucao
+        original = os.path.join(pasta_dados, f"remedios_{args.tamanho}.db")
+        if not os.path.exists(original):
+            print(f"Gerando banco de {args.tamanho} remédios...")
+            gerar(original, args.tamanho)
+        copia = os.path.join(pasta_execucao, "api.db")
+        shutil.copyfile(original, copia)
+
+        processo, porta = iniciar_servidor(copia, args.trabalhadores)
+        try:
+            tempos = []
+            fim = time.monotonic() + args.segundos
+            threads = [
+                threading.Thread(target=cliente, args=(porta, args.tamanho, fim, args.escritas, i, tempos))
+                for i in range(args.clientes)
+            ]
+            inicio = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            duracao = time.perf_counter() - inicio
+        finally:
+            processo.terminate()
+            processo.wait()
+
+    print(f"{args.tamanho} remédios, {args.clientes} cliente(s), {args.trabalhadores} trabalhador(es), "
+          f"{duracao:.1f} s: {len(tempos)} requisições, {len(tempos) / duracao:.0f} req/s")
+    print(f"{'tipo':<10} | {'req':>7} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}")
+    for tipo in ("lista", "previsao", "escrita"):
+        valores = sorted(ms for nome, ms in tempos if nome == tipo)
+        if valores:
+            print(f"{tipo:<10} | {len(valores):>7} | {percentil(valores, 0.5):>8.2f} | "
+                  f"{percentil(valores, 0.95):>8.2f} | {percentil(valores, 0.99):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
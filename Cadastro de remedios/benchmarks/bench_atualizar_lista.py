@@ -0,0 +1,124 @@
+"""
+Benchmark da atualização da lista de remédios (Treeview).
+
+Compara, para tabelas de tamanhos crescentes, o custo de:
+  - recriar a lista inteira (apagar tudo e reinserir, como era antes);
+  - reconciliar a lista pelo id (atualizar_lista_remedios: virada do dia,
+    busca, botão Atualizar) depois de mudar um único remédio, em ordem de id
+    e com a lista ordenada pelo fim previsto (a linha muda de lugar);
+  - atualizar só a linha do remédio alterado (caminho dos botões).
+Cada tamanho roda no modo que o App usaria: acima de LIMITE_LISTA_VIRTUAL
+linhas, a lista virtual (só uma janela de linhas carregada), e a
+reconciliação lê e compara só essa janela. As colunas "ops" contam as chamadas que mudaram a árvore em cada
+atualização: é o trabalho que cabe ao Tk, e não cresce com a tabela.
+
+Uso: python benchmarks/bench_atualizar_lista.py [tamanho ...]
+
+Com display, mede uma ttk.Treeview de verdade (janela oculta); sem display,
+usa a Treeview substituta em memória, com custos parecidos (inserir no fim
+e trocar valores em tempo constante, posições percorrendo a lista) e a
+contagem das operações.
+"""
+import os
+import sys
+import tempfile
+
+from comum import REPETICOES, criar_arvore, gr, limpar_arvore, medir
+from registros import Registro
+from substitutos import criar_app
+
+TAMANHOS_PADRAO = (1_000, 5_000, 20_000, 100_000)
+
+
+def popular(app, tamanho):
+    app.db.conexao().executemany(
+        "INSERT INTO remedios (nome, doses_por_dia, estoque_atual, unidade) VALUES (?, ?, ?, ?)",
+        ((f"Remedio {i}", 1 + i % 4, (i * 7) % 300, "comprimido" if i % 3 else "ml") for i in range(tamanho))
+    )
+    app.db.conexao().commit()
+
+
+def recriar_lista(app):
+    """A estratégia antiga: apaga todas as linhas e reinsere a tabela inteira."""
+    limpar_arvore(app.tree)
+    remedios = app.db.conexao().execute("SELECT id, nome, doses_por_dia, estoque_atual, unidade FROM remedios").fetchall()
+    for remedio_id, valores in app._formatar_linhas([Registro(*linha) for linha in remedios]):
+        app.tree.insert("", "end", iid=remedio_id, values=valores)
+    app._linhas_exibidas = {}
+    app.registros.invalidar()
+
+
+def mudar_um(app, remedio_id):
+    app.db.conexao().execute("UPDATE remedios SET estoque_atual = estoque_atual + 1 WHERE id = ?", (remedio_id,))
+    app.db.conexao().commit()
+
+
+def mover_um(app, remedio_id):
+    """
+    Vira o estoque entre pouco e muito: com a lista ordenada pelo fim, a linha
+    troca de lugar a cada vez (na lista virtual, sai da janela e volta).
+    """
+    app.db.conexao().execute("UPDATE remedios SET estoque_atual = 300 - estoque_atual WHERE id = ?", (remedio_id,))
+    app.db.conexao().commit()
+
+
+def medir_com_operacoes(app, funcao):
+    """(melhor tempo em ms, operações na árvore por execução; None numa Treeview de verdade)."""
+    antes = getattr(app.tree, "operacoes", None)
+    tempo = medir(funcao)
+    if antes is None:
+        return tempo, None
+    return tempo, (app.tree.operacoes - antes) // REPETICOES
+
+
+def main(tamanhos):
+    root, tree = criar_arvore()
+    print("Treeview:", "ttk (janela oculta)" if root else "substituta em memória")
+    print(f"{'linhas':>8} | {'modo':>7} | {'recriar (ms)':>13} | {'reconciliar (ms)':>16} | {'ops':>4} | "
+          f"{'reconciliar ordenada (ms)':>25} | {'ops':>4} | {'uma linha (ms)':>14} | {'uma linha ordenada (ms)':>23}")
+
+    for tamanho in tamanhos:
+        with tempfile.TemporaryDirectory() as pasta:
+            limpar_arvore(tree)
+            virtual = tamanho > gr.LIMITE_LISTA_VIRTUAL
+            app = criar_app(os.path.join(pasta, "bench.db"), tree, modo_virtual=virtual)
+            popular(app, tamanho)
+
+            t_recriar = medir(lambda: recriar_lista(app))
+            app._recarregar_lista()
+            ids = app.tree.get_children()
+            alvo = int(ids[len(ids) // 2]) # Uma linha carregada, no meio da lista (ou da janela)
+
+            def reconciliar():
+                mudar_um(app, alvo)
+                app.atualizar_lista_remedios()
+
+            def reconciliar_movendo():
+                mover_um(app, alvo)
+                app.atualizar_lista_remedios()
+
+            def uma_linha():
+                mudar_um(app, alvo)
+                app.atualizar_remedio_na_lista(alvo)
+
+            t_reconciliar, ops = medir_com_operacoes(app, reconciliar)
+            t_uma = medir(uma_linha)
+
+            app._ordem = "fim"
+            app._recarregar_lista()
+            ids = app.tree.get_children()
+            alvo = int(ids[len(ids) // 2])
+            t_ordenada, ops_ordenada = medir_com_operacoes(app, reconciliar_movendo)
+            t_uma_ordenada = medir(uma_linha)
+            app.db.fechar_todas()
+
+        print(f"{tamanho:>8} | {'virtual' if virtual else 'inteira':>7} | {t_recriar:>13.2f} | {t_reconciliar:>16.2f} | {ops if ops is not None else '-':>4} | "
+              f"{t_ordenada:>25.2f} | {ops_ordenada if ops_ordenada is not None else '-':>4} | "
+              f"{t_uma:>14.3f} | {t_uma_ordenada:>23.3f}")
+
+    if root:
+        root.destroy()
+
+
+if __name__ == "__main__":
+    main([int(t) for t in sys.argv[1:]] or TAMANHOS_PADRAO)
@@ -0,0 +1,117 @@
+"""
+Compara os dois modos de armazenamento do estoque (MODO_DEBITO e MODO_ANCORA).
+
+1. Confere a equivalência: aplica a mesma sequência aleatória de viradas de dia,
+   adições e modificações de estoque em um banco de cada modo e verifica, a cada
+   passo, que o estoque de hoje e os alertas são idênticos. No fim, migra o banco
+   âncora de volta para o modo débito e confere de novo.
+2. Mede o custo da virada de dia em cada modo para tabelas grandes.
+
+Uso: python benchmarks/bench_debito_ancora.py [tamanho ...]
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco import GerenciadorConexoes
+import remedios_core as core
+
+logging.getLogger().addHandler(logging.NullHandler())
+
+TAMANHOS_PADRAO = (10_000, 100_000)
+DIAS_SIMULADOS = 200
+
+
+def criar_servico(db_path, modo):
+    """Abre um banco novo no modo de estoque pedido."""
+    servico = core.ServicoEstoque(GerenciadorConexoes(db_path))
+    servico.inicializar()
+    servico.debitar_dias()
+    servico.migrar_modo_estoque(modo)
+    return servico
+
+
+def popular(servico, tamanho, gerador):
+    servico.db.conexao().executemany(
+        "INSERT INTO remedios (nome, doses_por_dia, estoque_atual, limite_dias) VALUES (?, ?, ?, ?)",
+        ((f"Remedio {i}", gerador.randint(1, 4), gerador.randint(0, 400), gerador.randint(0, 10)) for i in range(tamanho))
+    )
+    servico.db.conexao().commit()
+
+
+def estado(servico):
+    estoques = servico.db.conexao().execute("SELECT id, estoque_atual FROM remedios_hoje ORDER BY id").fetchall()
+    dia = servico.db.conexao().execute("SELECT CAST(julianday(last_run_date) AS INTEGER) FROM app_info WHERE id = 1").fetchone()[0]
+    alertas = servico.db.conexao().execute(
+        "SELECT id FROM remedios_hoje WHERE dia_fim - limite_dias <= ? AND estoque_atual > 0 ORDER BY id", (dia,)
+    ).fetchall()
+    return estoques, alertas
+
+
+def verificar_equivalencia(pasta, semente=7, quantidade=60):
+    gerador = random.Random(semente)
+    debito = criar_servico(os.path.join(pasta, "debito.db"), core.MODO_DEBITO)
+    ancora = criar_servico(os.path.join(pasta, "ancora.db"), core.MODO_ANCORA)
+
+    popular(debito, quantidade, random.Random(semente))
+    popular(ancora, quantidade, random.Random(semente))
+
+    hoje = date.today()
+    for passo in range(DIAS_SIMULADOS):
+        hoje += timedelta(days=gerador.choice((0, 1, 1, 1, 2, 5)))
+        for servico in (debito, ancora):
+            servico.debitar_dias(hoje=hoje)
+
+        for _ in range(gerador.randint(0, 3)):
+            remedio_id = gerador.randint(1, quantidade)
+            quantidade_mov = gerador.randint(1, 120)
+            somar = gerador.random() < 0.7
+            for servico in (debito, ancora):
+                if somar:
+                    servico.adicionar_estoque(remedio_id, quantidade_mov)
+                else:
+                    servico.definir_estoque(remedio_id, quantidade_mov)
+
+        if estado(debito) != estado(ancora):
+            raise AssertionError(f"Modos divergiram no passo {passo} ({hoje}).")
+
+    esperado = estado(ancora)
+    ancora.migrar_modo_estoque(core.MODO_DEBITO)
+    if estado(ancora) != esperado or estado(debito) != esperado:
+        raise AssertionError("A migração de volta para o modo débito mudou o estoque.")
+
+    for servico in (debito, ancora):
+        servico.db.fechar_todas()
+    print(f"Equivalência conferida: {DIAS_SIMULADOS} passos, {quantidade} remédios.")
+
+
+def medir_virada(pasta, modo, tamanho):
+    servico = criar_servico(os.path.join(pasta, f"{modo}_{tamanho}.db"), modo)
+    popular(servico, tamanho, random.Random(tamanho))
+    amanha = date.today() + timedelta(days=1)
+    inicio = time.perf_counter()
+    servico.debitar_dias(hoje=amanha)
+    duracao = time.perf_counter() - inicio
+    servico.db.fechar_todas()
+    return duracao * 1000
+
+
+def main(tamanhos):
+    with tempfile.TemporaryDirectory() as pasta:
+        verificar_equivalencia(pasta)
+
+        print(f"{'remédios':>9} | {'débito (ms)':>11} | {'âncora (ms)':>11}")
+        for tamanho in tamanhos:
+            t_debito = medir_virada(pasta, core.MODO_DEBITO, tamanho)
+            t_ancora = medir_virada(pasta, core.MODO_ANCORA, tamanho)
+            print(f"{tamanho:>9} | {t_debito:>11.2f} | {t_ancora:>11.2f}")
+
+
+if __name__ == "__main__":
+    main([int(t) for t in sys.argv[1:]] or TAMANHOS_PADRAO)
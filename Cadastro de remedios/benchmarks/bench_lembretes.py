@@ -0,0 +1,194 @@
+"""
+Mede o motor de lembretes (lembretes.py) e o débito por dose com muitos horários.
+
+Sobre um banco gerado com 'remedios' remédios, define 'horarios' horários
+por remédio (a maioria nas horas cheias mais comuns, o resto em minutos
+aleatórios) e mede:
+  - horarios_definir: definir_horarios de todos os remédios, em uma transação
+    (tempo por remédio);
+  - carga: recarregar() do motor (ler todos os horários e montar o heap);
+  - dia_*: um dia inteiro simulado com um relógio falso, do começo ao fim:
+    quantos disparos o temporizador teve para quantas doses, o tempo total e
+    o pior disparo (retirar as doses do heap, perguntar ao banco quais não
+    foram tomadas, montar o lembrete e remarcar para o dia seguinte);
+  - tomar_dose: tomar_dose de doses ainda não tomadas, uma transação cada;
+  - ocioso: CPU gasta pelo processo com o motor carregado e o Agendador de
+    verdade esperando o próximo lembrete.
+
+Uso:
+  python benchmarks/bench_lembretes.py [--remedios 10000] [--horarios 3] [--ocioso 3] [--dados pasta]
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from comum import medir
+from gerar_banco import gerar
+
+import remedios_core as core
+from agendador import Agendador
+from banco import GerenciadorConexoes
+from lembretes import MotorLembretes
+from notificacoes import BackendMemoria, Despachante
+
+HORAS_COMUNS = (6, 8, 12, 14, 18, 20, 22)
+FRACAO_HORAS_COMUNS = 0.8
+DOSES_TOMADAS = 1000
+
+
+class AgendadorFalso:
+    """Só guarda o horário marcado para cada tarefa (o dia simulado chama o motor direto)."""
+
+    def __init__(self, relogio):
+        self.relogio = relogio
+        self.armacoes = 0
+
+    def agendar(self, nome, quando, funcao):
+        self.armacoes += 1
+
+    def agendar_em(self, nome, segundos, funcao):
+        self.armacoes += 1
+
+    def cancelar(self, nome):
+        pass
+
+
+class Relogio:
+    def __init__(self, agora):
+        self.agora = agora
+
+    def __call__(self):
+        return self.agora
+
+
+def sortear_horarios(gerador, quantidade):
+    minutos = set()
+    while len(minutos) < quantidade:
+        if gerador.random() < FRACAO_HORAS_COMUNS:
+            minutos.add(gerador.choice(HORAS_COMUNS) * 60)
+        else:
+            minutos.add(gerador.randrange(core.MINUTOS_DIA))
+    return [(minuto, gerador.randint(1, 2)) for minuto in minutos]
+
+
+def definir_horarios(servico, remedios, horarios_por_remedio):
+    """Define os horários de todos os remédios em uma transação. Retorna o tempo por remédio (ms)."""
+    gerador = random.Random(remedios)
+    conn = servico.db.conexao()
+    inicio = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    for remedio_id in range(1, remedios + 1):
+        servico.definir_horarios(remedio_id, sortear_horarios(gerador, horarios_por_remedio))
+    conn.commit()
+    return (time.perf_counter() - inicio) * 1000 / remedios
+
+
+def simular_dia(servico):
+    """Um dia inteiro, de meia-noite a meia-noite, com o relógio pulando de lembrete em lembrete."""
+    meia_noite = datetime.combine(date.today(), datetime.min.time()).timestamp()
+    fim = datetime.combine(date.today() + timedelta(days=1), datetime.min.time()).timestamp()
+    relogio = Relogio(meia_noite - 1) # As doses das 00:00 também contam
+    agendador = AgendadorFalso(relogio)
+    despachante = Despachante(BackendMemoria(), intervalo_minimo_s=0)
+    lembradas = []
+
+    def ao_lembrar(doses):
+        lembradas.append(len(doses))
+        despachante.lembrar(doses)
+
+    motor = MotorLembretes(servico, agendador, ao_lembrar)
+
+    carga = medir(motor.recarregar, repeticoes=3)
+    agendador.armacoes = 0
+    disparos, pior, total = 0, 0.0, 0.0
+    while True:
+        proximo = motor.proximo()
+        if proximo is None or proximo >= fim:
+            break
+        relogio.agora = proximo
+        inicio = time.perf_counter()
+        motor._disparar()
+        duracao = (time.perf_counter() - inicio) * 1000
+        disparos += 1
+        total += duracao
+        pior = max(pior, duracao)
+    return {
+        "horarios": len(motor), "carga_ms": carga, "disparos": disparos, "armacoes": agendador.armacoes,
+        "lembretes": len(despachante.backend.exibidas), "total_ms": total, "pior_ms": pior,
+        "doses_lembradas": sum(lembradas),
+    }
+
+
+def medir_tomar_dose(servico, quantidade):
+    """Tempo médio (ms) de tomar_dose em 'quantidade' doses diferentes de hoje."""
+    ids = [horario_id for horario_id, _, _ in servico.listar_horarios()]
+    amostra = random.Random(1).sample(ids, min(quantidade, len(ids)))
+    inicio = time.perf_counter()
+    for horario_id in amostra:
+        servico.tomar_dose(horario_id)
+    return (time.perf_counter() - inicio) * 1000 / len(amostra)
+
+
+def medir_ocioso(servico, segundos):
+    """
+    CPU (ms por segundo) do processo com o motor carregado em um Agendador real,
+    esperando, e quantos disparos de verdade (pelo relógio real) caíram no meio.
+    """
+    agendador = Agendador()
+    disparos = []
+    motor = MotorLembretes(servico, agendador, disparos.append)
+    agendador.iniciar()
+    motor.recarregar()
+    time.sleep(0.1) # O agendador arma a espera pelo primeiro lembrete
+    inicio_cpu, inicio = time.process_time(), time.perf_counter()
+    time.sleep(segundos)
+    cpu = (time.process_time() - inicio_cpu) * 1000 / (time.perf_counter() - inicio)
+    agendador.parar()
+    return cpu, len(disparos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Motor de lembretes e débito por dose com muitos horários.")
+    parser.add_argument("--remedios", type=int, default=10_000)
+    parser.add_argument("--horarios", type=int, default=3, help="Horários por remédio")
+    parser.add_argument("--ocioso", type=float, default=3, help="Segundos medindo a CPU parada")
+    parser.add_argument("--dados", help="Pasta onde guardar/reaproveitar os bancos gerados")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta_execucao:
+        pasta_dados = args.dados or pasta_execucao
+        original = os.path.join(pasta_dados, f"remedios_{args.remedios}.db")
+        if not os.path.exists(original):
+            print(f"Gerando banco de {args.remedios} remédios...")
+            gerar(original, args.remedios)
+        copia = os.path.join(pasta_execucao, "lembretes.db")
+        shutil.copyfile(original, copia)
+
+        db = GerenciadorConexoes(copia)
+        servico = core.ServicoEstoque(db)
+        servico.inicializar()
+        servico.debitar_dias()
+
+        definir = definir_horarios(servico, args.remedios, args.horarios)
+        dia = simular_dia(servico)
+        tomar = medir_tomar_dose(servico, DOSES_TOMADAS)
+        ocioso_cpu, disparos_ocioso = medir_ocioso(servico, args.ocioso)
+        db.fechar_todas()
+
+    print(f"{args.remedios} remédios x {args.horarios} horários = {dia['horarios']} doses por dia")
+    print(f"horarios_definir  {definir:9.3f} ms por remédio")
+    print(f"carga             {dia['carga_ms']:9.2f} ms")
+    print(f"dia_disparos      {dia['disparos']:9d} disparos do temporizador ({dia['armacoes']} remarcações) "
+          f"para {dia['doses_lembradas']} doses, {dia['lembretes']} lembretes")
+    print(f"dia_total         {dia['total_ms']:9.2f} ms ({dia['total_ms'] * 1000 / max(1, dia['doses_lembradas']):.1f} µs por dose)")
+    print(f"dia_pior_disparo  {dia['pior_ms']:9.2f} ms")
+    print(f"tomar_dose        {tomar:9.3f} ms por dose")
+    print(f"ocioso            {ocioso_cpu:9.3f} ms de CPU por segundo ({disparos_ocioso} lembrete(s) no período)")
+
+
+if __name__ == "__main__":
+    main()
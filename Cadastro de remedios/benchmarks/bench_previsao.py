@@ -0,0 +1,50 @@
+"""
+Benchmark da previsão de estoque em lote (previsao.py).
+
+Mede prever_lote e formatar_previsoes para listas grandes, pelo caminho
+NumPy (se instalado) e pelo caminho em Python puro.
+
+Uso: python benchmarks/bench_previsao.py [tamanho ...]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import previsao
+
+TAMANHOS_PADRAO = (1_000, 100_000, 1_000_000)
+REPETICOES = 3
+
+
+def medir(funcao):
+    melhor = float("inf")
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor * 1000
+
+
+def main(tamanhos):
+    gerador = random.Random(42)
+    print("NumPy:", "disponível" if previsao.NUMPY_AVAILABLE else "não instalado")
+    print(f"{'itens':>9} | {'numpy (ms)':>10} | {'python (ms)':>11} | {'formatar (ms)':>13}")
+
+    for tamanho in tamanhos:
+        estoques = [gerador.randint(0, 500) for _ in range(tamanho)]
+        doses = [gerador.randint(0, 6) for _ in range(tamanho)]
+        base = previsao.date.today().toordinal()
+
+        t_numpy = medir(lambda: previsao._prever_numpy(estoques, doses, base)) if previsao.NUMPY_AVAILABLE else float("nan")
+        t_python = medir(lambda: previsao._prever_python(estoques, doses, base))
+        dias, datas_fim = previsao.prever_lote(estoques, doses)
+        t_formatar = medir(lambda: previsao.formatar_previsoes(dias, datas_fim))
+
+        print(f"{tamanho:>9} | {t_numpy:>10.2f} | {t_python:>11.2f} | {t_formatar:>13.2f}")
+
+
+if __name__ == "__main__":
+    main([int(t) for t in sys.argv[1:]] or TAMANHOS_PADRAO)
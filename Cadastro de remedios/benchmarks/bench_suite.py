@@ -0,0 +1,301 @@
+"""
+Suíte de benchmarks dos caminhos quentes do estoque, com dados sintéticos.
+
+Para cada tamanho (por padrão 1k, 10k, 100k e 1M remédios, com histórico)
+gera um remedios.db, monta um App sem janela e mede:
+  - inicio_esquema: ServicoEstoque.inicializar com o esquema já atual
+    (o que todo início do programa paga);
+  - lista_*: atualizar_lista_remedios (carga inicial e reconciliação),
+    atualizar_remedio_na_lista e, no modo virtual, a carga de uma página;
+  - busca_*: a primeira página da lista filtrada por um prefixo que casa
+    com todos os nomes e por um nome exato (índice FTS5);
+  - ordem_*: a primeira página e a seguinte da lista ordenada pelo fim
+    previsto ("acabam primeiro"), e a primeira ordenada por estoque;
+  - paciente_*: com um segundo paciente de poucos remédios, a lista dele
+    (por id e pelo fim previsto), uma busca que casa com os nomes de todos
+    e os alertas dele;
+  - debito_*: _atualizar_estoque_automatico na virada de um dia, nos dois
+    modos de armazenamento;
+  - alertas_*: _verificar_estoque_notificacao, a primeira verificação,
+    as incrementais seguintes e a completa (botão de teste);
+  - historico_*: as reposições de um remédio em um intervalo de datas e
+    os totais por mês (consultas pelo índice do histórico) e o consumo
+    observado (leitura das estatísticas de consumo);
+  - cadastrar_*: o caminho de inserção de cadastrar_remedio, uma transação
+    por remédio e em lote pela thread de escrita (tempo por remédio).
+
+Os resultados vão para um JSON (com commit, versões e plataforma), que
+pode ser comparado com o de outro commit.
+
+Uso:
+  python benchmarks/bench_suite.py [--tamanhos 1000 10000] [--saida r.json]
+                                   [--dados pasta] [--comparar base.json]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from comum import REPETICOES, criar_arvore, gr, limpar_arvore, medir
+from gerar_banco import gerar
+
+import previsao
+import remedios_core as core
+from escritor import EscritorBanco
+from notificacoes import BackendMemoria, Despachante
+from substitutos import criar_app
+
+TAMANHOS_PADRAO = (1_000, 10_000, 100_000, 1_000_000)
+CADASTROS_POR_MEDICAO = 200
+REMEDIOS_SEGUNDO_PACIENTE = 50
+PASTA_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+
+
+def commit_atual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def preparar_banco(tamanho, pasta_dados, pasta_execucao):
+    """Copia (gerando na primeira vez) o banco do tamanho pedido para a pasta da execução."""
+    original = os.path.join(pasta_dados, f"remedios_{tamanho}.db")
+    if not os.path.exists(original):
+        inicio = time.perf_counter()
+        gerar(original, tamanho)
+        print(f"  banco de {tamanho} remédios gerado em {time.perf_counter() - inicio:.1f} s")
+    copia = os.path.join(pasta_execucao, f"remedios_{tamanho}.db")
+    shutil.copyfile(original, copia)
+    return copia
+
+
+def medir_inicio(app, repeticoes):
+    return {"inicio_esquema_ms": medir(core.ServicoEstoque(app.db).inicializar, repeticoes)}
+
+
+def medir_lista(app, repeticoes):
+    resultados = {}
+    alvo = app._contar_remedios() // 2 or 1
+
+    def zerar_lista():
+        limpar_arvore(app.tree)
+        app._linhas_exibidas = {}
+        app.registros.invalidar()
+        app._inicio_janela = 0
+        app._tem_mais_antes = False
+
+    resultados["lista_carga_inicial_ms"] = medir(app.atualizar_lista_remedios, repeticoes, zerar_lista)
+
+    def mudar_um():
+        app.servico.adicionar_estoque(alvo, 1)
+
+    resultados["lista_reconciliar_ms"] = medir(app.atualizar_lista_remedios, repeticoes, mudar_um)
+    resultados["lista_uma_linha_ms"] = medir(lambda: app.atualizar_remedio_na_lista(alvo), repeticoes, mudar_um)
+
+    if app.modo_virtual:
+        def reabrir_janela():
+            zerar_lista()
+            app.atualizar_lista_remedios()
+
+        resultados["lista_pagina_ms"] = medir(lambda: app._carregar_pagina(True), repeticoes, reabrir_janela)
+    return resultados
+
+
+def medir_busca(app, repeticoes):
+    alvo = app.servico.obter(app._contar_remedios() // 2 or 1)
+    pagina = lambda busca: app.servico.listar(0, gr.TAMANHO_PAGINA, busca, paciente_id=app.paciente_id)
+    return {
+        "busca_ampla_ms": medir(lambda: pagina("rem"), repeticoes),
+        "busca_nome_ms": medir(lambda: pagina(alvo[1]), repeticoes),
+    }
+
+
+def medir_ordenacao(app, repeticoes):
+    # Como a interface: a lista é sempre a de um paciente (índices de ordenação por paciente)
+    pagina = lambda ordem: app.servico.listar(0, gr.TAMANHO_PAGINA, ordem=ordem, paciente_id=app.paciente_id)
+    primeira = pagina("fim")
+    return {
+        "ordem_fim_pagina_ms": medir(lambda: pagina("fim"), repeticoes),
+        "ordem_fim_seguinte_ms": medir(
+            lambda: app.servico.listar_depois(primeira[-1][0], gr.TAMANHO_PAGINA, ordem="fim", paciente_id=app.paciente_id),
+            repeticoes
+        ),
+        "ordem_estoque_pagina_ms": medir(lambda: pagina("estoque"), repeticoes),
+    }
+
+
+def medir_paciente(app, repeticoes):
+    servico = app.servico
+    paciente_id = servico.cadastrar_paciente("Bench")
+    servico.gravar_remedios(
+        [(f"Remedio Bench {i}", 2, 10 + i, "comprimido", 7) for i in range(REMEDIOS_SEGUNDO_PACIENTE)], paciente_id
+    )
+    return {
+        "paciente_lista_ms": medir(lambda: servico.listar(0, gr.TAMANHO_PAGINA, paciente_id=paciente_id), repeticoes),
+        "paciente_ordem_fim_ms": medir(
+            lambda: servico.listar(0, gr.TAMANHO_PAGINA, ordem="fim", paciente_id=paciente_id), repeticoes
+        ),
+        "paciente_busca_ms": medir(lambda: servico.listar(0, gr.TAMANHO_PAGINA, "rem", paciente_id=paciente_id), repeticoes),
+        "paciente_alertas_ms": medir(lambda: servico.verificar_alertas(paciente_id), repeticoes),
+    }
+
+
+def medir_debito(app, repeticoes):
+    resultados = {}
+    hoje = [date.today()]
+
+    def virar_dia():
+        hoje[0] += timedelta(days=1)
+        app._atualizar_estoque_automatico(dias_passados=1, hoje=hoje[0])
+
+    app._migrar_modo_estoque(core.MODO_DEBITO)
+    resultados["debito_dia_debito_ms"] = medir(virar_dia, repeticoes)
+    app._migrar_modo_estoque(core.MODO_ANCORA)
+    resultados["debito_dia_ancora_ms"] = medir(virar_dia, repeticoes)
+    return resultados
+
+
+def medir_alertas(app, repeticoes):
+    app.notificador = Despachante(BackendMemoria(), intervalo_minimo_s=0)
+    try:
+        # A primeira verificação incremental avalia todos os remédios no limite;
+        # as seguintes só os alterados e os que cruzaram um nível
+        primeira = medir(app._verificar_estoque_notificacao, 1)
+        mudar_um = lambda: app.servico.adicionar_estoque(app._contar_remedios() // 2 or 1, 1)
+        incremental = medir(app._verificar_estoque_notificacao, repeticoes, mudar_um)
+        completa = medir(lambda: app._verificar_estoque_notificacao(todos=True), repeticoes)
+    finally:
+        app.notificador = None
+    return {
+        "alertas_primeira_ms": primeira,
+        "alertas_incremental_ms": incremental,
+        "alertas_completa_ms": completa,
+        "alertas_quantidade": len(app.servico.verificar_alertas()),
+    }
+
+
+def medir_historico(app, repeticoes):
+    alvo = app._contar_remedios() // 2 or 1
+    fim = datetime.now()
+    inicio = fim - timedelta(days=180)
+    return {
+        "historico_intervalo_ms": medir(lambda: app.servico.historico(alvo, inicio, fim), repeticoes),
+        "historico_totais_mes_ms": medir(lambda: app.servico.totais_por_periodo(alvo, "mes"), repeticoes),
+        "historico_consumo_ms": medir(lambda: app.servico.consumo(alvo), repeticoes),
+    }
+
+
+def medir_cadastro(app, repeticoes):
+    rodada = [0]
+
+    def nomes():
+        rodada[0] += 1
+        return [f"Bench {rodada[0]}-{i}" for i in range(CADASTROS_POR_MEDICAO)]
+
+    def um_por_transacao():
+        for nome in nomes():
+            app.servico.cadastrar(nome, 2, 60)
+
+    def em_lote():
+        escritor = EscritorBanco(app.db, lambda funcao, *args: funcao(*args))
+        escritor.iniciar()
+        for nome in nomes():
+            escritor.enviar(lambda conn, nome=nome: app.servico.cadastrar(nome, 2, 60))
+        escritor.parar(timeout=None)
+
+    return {
+        "cadastrar_transacao_ms": medir(um_por_transacao, repeticoes) / CADASTROS_POR_MEDICAO,
+        "cadastrar_lote_ms": medir(em_lote, repeticoes) / CADASTROS_POR_MEDICAO,
+    }
+
+
+def medir_tamanho(tamanho, pasta_dados, pasta_execucao, tree, repeticoes):
+    caminho = preparar_banco(tamanho, pasta_dados, pasta_execucao)
+    limpar_arvore(tree)
+    app = criar_app(caminho, tree)
+    app.modo_virtual = app._contar_remedios() > gr.LIMITE_LISTA_VIRTUAL
+
+    resultados = {"modo_virtual": app.modo_virtual}
+    etapas = (medir_inicio, medir_lista, medir_busca, medir_ordenacao, medir_alertas, medir_paciente,
+              medir_debito, medir_historico, medir_cadastro)
+    for etapa in etapas:
+        resultados.update(etapa(app, repeticoes))
+
+    app.db.fechar_todas()
+    os.remove(caminho)
+    return resultados
+
+
+def comparar(base, atual):
+    """Mostra a variação de cada medida entre dois resultados (positivo = mais lento)."""
+    print(f"\nComparação com {base['meta'].get('commit')} ({base['meta'].get('data')}):")
+    print(f"{'tamanho':>8} | {'medida':<24} | {'base':>10} | {'atual':>10} | {'variação':>9}")
+    for tamanho, medidas in atual["resultados"].items():
+        medidas_base = base["resultados"].get(tamanho, {})
+        for nome, valor in medidas.items():
+            anterior = medidas_base.get(nome)
+            if not nome.endswith("_ms") or not anterior:
+                continue
+            variacao = (valor - anterior) / anterior * 100
+            print(f"{tamanho:>8} | {nome:<24} | {anterior:>10.3f} | {valor:>10.3f} | {variacao:>+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks dos caminhos quentes do estoque.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=list(TAMANHOS_PADRAO))
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES)
+    parser.add_argument("--dados", help="Pasta onde guardar/reaproveitar os bancos gerados")
+    parser.add_argument("--saida", help="Arquivo JSON de resultados (padrão: benchmarks/resultados/<commit>.json)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    root, tree = criar_arvore()
+    meta = {
+        "commit": commit_atual(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "numpy": previsao.NUMPY_AVAILABLE,
+        "plataforma": platform.platform(),
+        "treeview": "ttk" if root else "substituta",
+        "repeticoes": args.repeticoes,
+    }
+    print(f"Commit {meta['commit']}, Treeview {meta['treeview']}, NumPy {'sim' if meta['numpy'] else 'não'}")
+
+    resultados = {}
+    with tempfile.TemporaryDirectory() as pasta_execucao:
+        pasta_dados = args.dados or os.path.join(pasta_execucao, "dados")
+        os.makedirs(pasta_dados, exist_ok=True)
+        for tamanho in args.tamanhos:
+            print(f"{tamanho} remédios...")
+            resultados[str(tamanho)] = medidas = medir_tamanho(tamanho, pasta_dados, pasta_execucao, tree, args.repeticoes)
+            for nome, valor in medidas.items():
+                print(f"  {nome:<24} {valor:.3f}" if isinstance(valor, float) else f"  {nome:<24} {valor}")
+
+    if root:
+        root.destroy()
+
+    atual = {"meta": meta, "resultados": resultados}
+    saida = args.saida or os.path.join(PASTA_RESULTADOS, f"{meta['commit'] or 'sem-commit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump(atual, arquivo, indent=2, ensure_ascii=False)
+    print(f"\nResultados gravados em {saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            comparar(json.load(arquivo), atual)
+
+
+if __name__ == "__main__":
+    main()
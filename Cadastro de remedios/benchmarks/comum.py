@@ -0,0 +1,46 @@
+"""
+Peças compartilhadas pelos benchmarks: a Treeview (real ou a substituta),
+a limpeza da lista e a medição de tempo. O App sem janela vem de substitutos.py.
+"""
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gerenciador_remedios as gr
+from substitutos import ArvoreSubstituta
+
+REPETICOES = 5
+
+# As mensagens do programa (avisos de operação lenta, etc.) não se misturam aos resultados
+logging.getLogger().addHandler(logging.NullHandler())
+
+
+def criar_arvore():
+    """Tenta criar uma Treeview real (janela oculta); se não der, usa a substituta."""
+    try:
+        root = gr.tk.Tk()
+        root.withdraw()
+        return root, gr.ttk.Treeview(root, columns=("remedio", "dose", "estoque", "dias_restantes", "data_fim"), show="headings")
+    except gr.tk.TclError:
+        return None, ArvoreSubstituta()
+
+
+def limpar_arvore(tree):
+    filhos = tree.get_children()
+    if filhos:
+        tree.delete(*filhos)
+
+
+def medir(funcao, repeticoes=REPETICOES, preparar=None):
+    """Melhor tempo (ms) de 'funcao' em 'repeticoes' execuções; 'preparar' roda antes de cada uma, fora da medição."""
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor * 1000
@@ -0,0 +1,90 @@
+"""
+Gera bancos remedios.db sintéticos para os benchmarks.
+
+Todos os remédios são do paciente padrão. Cada um recebe doses, estoque, unidade e limite de alerta aleatórios
+(com semente fixa, então o mesmo tamanho sempre gera o mesmo banco) e
+algumas entradas de histórico espalhadas pelo último ano.
+
+Uso: python benchmarks/gerar_banco.py tamanho arquivo.db [historico_por_remedio]
+"""
+import logging
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco import GerenciadorConexoes
+from remedios_core import FORMATO_DATA, PACIENTE_PADRAO, ServicoEstoque
+
+logging.getLogger().addHandler(logging.NullHandler())
+
+HISTORICO_POR_REMEDIO = 3
+TAMANHO_BLOCO = 50_000 # Linhas por executemany, para não montar tudo na memória
+
+
+def _remedios(inicio, fim, gerador, hoje_str):
+    for i in range(inicio, fim):
+        yield (
+            f"Remedio {i:07d}",
+            gerador.randint(1, 4),
+            gerador.randint(0, 400),
+            "comprimido" if gerador.random() < 0.7 else "ml",
+            gerador.randint(0, 10),
+            hoje_str,
+        )
+
+
+def _historico(inicio, fim, gerador, historico_por_remedio, agora):
+    for remedio_id in range(inicio + 1, fim + 1):
+        for _ in range(historico_por_remedio):
+            data = agora - timedelta(days=gerador.randint(0, 364), seconds=gerador.randint(0, 86399))
+            yield (remedio_id, PACIENTE_PADRAO, gerador.randint(10, 120), data.strftime(FORMATO_DATA))
+
+
+def gerar(caminho, tamanho, historico_por_remedio=HISTORICO_POR_REMEDIO, semente=None):
+    """Cria em 'caminho' um banco com 'tamanho' remédios (o arquivo não pode existir)."""
+    if os.path.exists(caminho):
+        raise FileExistsError(caminho)
+
+    gerador = random.Random(tamanho if semente is None else semente)
+    db = GerenciadorConexoes(caminho)
+    servico = ServicoEstoque(db)
+    servico.inicializar()
+    servico.debitar_dias() # Primeira execução: grava last_run_date
+
+    hoje_str = date.today().strftime('%Y-%m-%d')
+    agora = datetime.now()
+    conn = db.conexao()
+    for inicio in range(0, tamanho, TAMANHO_BLOCO):
+        fim = min(inicio + TAMANHO_BLOCO, tamanho)
+        with conn:
+            conn.executemany(
+                "INSERT INTO remedios (nome, doses_por_dia, estoque_atual, unidade, limite_dias, data_ancora) VALUES (?, ?, ?, ?, ?, ?)",
+                _remedios(inicio, fim, gerador, hoje_str)
+            )
+            conn.executemany(
+                "INSERT INTO historico_estoque (remedio_id, paciente_id, quantidade_adicionada, data_adicao) VALUES (?, ?, ?, ?)",
+                _historico(inicio, fim, gerador, historico_por_remedio, agora)
+            )
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.fechar_todas()
+
+
+def main(argv):
+    if len(argv) < 2:
+        print(__doc__)
+        return 1
+    tamanho, caminho = int(argv[0]), argv[1]
+    historico = int(argv[2]) if len(argv) > 2 else HISTORICO_POR_REMEDIO
+
+    inicio = time.perf_counter()
+    gerar(caminho, tamanho, historico)
+    print(f"{tamanho} remédios gerados em {caminho} ({time.perf_counter() - inicio:.1f} s).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,128 @@
+"""
+Log e métricas de desempenho do programa.
+
+Os módulos registram as mensagens com logging.getLogger(__name__); quem
+roda o programa chama configurar_logging() uma vez, que grava em um
+arquivo rotativo (e também no console, quando há um: com pythonw.exe
+não há). As métricas contam chamadas e tempos por nome (cada comando
+SQL, atualização da lista, débito, verificação de alertas) e registram
+no log toda operação acima do limiar de lentidão.
+"""
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+ARQUIVO_LOG = os.path.join(os.path.expanduser("~"), "remedios.log") # Log rotativo, ao lado do banco (DB_PATH)
+LIMIAR_LENTO_MS = 100 # Operações mais demoradas que isso vão para o log como aviso
+TAMANHO_MAX_LOG = 1_000_000 # Bytes por arquivo de log antes de rotacionar
+ARQUIVOS_LOG_ANTIGOS = 3
+FORMATO_LOG = "%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+
+logger = logging.getLogger(__name__)
+
+
+def configurar_logging(caminho_log=None, nivel=logging.INFO):
+    """Manda o log do programa para 'caminho_log' (rotativo) e para o console, se houver um."""
+    raiz = logging.getLogger()
+    raiz.setLevel(nivel)
+    formato = logging.Formatter(FORMATO_LOG)
+
+    if caminho_log:
+        try:
+            arquivo = logging.handlers.RotatingFileHandler(
+                caminho_log, maxBytes=TAMANHO_MAX_LOG, backupCount=ARQUIVOS_LOG_ANTIGOS, encoding="utf-8"
+            )
+        except OSError as e:
+            print(f"Não foi possível abrir o arquivo de log {caminho_log}: {e}")
+        else:
+            arquivo.setFormatter(formato)
+            raiz.addHandler(arquivo)
+
+    if sys.stderr is not None: # pythonw.exe não tem console
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+        raiz.addHandler(console)
+
+
+class Metricas:
+    """Contadores e tempos (chamadas, total e máximo em ms) por nome, seguros entre threads."""
+
+    def __init__(self, limiar_lento_ms=LIMIAR_LENTO_MS):
+        self.limiar_lento_ms = limiar_lento_ms
+        self._tempos = {} # nome -> [chamadas, total_ms, max_ms, lentas]
+        self._contadores = {}
+        self._trava = threading.Lock()
+
+    def registrar(self, nome, ms):
+        """Soma uma execução de 'nome' que levou 'ms' milissegundos."""
+        lenta = ms >= self.limiar_lento_ms
+        with self._trava:
+            tempo = self._tempos.get(nome)
+            if tempo is None:
+                tempo = self._tempos[nome] = [0, 0.0, 0.0, 0]
+            tempo[0] += 1
+            tempo[1] += ms
+            if ms > tempo[2]:
+                tempo[2] = ms
+            if lenta:
+                tempo[3] += 1
+        if lenta:
+            logger.warning("Operação lenta: %s levou %.1f ms", nome, ms)
+
+    def contar(self, nome, quantidade=1):
+        with self._trava:
+            self._contadores[nome] = self._contadores.get(nome, 0) + quantidade
+
+    @contextmanager
+    def medir(self, nome):
+        """Mede o bloco 'with' como uma execução de 'nome'."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nome, (time.perf_counter() - inicio) * 1000)
+
+    def cronometrar(self, nome):
+        """Decorador: mede cada chamada da função como uma execução de 'nome'."""
+        def decorador(funcao):
+            @wraps(funcao)
+            def medida(*args, **kwargs):
+                inicio = time.perf_counter()
+                try:
+                    return funcao(*args, **kwargs)
+                finally:
+                    self.registrar(nome, (time.perf_counter() - inicio) * 1000)
+            return medida
+        return decorador
+
+    def instantaneo(self):
+        """Cópia dos tempos ({nome: (chamadas, total_ms, max_ms, lentas)}) e dos contadores."""
+        with self._trava:
+            return {nome: tuple(tempo) for nome, tempo in self._tempos.items()}, dict(self._contadores)
+
+    def resumo(self, max_linhas=None):
+        """Texto com os tempos (os de maior total primeiro) e os contadores."""
+        tempos, contadores = self.instantaneo()
+        ordenados = sorted(tempos.items(), key=lambda item: item[1][1], reverse=True)
+        linhas = [f"{'operação':<48} {'chamadas':>9} {'total ms':>10} {'média ms':>9} {'máx ms':>9} {'lentas':>6}"]
+        for nome, (chamadas, total, maximo, lentas) in ordenados[:max_linhas]:
+            linhas.append(f"{nome[:48]:<48} {chamadas:>9} {total:>10.1f} {total / chamadas:>9.3f} {maximo:>9.1f} {lentas:>6}")
+        if max_linhas is not None and len(ordenados) > max_linhas:
+            linhas.append(f"... e mais {len(ordenados) - max_linhas} operações.")
+        for nome, valor in sorted(contadores.items()):
+            linhas.append(f"{nome}: {valor}")
+        return "\n".join(linhas)
+
+    def zerar(self):
+        with self._trava:
+            self._tempos.clear()
+            self._contadores.clear()
+
+
+# Métricas do processo, usadas por todos os módulos
+metricas = Metricas()
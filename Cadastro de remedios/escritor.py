@@ -0,0 +1,146 @@
+"""
+Escrita no banco em segundo plano.
+
+Uma única thread recebe comandos de escrita por uma fila, agrupa os que
+estiverem esperando em uma só transação e devolve o resultado de cada um
+pela função 'agendar' (na interface, 'root.after'), para que a thread do
+Tk nunca espere por um commit.
+"""
+import logging
+import queue
+import sqlite3
+import threading
+
+from diagnostico import metricas
+
+TAMANHO_LOTE = 100 # Máximo de comandos gravados na mesma transação
+
+logger = logging.getLogger(__name__)
+
+_PARAR = object()
+
+
+_PENDENTE, _INICIADO, _CANCELADO = range(3)
+
+
+class _Comando:
+    __slots__ = ("funcao", "ao_sucesso", "ao_erro", "_estado", "_trava")
+
+    def __init__(self, funcao, ao_sucesso, ao_erro):
+        self.funcao = funcao
+        self.ao_sucesso = ao_sucesso
+        self.ao_erro = ao_erro
+        self._estado = _PENDENTE
+        self._trava = threading.Lock()
+
+    def cancelar(self):
+        """
+        Tira o comando da fila se a thread de escrita ainda não o começou.
+        Retorna False quando já é tarde: o comando vai ser (ou já foi) gravado.
+        """
+        with self._trava:
+            if self._estado == _PENDENTE:
+                self._estado = _CANCELADO
+            return self._estado == _CANCELADO
+
+    def _iniciar(self):
+        with self._trava:
+            if self._estado == _CANCELADO:
+                return False
+            self._estado = _INICIADO
+            return True
+
+
+class EscritorBanco:
+    """Thread única de escrita, alimentada por uma fila de comandos."""
+
+    def __init__(self, gerenciador, agendar, tamanho_lote=TAMANHO_LOTE):
+        """
+        'gerenciador' é o GerenciadorConexoes do banco e 'agendar(funcao, *args)'
+        é quem leva os resultados de volta para a thread certa.
+        """
+        self.gerenciador = gerenciador
+        self.agendar = agendar
+        self.tamanho_lote = tamanho_lote
+        self._fila = queue.Queue()
+        self._thread = None
+
+    def iniciar(self):
+        """Inicia a thread de escrita."""
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def enviar(self, funcao, ao_sucesso=None, ao_erro=None):
+        """
+        Enfileira 'funcao(conn)' para rodar na thread de escrita.
+        'ao_sucesso(resultado)' ou 'ao_erro(excecao)' são chamadas depois do commit.
+        Retorna o comando, que pode ser cancelado enquanto espera na fila.
+        """
+        comando = _Comando(funcao, ao_sucesso, ao_erro)
+        self._fila.put(comando)
+        return comando
+
+    def parar(self, timeout=5):
+        """Grava o que ainda estiver na fila e encerra a thread."""
+        if self._thread is None:
+            return
+        self._fila.put(_PARAR)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _loop(self):
+        parar = False
+        while not parar:
+            lote = [self._fila.get()]
+            while len(lote) < self.tamanho_lote:
+                try:
+                    lote.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+
+            if _PARAR in lote:
+                parar = True
+                lote = [comando for comando in lote if comando is not _PARAR]
+            if lote:
+                self._gravar_lote(lote)
+
+        self.gerenciador.fechar_conexao_da_thread()
+
+    @metricas.cronometrar("escritor.lote")
+    def _gravar_lote(self, lote):
+        """Grava o lote em uma transação; cada comando tem o seu SAVEPOINT."""
+        metricas.contar("escritor.comandos", len(lote))
+        conn = self.gerenciador.conexao()
+        resultados = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for comando in lote:
+                if not comando._iniciar():
+                    continue # Cancelado por quem enviou: não grava nem responde
+                conn.execute("SAVEPOINT comando")
+                try:
+                    resultado = comando.funcao(conn)
+                except Exception as e:
+                    # Só este comando é desfeito; os outros do lote continuam
+                    conn.execute("ROLLBACK TO comando")
+                    conn.execute("RELEASE comando")
+                    resultados.append((comando, None, e))
+                else:
+                    conn.execute("RELEASE comando")
+                    resultados.append((comando, resultado, None))
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error("Erro ao gravar lote no banco: %s", e)
+            if conn.in_transaction:
+                conn.rollback()
+            resultados = [(comando, None, e) for comando in lote]
+
+        for comando, resultado, erro in resultados:
+            if erro is None:
+                if comando.ao_sucesso:
+                    self.agendar(comando.ao_sucesso, resultado)
+            else:
+                if comando.ao_erro:
+                    self.agendar(comando.ao_erro, erro)
+                else:
+                    logger.error("Erro em comando de escrita: %s", erro)
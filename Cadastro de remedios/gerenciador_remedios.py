@@ -1,36 +1,128 @@
+import time
+INICIO_PROCESSO = time.perf_counter() # Para o --profile-startup contar também as importações
+import sys
+
+if __name__ == "__main__" and ("--check" in sys.argv or "--debit-only" in sys.argv):
+    # Execução agendada sem janela (verificacao.py): nem o Tk é importado
+    import verificacao
+    sys.exit(verificacao.main())
+
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
+import bisect
+import importlib.util
+import logging
 import sqlite3
 import os
-import sys
-from datetime import datetime, timedelta, date
 import threading
-import time
+from datetime import date
+
+import previsao
+from agendador import Agendador, proxima_meia_noite
+from banco import GerenciadorConexoes
+from diagnostico import ARQUIVO_LOG, configurar_logging, metricas
+from escritor import EscritorBanco
+from instancia import CONFERIR, MOSTRAR, InstanciaUnica
+from lembretes import MotorLembretes
+from registros import CacheRegistros
+from notificacoes import (
+    BackendToast, Despachante, INTERVALO_MINIMO_S, MAX_ITENS_RESUMO, criar_backend,
+)
+from remedios_core import (
+    DB_PATH, LIMITE_DIAS_PADRAO, PACIENTE_PADRAO, PERIODOS, ServicoEstoque, ErroRemedios, ValorInvalido,
+    NomeInvalido, PacienteDuplicado, PacienteNaoEncontrado, RemedioDuplicado, validar_valores, validar_nome,
+    formatar_horarios, formatar_minuto, interpretar_horarios, unidade_plural,
+)
+
+# --- Verifica as bibliotecas externas ---
+# Só confere se estão instaladas, sem importá-las: o win10toast é importado na
+# primeira notificação e o pystray/Pillow pela thread da bandeja, para não
+# atrasar o início (que roda a cada login pelo iniciar_minimizado.bat).
+NOTIFIER_AVAILABLE = importlib.util.find_spec("win10toast") is not None
+TRAY_AVAILABLE = importlib.util.find_spec("pystray") is not None and importlib.util.find_spec("PIL") is not None
+# --- Fim das Verificações ---
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração da Lista Virtual ---
+LIMITE_LISTA_VIRTUAL = 2000 # Acima disso a lista carrega só uma janela de linhas
+TAMANHO_PAGINA = 200 # Linhas buscadas por vez no modo virtual
+JANELA_MAX_LINHAS = 3 * TAMANHO_PAGINA # Máximo de linhas mantidas na Treeview
+MARGEM_ROLAGEM = 0.05 # Fração perto das bordas que dispara a carga de mais linhas
+ATRASO_BUSCA_MS = 250 # Espera depois da última tecla antes de filtrar a lista
+
+# Ordenação feita pelo banco ao clicar no cabeçalho: coluna -> chave de ORDENACOES.
+# Cada clique alterna crescente, decrescente e a ordem de cadastro.
+ORDENACAO_COLUNAS = {
+    "remedio": "nome",
+    "dose": "doses",
+    "estoque": "estoque",
+    "dias_restantes": "fim",
+    "data_fim": "fim",
+}
+SETAS_ORDENACAO = {False: " ▲", True: " ▼"}
+
+# --- Configuração das Notificações ---
+ATRASO_INICIAL_ALERTAS_S = 10 # Primeira verificação depois de abrir o programa
+ATRASO_MUDANCA_ESTOQUE_S = 2 # Espera depois de uma escrita (junta cliques seguidos)
+
+# --- Configuração do Diagnóstico ---
+LINHAS_DIAGNOSTICO = 12 # Operações mostradas na janela de diagnóstico (o log recebe todas)
+
+# --- Configuração do Histórico ---
+HISTORICO_MAX_LINHAS = 500 # Reposições mais recentes exibidas na janela de histórico
+
+class PerfilInicio:
+    """Tempo de cada etapa do início do programa, mostrado com --profile-startup."""
+
+    def __init__(self, inicio, ativo):
+        self.ativo = ativo
+        self._inicio = self._ultima = inicio
+        self.etapas = []
+
+    def marcar(self, etapa):
+        """Registra a etapa que terminou agora."""
+        if not self.ativo:
+            return
+        agora = time.perf_counter()
+        self.etapas.append((etapa, (agora - self._ultima) * 1000))
+        self._ultima = agora
+
+    def relatorio(self):
+        """Escreve o tempo das etapas na saída padrão (o nível do log não o esconde) e no log."""
+        if not self.ativo:
+            return
+        linhas = [f"  {etapa:<24} {ms:8.1f} ms" for etapa, ms in self.etapas]
+        linhas.append(f"  {'total':<24} {(self._ultima - self._inicio) * 1000:8.1f} ms")
+        texto = "Tempo de início:\n" + "\n".join(linhas)
+        if sys.stdout is not None: # pythonw.exe não tem console
+            print(texto, flush=True)
+        logger.info(texto)
+
+
+perfil = PerfilInicio(INICIO_PROCESSO, "--profile-startup" in sys.argv)
+
+
+def avisar_bibliotecas_ausentes():
+    if not NOTIFIER_AVAILABLE:
+        logger.warning("Biblioteca 'win10toast' não encontrada. O programa funcionará, mas sem notificações. "
+                       "Para instalar, use: pip install win10toast")
+    if not TRAY_AVAILABLE:
+        logger.warning("Bibliotecas 'pystray' ou 'Pillow' não encontradas. O programa funcionará em modo de "
+                       "janela normal. Para instalar, use: pip install pystray pillow")
+
+
+def configurar_diagnostico():
+    """Liga o log em ARQUIVO_LOG e lê '--limiar-lento-ms=' (operações mais lentas vão para o log)."""
+    configurar_logging(ARQUIVO_LOG)
+    for arg in sys.argv:
+        if arg.startswith("--limiar-lento-ms="):
+            try:
+                metricas.limiar_lento_ms = float(arg.split("=", 1)[1])
+            except ValueError:
+                logger.warning("Argumento inválido ignorado: %s", arg)
+    avisar_bibliotecas_ausentes()
 
-# --- Tenta importar bibliotecas externas ---
-try:
-    from win10toast import ToastNotifier
-    NOTIFIER_AVAILABLE = True
-except ImportError:
-    print("Biblioteca 'win10toast' não encontrada.")
-    print("O programa funcionará, mas sem notificações.")
-    print("Para instalar, use: pip install win10toast")
-    NOTIFIER_AVAILABLE = False
-    ToastNotifier = None
-
-try:
-    from pystray import Icon as TrayIcon, Menu, MenuItem
-    from PIL import Image, ImageTk # Importa ImageTk para carregar o ícone
-    TRAY_AVAILABLE = True
-except ImportError:
-    print("Bibliotecas 'pystray' ou 'Pillow' não encontradas.")
-    print("O programa funcionará em modo de janela normal.")
-    print("Para instalar, use: pip install pystray pillow")
-    TRAY_AVAILABLE = False
-# --- Fim das Importações ---
-
-# --- Configuração de Caminhos ---
-DB_PATH = os.path.join(os.path.expanduser("~"), "remedios.db")
 
 def resource_path(relative_path):
     """
@@ -50,31 +142,19 @@ def resource_path(relative_path):
 
 def is_val_too_big(valores: tuple):
     """Essa função verifica se o valor é convertível para C INT"""
-    MAX_VALUE = 10_000_000  # limite para evitar overflow
-
-    print(valores)
-    
-    for val in valores:
-        if val > MAX_VALUE:
-            messagebox.showerror(
-            "Valor inválido",
-            f"Os valores são muito altos. Máximo permitido: {MAX_VALUE}"
-            )
-            
-            return True
-
+    try:
+        validar_valores(valores)
+    except ValorInvalido as e:
+        messagebox.showerror("Valor inválido", str(e))
+        return True
     return False
 
 def is_str_too_big(word):
-    MAX_VALUE = 30
-    if len(word) > MAX_VALUE:
-        messagebox.showerror(
-        "Nome inválido",
-        f"A palavra utilizada é muito grande. O Máximo permitido são {MAX_VALUE} caracteres."
-        )
-        
+    try:
+        validar_nome(word)
+    except NomeInvalido as e:
+        messagebox.showerror("Nome inválido", str(e))
         return True
-        
     return False
 
 class App:
@@ -83,30 +163,40 @@ class App:
     def __init__(self, root):
         self.root = root
         self.db_name = DB_PATH
-        self.db_conn = None
-        self.db_cursor = None
-        self.toaster = None
-        
-        global NOTIFIER_AVAILABLE
+        self.db = None
+        self.notificador = None
+        self.lembretes = None # MotorLembretes dos horários das doses (só com notificações)
+        self._proximo_prazo = None # Próximo dia em que algum remédio entra no limite de alerta
+        self._linhas_exibidas = {} # id -> valores exibidos na lista
+        self.registros = CacheRegistros() # id -> Registro de cada linha da lista, com os valores já convertidos
+        self.modo_virtual = False
+        self._inicio_janela = 0 # Id da primeira linha da janela virtual (0 = começo da lista)
+        self._tem_mais_antes = False
+        self._tem_mais_depois = False
+        self._carga_agendada = False
+        self._busca = None # Texto que filtra a lista (None = todos)
+        self._busca_agendada = None # 'after' da busca que ainda espera a digitação parar
+        self._ordem = None # Chave de ORDENACOES da lista ("-" = decrescente; None = ordem de id)
+        self._coluna_ordem = None # Coluna cujo cabeçalho foi clicado
+        self.paciente_id = PACIENTE_PADRAO # Paciente cujos remédios a lista mostra
+        self._icone_janela = None # A imagem do ícone precisa continuar referenciada
         
         self.root.title("Gerenciador de Remédios")
-        self.root.geometry("800x600")
-
-        if NOTIFIER_AVAILABLE:
-            try:
-                self.toaster = ToastNotifier()
-                print("Notificador (win10toast) inicializado com sucesso.")
-            except Exception as e:
-                print(f"Erro ao inicializar o ToastNotifier: {e}")
-                print("Desativando notificações.")
-                NOTIFIER_AVAILABLE = False
+        self.root.geometry("960x600")
 
         self._init_db()
+        self.escritor = EscritorBanco(self.db, lambda funcao, *args: self.root.after(0, funcao, *args))
+        self.escritor.iniciar()
+        perfil.marcar("fila de escrita")
+        self.modo_virtual = "--lista-virtual" in sys.argv or self._contar_remedios(self.paciente_id) > LIMITE_LISTA_VIRTUAL
         self._setup_ui()
+        perfil.marcar("interface")
         self.atualizar_lista_remedios()
+        perfil.marcar("lista")
 
-        self.iniciar_verificador_notificacoes()
-        self.iniciar_loop_verificacao_diaria()
+        self.iniciar_agendador()
+        perfil.marcar("agendador")
+        self.servidor_api = self._iniciar_api()
 
         self.tray_icon = None
         if TRAY_AVAILABLE:
@@ -116,148 +206,166 @@ class App:
             self.root.protocol("WM_DELETE_WINDOW", self.sair_app)
             
         if "--minimized" in sys.argv and TRAY_AVAILABLE:
-            print("Iniciando minimizado...")
+            logger.info("Iniciando minimizado.")
             self.esconder_janela()
         else:
             self.root.deiconify()
 
-    def _check_and_add_column(self, table_name, column_name, column_definition):
-        """Verifica se uma coluna existe e, se não, a adiciona."""
-        try:
-            self.db_cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = [info[1] for info in self.db_cursor.fetchall()]
-            if column_name not in columns:
-                print(f"Adicionando coluna '{column_name}' à tabela '{table_name}'...")
-                self.db_cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_definition}")
-                self.db_conn.commit()
-                print(f"Coluna '{column_name}' adicionada com sucesso.")
-        except sqlite3.Error as e:
-            print(f"Erro ao tentar adicionar coluna '{column_name}': {e}")
-
     def _init_db(self):
         """Inicializa a conexão com o banco de dados e cria/atualiza as tabelas."""
         try:
-            print(f"Usando banco de dados em: {self.db_name}")
-            self.db_conn = sqlite3.connect(self.db_name)
-            self.db_cursor = self.db_conn.cursor()
-            
-            self.db_cursor.execute("PRAGMA foreign_keys = ON;")
-
-            # Tabela de Remédios
-            self.db_cursor.execute("""
-            CREATE TABLE IF NOT EXISTS remedios (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome TEXT NOT NULL UNIQUE,
-                doses_por_dia INTEGER NOT NULL,
-                estoque_atual INTEGER NOT NULL DEFAULT 0
-            )
-            """)
-
-            # Tabela de Histórico de Estoque
-            self.db_cursor.execute("""
-            CREATE TABLE IF NOT EXISTS historico_estoque (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                remedio_id INTEGER NOT NULL,
-                quantidade_adicionada INTEGER NOT NULL,
-                data_adicao DATE NOT NULL,
-                FOREIGN KEY (remedio_id) REFERENCES remedios (id) ON DELETE CASCADE
-            )
-            """)
-            
-            # Tabela para rastrear a última execução
-            self.db_cursor.execute("""
-            CREATE TABLE IF NOT EXISTS app_info (
-                id INTEGER PRIMARY KEY,
-                last_run_date TEXT NOT NULL
-            )
-            """)
-            
-            # --- NOVO: Adiciona a coluna 'unidade' se ela não existir ---
-            self._check_and_add_column('remedios', 'unidade', 'TEXT NOT NULL DEFAULT "comprimido"')
-            
-            self.db_conn.commit()
-            
+            logger.info("Usando banco de dados em: %s", self.db_name)
+            self.db = GerenciadorConexoes(self.db_name)
+            self.servico = ServicoEstoque(self.db)
+            self.servico.inicializar()
+            perfil.marcar("banco: esquema")
             self._atualizar_estoque_automatico()
+            perfil.marcar("banco: débito")
+
+            for arg in sys.argv:
+                if arg.startswith("--modo-estoque="):
+                    self._migrar_modo_estoque(arg.split("=", 1)[1])
 
         except sqlite3.Error as e:
             messagebox.showerror("Erro de Banco de Dados", f"Erro ao conectar ao SQLite: {e}")
             self.root.quit()
 
-    def _atualizar_estoque_automatico(self, dias_passados=None):
-        """Debita o estoque dos remédios com base nos dias que se passaram."""
+    def _migrar_modo_estoque(self, novo_modo):
+        """Troca o modo de armazenamento do estoque sem mudar o estoque de nenhum remédio."""
         try:
-            hoje = date.today()
-            hoje_str = hoje.strftime('%Y-%m-%d')
-            dias_a_debitar = 0
-            
-            if dias_passados is None:
-                self.db_cursor.execute("SELECT last_run_date FROM app_info WHERE id = 1")
-                resultado = self.db_cursor.fetchone()
-                
-                if resultado:
-                    last_run_date_str = resultado[0]
-                    last_run_date = datetime.strptime(last_run_date_str, '%Y-%m-%d').date()
-                    dias_a_debitar = (hoje - last_run_date).days
-                else:
-                    print("Primeira execução. Configurando data de verificação de estoque.")
-                    self.db_cursor.execute("INSERT INTO app_info (id, last_run_date) VALUES (1, ?)", (hoje_str,))
-                    self.db_conn.commit()
-                    return False
-            else:
-                dias_a_debitar = dias_passados
-
-            
-            if dias_a_debitar > 0:
-                print(f"Detectado {dias_a_debitar} dia(s) para debitar. Atualizando estoque...")
-                
-                self.db_cursor.execute("""
-                    UPDATE remedios
-                    SET estoque_atual = MAX(0, estoque_atual - (doses_por_dia * ?))
-                    WHERE doses_por_dia > 0
-                """, (dias_a_debitar,))
-                
-                self.db_cursor.execute("UPDATE app_info SET last_run_date = ? WHERE id = 1", (hoje_str,))
-                self.db_conn.commit()
-                print(f"Estoque debitado por {dias_a_debitar} dia(s).")
-                
-                return True 
-            else:
-                print("Verificação automática de estoque: Nenhum dia se passou.")
-                return False
+            if self.servico.migrar_modo_estoque(novo_modo):
+                logger.info("Modo de armazenamento do estoque alterado para '%s'.", novo_modo)
+        except ErroRemedios as e:
+            logger.warning("%s", e)
+        except sqlite3.Error as e:
+            logger.error("Erro ao migrar o modo de estoque: %s", e)
 
+    def _atualizar_estoque_automatico(self, dias_passados=None, hoje=None):
+        """Debita o estoque dos remédios com base nos dias que se passaram."""
+        try:
+            return self.servico.debitar_dias(dias_passados, hoje)
         except sqlite3.Error as e:
-            print(f"Erro ao atualizar estoque automático: {e}")
+            logger.error("Erro ao atualizar estoque automático: %s", e)
             messagebox.showwarning("Erro de Atualização", f"Não foi possível atualizar o estoque automático: {e}")
             return False
 
-    def _verificar_mudanca_dia(self):
-        """Chamado pelo loop 'root.after' para verificar se a data mudou."""
+    def _criar_backend_notificacao(self):
+        """
+        Escolhe onde as notificações aparecem: '--notificacoes=arquivo[:caminho]'
+        ou '--notificacoes=console' ou, por padrão, no toast do Windows.
+        """
+        for arg in sys.argv:
+            if arg.startswith("--notificacoes="):
+                try:
+                    backend = criar_backend(arg.split("=", 1)[1], resource_path("cardiogram.ico"))
+                except ValueError as e:
+                    logger.warning("%s", e)
+                    continue
+                logger.info("Notificações em: %s", arg.split("=", 1)[1])
+                return backend
+
+        if NOTIFIER_AVAILABLE:
+            logger.info("Notificador (win10toast) configurado; será carregado na primeira notificação.")
+            return BackendToast(icon_path=resource_path("cardiogram.ico"))
+        return None
+
+    def _criar_notificador(self):
+        """Monta o despachante de notificações ('--max-itens-notificacao=' e '--intervalo-notificacoes=' em segundos)."""
+        backend = self._criar_backend_notificacao()
+        if backend is None:
+            return None
+
+        max_itens, intervalo = MAX_ITENS_RESUMO, INTERVALO_MINIMO_S
+        for arg in sys.argv:
+            try:
+                if arg.startswith("--max-itens-notificacao="):
+                    max_itens = max(1, int(arg.split("=", 1)[1]))
+                elif arg.startswith("--intervalo-notificacoes="):
+                    intervalo = max(0, int(arg.split("=", 1)[1]))
+            except ValueError:
+                logger.warning("Argumento inválido ignorado: %s", arg)
+        # O nível de um alerta só é gravado quando o resumo com ele é exibido: o que ainda
+        # espera o intervalo ao fechar o programa volta na próxima verificação
+        return Despachante(backend, self.agendador, max_itens, intervalo, ao_exibir=self.servico.registrar_alertas)
+
+    def iniciar_agendador(self):
+        """Agenda a virada do dia, a primeira verificação de alertas e os lembretes das doses."""
+        self.agendador = Agendador()
+        self.notificador = self._criar_notificador()
+        self._agendar_virada_dia()
+        if self.notificador:
+            self.agendador.agendar_em("alertas", ATRASO_INICIAL_ALERTAS_S, self._tarefa_alertas)
+            # Os horários são carregados na thread do agendador, fora do início da janela
+            self.lembretes = MotorLembretes(self.servico, self.agendador, self.notificador.lembrar)
+            self.lembretes.iniciar()
+        else:
+            logger.info("Notificações desabilitadas. Verificação de alertas e lembretes não agendados.")
+        self.agendador.iniciar()
+
+    def _iniciar_api(self):
+        """
+        Com '--api' (ou '--api=porta'), serve a API HTTP/JSON local (servidor_api.py)
+        junto da janela: as escritas da API passam pela mesma fila de escrita e
+        atualizam a linha na lista. Retorna o servidor, ou None.
+        """
+        porta = None
+        for arg in sys.argv:
+            if arg == "--api" or arg.startswith("--api="):
+                try:
+                    porta = int(arg.partition("=")[2] or 0) or None
+                except ValueError:
+                    logger.warning("Argumento inválido ignorado: %s", arg)
+                    return None
+                break
+        else:
+            return None
+
+        # Só importado com --api, para não atrasar o início normal
+        import servidor_api
+        api = servidor_api.ApiEstoque(
+            self.servico, self.escritor, lambda remedio_id: self.root.after(0, self._confirmar_escrita, remedio_id)
+        )
         try:
-            self.db_cursor.execute("SELECT last_run_date FROM app_info WHERE id = 1")
-            resultado = self.db_cursor.fetchone()
-            
-            if resultado:
-                last_run_date_str = resultado[0]
-                last_run_date = datetime.strptime(last_run_date_str, '%Y-%m-%d').date()
-                hoje = date.today()
-                
-                dias_passados = (hoje - last_run_date).days
-                
-                if dias_passados > 0:
-                    print(f"MEIA-NOITE DETECTADA! Passaram {dias_passados} dia(s).")
-                    if self._atualizar_estoque_automatico(dias_passados=dias_passados):
-                        self.atualizar_lista_remedios()
-        
+            servidor = servidor_api.ServidorAPI(api, porta or servidor_api.PORTA_PADRAO)
+        except OSError as e:
+            logger.error("Não foi possível iniciar a API: %s", e)
+            return None
+        servidor.iniciar()
+        return servidor
+
+    def _agendar_virada_dia(self):
+        """Agenda a próxima virada do dia para a meia-noite local."""
+        self.agendador.agendar("virada_dia", proxima_meia_noite(), self._virar_dia)
+
+    def _virar_dia(self):
+        """Tarefa da meia-noite (na thread do agendador): debita o estoque e verifica os alertas se um prazo chegou."""
+        try:
+            # Os dias são contados dentro da transação do débito: se outra instância
+            # (ou o --check agendado) já debitou, não há o que debitar de novo
+            logger.info("Meia-noite detectada.")
+            if self.servico.debitar_dias():
+                self.root.after(0, self._apos_debito)
         except sqlite3.Error as e:
-            print(f"Erro no loop de verificação diária: {e}")
-        except Exception as e:
-            print(f"Erro inesperado no loop de verificação diária: {e}")
+            logger.error("Erro ao atualizar estoque automático: %s", e)
+            self.root.after(0, messagebox.showwarning, "Erro de Atualização",
+                            f"Não foi possível atualizar o estoque automático: {e}")
         finally:
-            self.iniciar_loop_verificacao_diaria() # Re-agenda
+            self._agendar_virada_dia() # Re-agenda
+
+        if self.lembretes:
+            # Pega os horários mudados por outros processos (ex.: a API)
+            try:
+                self.lembretes.recarregar()
+            except sqlite3.Error as e:
+                logger.error("Erro ao recarregar os horários das doses: %s", e)
 
-    def iniciar_loop_verificacao_diaria(self):
-        """Agenda a próxima verificação de mudança de dia."""
-        self.root.after(600000, self._verificar_mudanca_dia) # A cada 10 minutos
+        if self.notificador and self._proximo_prazo is not None and self._proximo_prazo <= date.today():
+            self._tarefa_alertas()
+
+    def _apos_debito(self):
+        """Na thread da interface, depois do débito de um dia: o estoque em cache ficou velho."""
+        self.registros.invalidar()
+        self.atualizar_lista_remedios()
 
     def _setup_ui(self):
         """Cria e organiza os widgets da interface gráfica."""
@@ -284,11 +392,16 @@ class App:
         # --- NOVO: Linha 2: Unidade ---
         ttk.Label(cadastro_frame, text="Unidade:").grid(row=2, column=0, padx=5, pady=5, sticky="e")
         unidade_frame = ttk.Frame(cadastro_frame)
-        unidade_frame.grid(row=2, column=1, columnspan=3, padx=5, pady=5, sticky="w")
+        unidade_frame.grid(row=2, column=1, padx=5, pady=5, sticky="w")
         
         self.unidade_var = tk.StringVar(value="comprimido")
         ttk.Radiobutton(unidade_frame, text="Comprimido(s)", variable=self.unidade_var, value="comprimido").pack(side="left", padx=5)
         ttk.Radiobutton(unidade_frame, text="ML", variable=self.unidade_var, value="ml").pack(side="left", padx=5)
+
+        ttk.Label(cadastro_frame, text="Alertar com (dias):").grid(row=2, column=2, padx=5, pady=5, sticky="e")
+        self.entry_limite_dias = ttk.Entry(cadastro_frame, width=10)
+        self.entry_limite_dias.insert(0, str(LIMITE_DIAS_PADRAO))
+        self.entry_limite_dias.grid(row=2, column=3, padx=5, pady=5, sticky="w")
         
         # Botão de Cadastrar
         self.btn_cadastrar = ttk.Button(cadastro_frame, text="Cadastrar", command=self.cadastrar_remedio)
@@ -299,15 +412,38 @@ class App:
         lista_frame = ttk.LabelFrame(self.root, text="Meus Remédios", padding=(10, 10))
         lista_frame.pack(fill="both", expand=True, padx=10, pady=5)
 
+        # Busca: filtra a lista enquanto se digita (pelo índice de nomes do banco)
+        busca_frame = ttk.Frame(lista_frame)
+        busca_frame.pack(fill="x", pady=(0, 5))
+        ttk.Label(busca_frame, text="Buscar:").pack(side="left", padx=(0, 5))
+        self.busca_var = tk.StringVar()
+        self.entry_busca = ttk.Entry(busca_frame, textvariable=self.busca_var)
+        self.entry_busca.pack(side="left", fill="x", expand=True)
+        self.entry_busca.bind("<Escape>", lambda _: self.busca_var.set(""))
+        self.busca_var.trace_add("write", self._ao_digitar_busca)
+
+        # Paciente: a lista, o cadastro e o teste de notificação são os dele
+        ttk.Label(busca_frame, text="Paciente:").pack(side="left", padx=(10, 5))
+        self.paciente_var = tk.StringVar()
+        self.combo_paciente = ttk.Combobox(busca_frame, textvariable=self.paciente_var, state="readonly", width=20)
+        self.combo_paciente.pack(side="left")
+        self.combo_paciente.bind("<<ComboboxSelected>>", self._ao_escolher_paciente)
+        ttk.Button(busca_frame, text="Novo Paciente", command=self.cadastrar_paciente).pack(side="left", padx=(5, 0))
+        self._atualizar_pacientes()
+
         # Colunas atualizadas
         colunas = ("remedio", "dose", "estoque", "dias_restantes", "data_fim")
         self.tree = ttk.Treeview(lista_frame, columns=colunas, show="headings")
 
-        self.tree.heading("remedio", text="Remédio")
-        self.tree.heading("dose", text="Dose Diária") # Texto atualizado
-        self.tree.heading("estoque", text="Estoque Atual") # Texto atualizado
-        self.tree.heading("dias_restantes", text="Dias Restantes")
-        self.tree.heading("data_fim", text="Data Prev. Fim")
+        self.titulos_colunas = {
+            "remedio": "Remédio",
+            "dose": "Dose Diária", # Texto atualizado
+            "estoque": "Estoque Atual", # Texto atualizado
+            "dias_restantes": "Dias Restantes",
+            "data_fim": "Data Prev. Fim",
+        }
+        for coluna, titulo in self.titulos_colunas.items():
+            self.tree.heading(coluna, text=titulo, command=lambda c=coluna: self._ordenar_por(c))
 
         self.tree.column("remedio", width=250)
         self.tree.column("dose", width=120, anchor="center")
@@ -315,10 +451,10 @@ class App:
         self.tree.column("dias_restantes", width=100, anchor="center")
         self.tree.column("data_fim", width=120, anchor="center")
 
-        scrollbar = ttk.Scrollbar(lista_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscroll=scrollbar.set)
+        self.scrollbar = ttk.Scrollbar(lista_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._ao_rolar_lista)
 
-        scrollbar.pack(side="right", fill="y")
+        self.scrollbar.pack(side="right", fill="y")
         self.tree.pack(fill="both", expand=True)
 
         # --- Frame de Ações ---
@@ -334,96 +470,361 @@ class App:
         self.btn_remover = ttk.Button(acoes_frame, text="Remover Remédio", command=self.remover_remedio_selecionado)
         self.btn_remover.pack(side="left", padx=5)
 
+        self.btn_limite_alerta = ttk.Button(acoes_frame, text="Limite de Alerta", command=self.modificar_limite_alerta)
+        self.btn_limite_alerta.pack(side="left", padx=5)
+
+        self.btn_historico = ttk.Button(acoes_frame, text="Histórico", command=self.mostrar_historico)
+        self.btn_historico.pack(side="left", padx=5)
+
+        self.btn_horarios = ttk.Button(acoes_frame, text="Horários", command=self.definir_horarios)
+        self.btn_horarios.pack(side="left", padx=5)
+
+        self.btn_tomar_dose = ttk.Button(acoes_frame, text="Tomar Dose", command=self.tomar_dose)
+        self.btn_tomar_dose.pack(side="left", padx=5)
+
         self.btn_atualizar = ttk.Button(acoes_frame, text="Atualizar Lista", command=self.atualizar_lista_remedios)
         self.btn_atualizar.pack(side="left", padx=5)
         
         self.btn_testar_notif = ttk.Button(acoes_frame, text="Testar Notificação", command=self.testar_notificacao_agora)
         self.btn_testar_notif.pack(side="right", padx=5)
 
-    def calcular_previsao(self, estoque, doses_dia):
-        """Calcula os dias restantes e a data de término com base no estoque e uso."""
-        if doses_dia > 0 and estoque > 0:
-            dias_restantes = int(estoque // doses_dia)
-            data_fim = datetime.now() + timedelta(days=dias_restantes)
-            data_fim_str = data_fim.strftime("%d/%m/%Y")
-            dias_str = f"{dias_restantes} dias"
-        elif estoque <= 0:
-            dias_str = "Acabou!"
-            data_fim_str = "N/A"
-        else:
-            dias_str = "N/A"
-            data_fim_str = "N/A"
-        return dias_str, data_fim_str
+    def _formatar_linhas(self, registros):
+        """
+        Monta as tuplas de valores exibidas na lista para os registros,
+        calculando as previsões de todos de uma vez. Retorna pares (id, valores).
+        """
+        dias_restantes, datas_fim = previsao.prever_lote(
+            [r.estoque for r in registros], [r.doses_por_dia for r in registros]
+        )
+        textos = previsao.formatar_previsoes(dias_restantes, datas_fim)
+
+        linhas = []
+        for r, (dias_str, data_fim_str) in zip(registros, textos):
+            # Formata a exibição da dose e estoque com a unidade
+            dose_display = f"{r.doses_por_dia} {r.unidade}"
+            estoque_display = f"{r.estoque} {r.unidade}"
+            linhas.append((r.id, (r.nome, dose_display, estoque_display, dias_str, data_fim_str)))
+        return linhas
+
+    def _contar_remedios(self, paciente_id=None):
+        """Retorna quantos remédios existem no banco, ou do paciente (0 se não conseguir contar)."""
+        try:
+            return self.servico.contar(paciente_id)
+        except sqlite3.Error as e:
+            logger.error("Erro ao contar remédios: %s", e)
+            return 0
 
+    @metricas.cronometrar("ui.atualizar_lista")
     def atualizar_lista_remedios(self):
-        """Busca os dados no banco e atualiza a lista (Treeview)."""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
+        """
+        Busca os dados no banco e reconcilia a lista (Treeview) pelo id: apaga
+        as linhas que sumiram, formata e atualiza só as que mudaram, insere as
+        novas e move só as que saíram da ordem. A Treeview recebe uma chamada
+        por linha alterada, e não uma por linha da tabela (recriar a lista
+        inteira travava a janela nas tabelas grandes). No modo virtual, só a
+        janela de linhas carregada é reconciliada.
+        """
         try:
-            # --- NOVO: Puxa a 'unidade' do banco ---
-            remedios = self.db_cursor.execute("SELECT id, nome, doses_por_dia, estoque_atual, unidade FROM remedios").fetchall()
-            for r in remedios:
-                remedio_id, nome, doses_dia, estoque, unidade = r
-                dias_str, data_fim_str = self.calcular_previsao(estoque, doses_dia)
-                
-                # Formata a exibição da dose e estoque com a unidade
-                dose_display = f"{doses_dia} {unidade}"
-                estoque_display = f"{estoque} {unidade}"
-                
-                self.tree.insert("", "end", iid=remedio_id, values=(nome, dose_display, estoque_display, dias_str, data_fim_str))
+            if self.modo_virtual:
+                limite = max(len(self._linhas_exibidas), TAMANHO_PAGINA)
+                remedios = self.servico.listar(self._inicio_janela, limite, self._busca, self._ordem, self.paciente_id)
+                self._tem_mais_depois = len(remedios) == limite
+            else:
+                remedios = self.servico.listar(busca=self._busca, ordem=self._ordem, paciente_id=self.paciente_id)
         except sqlite3.Error as e:
             messagebox.showerror("Erro de Banco de Dados", f"Erro ao buscar remédios: {e}")
+            return
+
+        exibidas = self._linhas_exibidas
+        presentes = {r[0] for r in remedios}
+        removidos = [remedio_id for remedio_id in exibidas if remedio_id not in presentes]
+        if removidos:
+            self.tree.delete(*removidos)
+            self.registros.remover(*removidos)
+            for remedio_id in removidos:
+                del exibidas[remedio_id]
+
+        # Só as linhas com dados diferentes dos do cache são formatadas de novo
+        mudadas = [r for r in remedios if r[0] not in exibidas or not self.registros.igual(r)]
+        novos = {}
+        for remedio_id, valores in self._formatar_linhas(self.registros.guardar(mudadas)):
+            if remedio_id in exibidas:
+                if exibidas[remedio_id] != valores:
+                    self.tree.item(remedio_id, values=valores)
+                    exibidas[remedio_id] = valores
+            else:
+                novos[remedio_id] = valores
+
+        ordem_nova = [str(r[0]) for r in remedios]
+        atual = self.tree.get_children()
+        mover = set()
+        if novos or len(atual) != len(ordem_nova) or atual != tuple(ordem_nova):
+            mover = linhas_fora_de_ordem(atual, [iid for iid in ordem_nova if int(iid) not in novos])
+        if mover:
+            self.tree.detach(*mover)
+        if novos or mover:
+            # Com as linhas fora de ordem desligadas, as que sobram já estão na ordem nova:
+            # cada linha entra na sua posição, percorrendo a ordem nova uma vez
+            tamanho = len(atual) - len(mover)
+            for posicao, iid in enumerate(ordem_nova):
+                remedio_id = int(iid)
+                if remedio_id in novos:
+                    self.tree.insert("", "end" if posicao >= tamanho else posicao, iid=remedio_id, values=novos[remedio_id])
+                    exibidas[remedio_id] = novos[remedio_id]
+                elif iid in mover:
+                    self.tree.move(iid, "", posicao)
+                else:
+                    continue
+                tamanho += 1
+
+    @metricas.cronometrar("ui.atualizar_linha")
+    def atualizar_remedio_na_lista(self, remedio_id):
+        """
+        Atualiza apenas a linha de um remédio (inserindo ou apagando se preciso).
+        Com a lista ordenada, a linha vai para logo depois da que a precede na
+        ordem, lida pelo índice da ordenação (listar_antes), sem reler a lista.
+        """
+        if self._ordem is not None and self.modo_virtual:
+            # A linha pode entrar ou sair da janela carregada: recria só a janela
+            self.atualizar_lista_remedios()
+            return
+        try:
+            r = self.servico.obter(remedio_id, self._busca, self.paciente_id)
+            anterior = None
+            if r is not None and self._ordem is not None:
+                anterior = self.servico.listar_antes(remedio_id, 1, self._busca, self._ordem, self.paciente_id)
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro de Banco de Dados", f"Erro ao buscar remédio: {e}")
+            return
+
+        valores_antigos = self._linhas_exibidas.get(remedio_id)
+        if r is None:
+            if valores_antigos is not None:
+                self.tree.delete(remedio_id)
+                del self._linhas_exibidas[remedio_id]
+                self.registros.remover(remedio_id)
+            return
+
+        if valores_antigos is None and self.modo_virtual and (remedio_id < self._inicio_janela or self._tem_mais_depois):
+            return # Fora da janela carregada; aparece quando a rolagem chegar nele
+        if anterior and anterior[0][0] not in self._linhas_exibidas:
+            # A linha anterior ainda não está na lista (ex.: cadastrada por outro processo)
+            self.atualizar_lista_remedios()
+            return
+        valores = self._formatar_linhas(self.registros.guardar([r]))[0][1]
+        if valores_antigos is None:
+            self.tree.insert("", "end", iid=remedio_id, values=valores)
+        elif valores_antigos != valores:
+            self.tree.item(remedio_id, values=valores)
+        self._linhas_exibidas[remedio_id] = valores
+
+        if self._ordem is not None:
+            atual = self.tree.index(remedio_id)
+            posicao = self.tree.index(anterior[0][0]) + 1 if anterior else 0
+            if posicao != atual:
+                # A posição do move não conta a própria linha
+                self.tree.move(remedio_id, "", posicao if posicao < atual else posicao - 1)
+
+    def _ao_rolar_lista(self, primeiro, ultimo):
+        """Repassa a posição à barra de rolagem e, no modo virtual, pede mais linhas perto das bordas."""
+        self.scrollbar.set(primeiro, ultimo)
+        if not self.modo_virtual or self._carga_agendada:
+            return
+
+        if float(ultimo) >= 1 - MARGEM_ROLAGEM and self._tem_mais_depois:
+            self._carga_agendada = True
+            self.root.after_idle(self._carregar_pagina, True)
+        elif float(primeiro) <= MARGEM_ROLAGEM and self._tem_mais_antes:
+            self._carga_agendada = True
+            self.root.after_idle(self._carregar_pagina, False)
+
+    @metricas.cronometrar("ui.carregar_pagina")
+    def _carregar_pagina(self, seguinte):
+        """
+        Carrega a próxima página (ou a anterior) da janela virtual por paginação
+        em 'remedios.id' (ou na chave da ordenação e no id) e descarta as linhas
+        do outro lado que passarem do máximo.
+        """
+        self._carga_agendada = False
+        ids = self.tree.get_children()
+        if not ids:
+            return
+
+        try:
+            if seguinte:
+                remedios = self.servico.listar_depois(int(ids[-1]), TAMANHO_PAGINA, self._busca, self._ordem, self.paciente_id)
+            else:
+                remedios = self.servico.listar_antes(int(ids[0]), TAMANHO_PAGINA, self._busca, self._ordem, self.paciente_id)
+        except sqlite3.Error as e:
+            logger.error("Erro ao carregar página da lista: %s", e)
+            return
+
+        excesso = len(ids) + len(remedios) - JANELA_MAX_LINHAS
+
+        if seguinte:
+            self._tem_mais_depois = len(remedios) == TAMANHO_PAGINA
+            for remedio_id, valores in self._formatar_linhas(self.registros.guardar(remedios)):
+                self.tree.insert("", "end", iid=remedio_id, values=valores)
+                self._linhas_exibidas[remedio_id] = valores
+
+            if excesso > 0:
+                descartados = ids[:excesso]
+                self.tree.delete(*descartados)
+                for iid in descartados:
+                    del self._linhas_exibidas[int(iid)]
+                    self.registros.remover(int(iid))
+                # Mantém as mesmas linhas visíveis depois de tirar as de cima
+                self.tree.yview_scroll(-excesso, "units")
+                self._tem_mais_antes = True
+        else:
+            self._tem_mais_antes = len(remedios) == TAMANHO_PAGINA
+            for posicao, (remedio_id, valores) in enumerate(self._formatar_linhas(self.registros.guardar(remedios))):
+                self.tree.insert("", posicao, iid=remedio_id, values=valores)
+                self._linhas_exibidas[remedio_id] = valores
+            # Mantém as mesmas linhas visíveis depois de inserir acima delas
+            self.tree.yview_scroll(len(remedios), "units")
+
+            if excesso > 0:
+                descartados = ids[-excesso:]
+                self.tree.delete(*descartados)
+                for iid in descartados:
+                    del self._linhas_exibidas[int(iid)]
+                    self.registros.remover(int(iid))
+                self._tem_mais_depois = True
+
+        self._inicio_janela = int(self.tree.get_children()[0]) if self._tem_mais_antes else 0
+
+    def _ao_digitar_busca(self, *_):
+        """Reinicia a espera a cada tecla: a lista só é filtrada quando a digitação para."""
+        if self._busca_agendada is not None:
+            self.root.after_cancel(self._busca_agendada)
+        self._busca_agendada = self.root.after(ATRASO_BUSCA_MS, self._aplicar_busca)
+
+    @metricas.cronometrar("ui.busca")
+    def _aplicar_busca(self):
+        """Recarrega a lista do começo com os remédios que casam com o texto da busca."""
+        self._busca_agendada = None
+        busca = self.busca_var.get().strip() or None
+        if busca == self._busca:
+            return
+        self._busca = busca
+        self._recarregar_lista()
+
+    def _ordenar_por(self, coluna):
+        """Clique no cabeçalho: crescente, depois decrescente, depois volta à ordem de cadastro."""
+        chave = ORDENACAO_COLUNAS[coluna]
+        if coluna != self._coluna_ordem or self._ordem is None:
+            self._ordem = chave
+        elif not self._ordem.startswith("-"):
+            self._ordem = "-" + chave
+        else:
+            self._ordem = None
+        self._coluna_ordem = coluna if self._ordem else None
+
+        for nome, titulo in self.titulos_colunas.items():
+            if nome == self._coluna_ordem:
+                titulo += SETAS_ORDENACAO[self._ordem.startswith("-")]
+            self.tree.heading(nome, text=titulo)
+        self._recarregar_lista()
+
+    def _recarregar_lista(self):
+        """Esvazia a lista e a carrega do começo (com a busca e a ordem atuais)."""
+        filhos = self.tree.get_children()
+        if filhos:
+            self.tree.delete(*filhos)
+        self._linhas_exibidas = {}
+        self.registros.invalidar()
+        self._inicio_janela = 0
+        self._tem_mais_antes = False
+        self.atualizar_lista_remedios()
+
+    def _atualizar_pacientes(self):
+        """Preenche a escolha de paciente com os cadastrados e mostra o atual."""
+        try:
+            self._pacientes = self.servico.listar_pacientes()
+        except sqlite3.Error as e:
+            logger.error("Erro ao listar pacientes: %s", e)
+            self._pacientes = []
+        self.combo_paciente["values"] = [nome for _, nome in self._pacientes]
+        for paciente_id, nome in self._pacientes:
+            if paciente_id == self.paciente_id:
+                self.paciente_var.set(nome)
+
+    def _ao_escolher_paciente(self, _evento=None):
+        """Troca o paciente da lista e a recarrega do começo."""
+        paciente_id = self._pacientes[self.combo_paciente.current()][0]
+        if paciente_id == self.paciente_id:
+            return
+        self.paciente_id = paciente_id
+        self.modo_virtual = "--lista-virtual" in sys.argv or self._contar_remedios(paciente_id) > LIMITE_LISTA_VIRTUAL
+        self._recarregar_lista()
+
+    def cadastrar_paciente(self):
+        """Pede o nome de um novo paciente, cadastra e passa a mostrar a lista dele."""
+        nome = simpledialog.askstring("Novo Paciente", "Nome do paciente:", parent=self.root)
+        if not nome:
+            return
+        try:
+            paciente_id = self.servico.cadastrar_paciente(nome)
+        except (PacienteDuplicado, NomeInvalido) as e:
+            messagebox.showerror("Erro", str(e))
+            return
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro de Banco de Dados", f"Erro ao cadastrar paciente: {e}")
+            return
+        self.paciente_id = paciente_id
+        self.modo_virtual = "--lista-virtual" in sys.argv
+        self._atualizar_pacientes()
+        self._recarregar_lista()
 
     def cadastrar_remedio(self):
-        """Valida os campos e insere um novo remédio no banco."""
+        """Valida os campos e envia o novo remédio (do paciente atual) para a thread de escrita."""
         nome = self.entry_nome.get().strip()
+        paciente_id = self.paciente_id
         unidade = self.unidade_var.get() # --- NOVO ---
         try:
             doses_dia = int(self.entry_doses_dia.get())
             estoque = int(self.entry_estoque.get())
+            limite_dias = int(self.entry_limite_dias.get())
         except ValueError:
-            messagebox.showerror("Erro de Entrada", "Doses por dia e estoque devem ser números inteiros.")
+            messagebox.showerror("Erro de Entrada", "Doses por dia, estoque e dias de alerta devem ser números inteiros.")
             return
 
-        if not nome or doses_dia <= 0 or estoque < 0:
-            messagebox.showerror("Erro de Entrada", "Todos os campos são obrigatórios. Doses/dia deve ser > 0 e estoque >= 0.")
+        if not nome or doses_dia <= 0 or estoque < 0 or limite_dias < 0:
+            messagebox.showerror("Erro de Entrada", "Todos os campos são obrigatórios. Doses/dia deve ser > 0 e estoque e dias de alerta >= 0.")
             return
 
         if is_str_too_big(nome):
             return
         
-        if is_val_too_big((estoque, doses_dia)):
+        if is_val_too_big((estoque, doses_dia, limite_dias)):
             return
 
-        try:
-            # --- NOVO: Insere a 'unidade' no banco ---
-            self.db_cursor.execute(
-                "INSERT INTO remedios (nome, doses_por_dia, estoque_atual, unidade) VALUES (?, ?, ?, ?)",
-                (nome, doses_dia, estoque, unidade)
-            )
-            remedio_id = self.db_cursor.lastrowid
-
-            if estoque > 0:
-                self.db_cursor.execute(
-                    "INSERT INTO historico_estoque (remedio_id, quantidade_adicionada, data_adicao) VALUES (?, ?, ?)",
-                    (remedio_id, estoque, datetime.now())
-                )
-            
-            self.db_conn.commit()
+        def ao_sucesso(remedio_id):
+            self._confirmar_escrita(remedio_id)
             messagebox.showinfo("Sucesso", f"Remédio '{nome}' cadastrado com sucesso.")
-            
-            self.entry_nome.delete(0, "end")
-            self.entry_doses_dia.delete(0, "end")
-            self.entry_estoque.delete(0, "end")
-            self.unidade_var.set("comprimido") # Reseta a unidade
-            
-            self.atualizar_lista_remedios()
 
-        except sqlite3.IntegrityError:
-            messagebox.showerror("Erro", f"O remédio '{nome}' já está cadastrado.")
-        except sqlite3.Error as e:
-            messagebox.showerror("Erro de Banco de Dados", f"Erro ao cadastrar: {e}")
+        def ao_erro(e):
+            # Devolve ao formulário o que foi digitado
+            self._preencher_formulario(nome, doses_dia, estoque, unidade, limite_dias)
+            if isinstance(e, (RemedioDuplicado, PacienteNaoEncontrado)):
+                messagebox.showerror("Erro", str(e))
+            else:
+                messagebox.showerror("Erro de Banco de Dados", f"Erro ao cadastrar: {e}")
+
+        self.escritor.enviar(
+            lambda conn: self.servico.cadastrar(nome, doses_dia, estoque, unidade, limite_dias, paciente_id=paciente_id),
+            ao_sucesso, ao_erro
+        )
+        self._preencher_formulario("", "", "", "comprimido", LIMITE_DIAS_PADRAO)
+
+    def _preencher_formulario(self, nome, doses_dia, estoque, unidade, limite_dias):
+        """Preenche os campos do frame de cadastro."""
+        for entry, valor in ((self.entry_nome, nome), (self.entry_doses_dia, doses_dia),
+                             (self.entry_estoque, estoque), (self.entry_limite_dias, limite_dias)):
+            entry.delete(0, "end")
+            entry.insert(0, str(valor))
+        self.unidade_var.set(unidade)
 
     def get_remedio_id_selecionado(self):
         """Retorna o ID (do banco) do remédio selecionado na lista."""
@@ -433,27 +834,55 @@ class App:
             return None
         return int(item_selecionado)
 
-    def adicionar_estoque(self):
-        """Adiciona uma nova quantidade ao estoque de um remédio selecionado."""
+    def _registro_selecionado(self):
+        """Registro (do cache) do remédio selecionado na lista, ou None se não houver seleção."""
         remedio_id = self.get_remedio_id_selecionado()
         if remedio_id is None:
-            return
+            return None
+        registro = self.registros.obter(remedio_id)
+        if registro is None:
+            messagebox.showerror("Erro", "Não foi possível ler o remédio selecionado. Atualize a lista.")
+        return registro
+
+    def _exibir_estoque_previsto(self, registro, novo_estoque):
+        """Mostra na lista o estoque esperado antes de a escrita ser confirmada (o cache só muda no commit)."""
+        valores = self._formatar_linhas([registro.com_estoque(novo_estoque)])[0][1]
+        self.tree.item(registro.id, values=valores)
+        self._linhas_exibidas[registro.id] = valores
+
+    def _confirmar_estoque(self, remedio_id, estoque):
+        """Depois do commit de uma escrita de estoque: atualiza o registro no lugar, sem reler o banco."""
+        registro = self.registros.definir_estoque(remedio_id, estoque)
+        if registro is None or self._ordem is not None:
+            # Fora do cache, ou a linha pode mudar de posição na lista ordenada
+            self.atualizar_remedio_na_lista(remedio_id)
+        else:
+            valores = self._formatar_linhas([registro])[0][1]
+            if valores != self._linhas_exibidas.get(remedio_id):
+                self.tree.item(remedio_id, values=valores)
+                self._linhas_exibidas[remedio_id] = valores
+        self._estoque_mudou()
+
+    def _confirmar_escrita(self, remedio_id):
+        """Depois do commit: mostra a linha como está no banco e antecipa a verificação de alertas."""
+        self.atualizar_remedio_na_lista(remedio_id)
+        self._estoque_mudou()
+
+    def _desfazer_na_lista(self, remedio_id, titulo, e):
+        """Volta a linha ao que está no banco depois de uma escrita que falhou."""
+        self.atualizar_remedio_na_lista(remedio_id)
+        messagebox.showerror("Erro de Banco de Dados", f"{titulo}: {e}")
 
-        # --- NOVO: Busca a unidade para mostrar no pop-up ---
-        valores = self.tree.item(remedio_id, 'values')
-        nome_remedio = valores[0]
-        estoque_atual_str = valores[2] # Ex: "10 comprimido"
-        
-        try:
-            # Parseia o valor do estoque e a unidade
-            estoque_val, unidade = estoque_atual_str.split()
-            estoque_val = int(estoque_val)
-        except Exception:
-            messagebox.showerror("Erro", "Não foi possível ler o estoque atual do remédio selecionado.")
+    def adicionar_estoque(self):
+        """Adiciona uma nova quantidade ao estoque de um remédio selecionado."""
+        registro = self._registro_selecionado()
+        if registro is None:
             return
+        remedio_id = registro.id
 
         try:
-            prompt = f"Remédio: {nome_remedio}\nEstoque Atual: {estoque_val} {unidade}\n\nQuanto deseja ADICIONAR ({unidade})?"
+            prompt = (f"Remédio: {registro.nome}\nEstoque Atual: {registro.estoque} {registro.unidade}"
+                      f"\n\nQuanto deseja ADICIONAR ({registro.unidade})?")
             quantidade_str = simpledialog.askstring("Adicionar Estoque", prompt)
             
             if quantidade_str is None: return
@@ -466,39 +895,25 @@ class App:
             messagebox.showerror("Erro", "Valor inválido.")
             return
 
-        try:
-            if is_val_too_big((quantidade, )):
-                return
-            
-            self.db_cursor.execute(
-                "UPDATE remedios SET estoque_atual = estoque_atual + ? WHERE id = ?",
-                (quantidade, remedio_id)
-            )
-            self.db_cursor.execute(
-                "INSERT INTO historico_estoque (remedio_id, quantidade_adicionada, data_adicao) VALUES (?, ?, ?)",
-                (remedio_id, quantidade, datetime.now())
-            )
-            self.db_conn.commit()
-            self.atualizar_lista_remedios()
-        except sqlite3.Error as e:
-            messagebox.showerror("Erro de Banco de Dados", f"Erro ao adicionar estoque: {e}")
+        if is_val_too_big((quantidade, )):
+            return
+
+        self._exibir_estoque_previsto(registro, registro.estoque + quantidade)
+        self.escritor.enviar(
+            lambda conn: self.servico.adicionar_estoque(remedio_id, quantidade),
+            lambda estoque: self._confirmar_estoque(remedio_id, estoque),
+            lambda e: self._desfazer_na_lista(remedio_id, "Erro ao adicionar estoque", e)
+        )
 
     def modificar_estoque(self):
         """Modifica o estoque de um remédio para um valor exato."""
-        remedio_id = self.get_remedio_id_selecionado()
-        if remedio_id is None:
+        registro = self._registro_selecionado()
+        if registro is None:
             return
+        remedio_id = registro.id
 
-        # --- NOVO: Busca a unidade para mostrar no pop-up ---
-        valores = self.tree.item(remedio_id, 'values')
-        estoque_atual_str = valores[2] # Ex: "10 comprimido"
         try:
-            _, unidade = estoque_atual_str.split()
-        except Exception:
-            unidade = "" # Fallback
-
-        try:
-            prompt = f"Qual o NOVO valor TOTAL do estoque ({unidade})?"
+            prompt = f"Qual o NOVO valor TOTAL do estoque ({registro.unidade})?"
             quantidade_str = simpledialog.askstring("Modificar Estoque", prompt)
             
             if quantidade_str is None: return
@@ -511,162 +926,370 @@ class App:
             messagebox.showerror("Erro", "Valor inválido.")
             return
         
-        
+        if is_val_too_big((quantidade, )):
+            return
+
+        self._exibir_estoque_previsto(registro, quantidade)
+        self.escritor.enviar(
+            lambda conn: self.servico.definir_estoque(remedio_id, quantidade),
+            lambda estoque: self._confirmar_estoque(remedio_id, estoque),
+            lambda e: self._desfazer_na_lista(remedio_id, "Erro ao modificar estoque", e)
+        )
+
+    def modificar_limite_alerta(self):
+        """Modifica com quantos dias restantes o remédio selecionado passa a gerar alerta."""
+        remedio_id = self.get_remedio_id_selecionado()
+        if remedio_id is None:
+            return
+
         try:
+            nome_remedio, limite_atual = self.servico.obter_limite_alerta(remedio_id)
+        except (sqlite3.Error, ErroRemedios) as e:
+            messagebox.showerror("Erro de Banco de Dados", f"Erro ao buscar o limite de alerta: {e}")
+            return
+
+        try:
+            prompt = f"Remédio: {nome_remedio}\nLimite Atual: {limite_atual} dias\n\nAlertar quando restarem quantos dias?"
+            limite_str = simpledialog.askstring("Limite de Alerta", prompt)
             
-            if is_val_too_big((quantidade, )):
-                return
+            if limite_str is None: return
             
-            self.db_cursor.execute(
-                "UPDATE remedios SET estoque_atual = ? WHERE id = ?",
-                (quantidade, remedio_id)
-            )
-            self.db_conn.commit()
-            self.atualizar_lista_remedios()
-        except sqlite3.Error as e:
-            messagebox.showerror("Erro de Banco de Dados", f"Erro ao modificar estoque: {e}")
+            limite_dias = int(limite_str)
+            if limite_dias < 0:
+                messagebox.showerror("Erro", "O limite não pode ser negativo.")
+                return
+        except (ValueError, TypeError):
+            messagebox.showerror("Erro", "Valor inválido.")
+            return
+
+        if is_val_too_big((limite_dias, )):
+            return
+
+        self.escritor.enviar(
+            lambda conn: self.servico.definir_limite_alerta(remedio_id, limite_dias),
+            lambda _: self._estoque_mudou(),
+            ao_erro=lambda e: messagebox.showerror("Erro de Banco de Dados", f"Erro ao modificar limite de alerta: {e}")
+        )
 
     def remover_remedio_selecionado(self):
         """Remove um remédio selecionado do banco de dados."""
-        remedio_id = self.get_remedio_id_selecionado()
-        if remedio_id is None:
+        registro = self._registro_selecionado()
+        if registro is None:
             return
-
-        nome_remedio = self.tree.item(remedio_id, 'values')[0]
+        remedio_id, nome_remedio = registro.id, registro.nome
         
         if not messagebox.askyesno("Confirmar Remoção", f"Tem certeza que deseja remover '{nome_remedio}'?\n\nTodo o seu histórico de estoque também será apagado."):
             return
 
-        try:
-            self.db_cursor.execute("DELETE FROM remedios WHERE id = ?", (remedio_id,))
-            self.db_conn.commit()
-            
+        # Tira da lista já; se a remoção falhar, a linha volta para a mesma posição
+        posicao = self.tree.index(remedio_id)
+        self.tree.delete(remedio_id)
+        valores = self._linhas_exibidas.pop(remedio_id, None)
+        self.registros.remover(remedio_id)
+
+        def ao_sucesso(_):
+            if self.lembretes:
+                self.lembretes.atualizar_remedio(remedio_id, []) # Os horários foram junto
             messagebox.showinfo("Sucesso", f"'{nome_remedio}' foi removido.")
-            self.atualizar_lista_remedios()
-            
-        except sqlite3.Error as e:
-            messagebox.showerror("Erro de Banco de Dados", f"Erro ao remover remédio: {e}")
 
-    # --- Lógica de Notificação e Threads ---
+        def ao_falhar(e):
+            # Se a lista foi recarregada nesse meio tempo, a linha já voltou com ela
+            if valores is not None and remedio_id not in self._linhas_exibidas:
+                self.tree.insert("", min(posicao, len(self._linhas_exibidas)), iid=remedio_id, values=valores)
+                self._linhas_exibidas[remedio_id] = valores
+            self._desfazer_na_lista(remedio_id, "Erro ao remover remédio", e)
 
-    def _verificar_estoque_notificacao(self):
-        """Verifica o estoque e agenda notificações na thread principal."""
-        if not NOTIFIER_AVAILABLE:
+        self.escritor.enviar(lambda conn: self.servico.remover(remedio_id), ao_sucesso, ao_falhar)
+
+    def definir_horarios(self):
+        """Define os horários das doses do remédio selecionado (com horários, o estoque é debitado a cada dose)."""
+        registro = self._registro_selecionado()
+        if registro is None:
             return
+        remedio_id = registro.id
 
-        print("Executando verificação de estoque (Notificação)...")
-        
-        conn_thread = None
         try:
-            conn_thread = sqlite3.connect(self.db_name)
-            cursor_thread = conn_thread.cursor()
-            
-            # --- NOVO: Puxa a 'unidade' do banco ---
-            remedios = cursor_thread.execute("SELECT nome, doses_por_dia, estoque_atual, unidade FROM remedios").fetchall()
-            
-            LIMITE_DIAS = 5
-            
-            for nome, doses_dia, estoque, unidade in remedios:
-                if doses_dia > 0 and estoque > 0:
-                    dias_restantes = int(estoque // doses_dia)
-                    if dias_restantes <= LIMITE_DIAS:
-                        print(f"Estoque baixo detectado para: {nome}")
-                        
-                        # Pluraliza "comprimido" se necessário
-                        unidade_str = "comprimidos" if unidade == "comprimido" and estoque != 1 else unidade
-                        
-                        titulo = "Alerta de Estoque Baixo!"
-                        mensagem = f"O remédio '{nome}' está acabando. Restam apenas {estoque} {unidade_str} ({dias_restantes} dias)."
-                        
-                        self.root.after(0, self.agendar_notificacao_main_thread, titulo, mensagem)
-                        
-            print("Verificação de notificações concluída.")
+            atuais = self.servico.horarios(remedio_id)
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro de Banco de Dados", f"Erro ao buscar os horários: {e}")
+            return
+
+        prompt = (f"Remédio: {registro.nome}\n\nHorários das doses, ex.: 08:00 14:00 20:00x2\n"
+                  f"(x2 = dose de 2 {unidade_plural(registro.unidade, 2)}; sem xN, dose de 1).\n\n"
+                  "Com horários, o estoque é debitado a cada dose tomada e há um lembrete em cada horário.\n"
+                  "Deixe vazio para voltar ao débito diário.")
+        texto = simpledialog.askstring(
+            "Horários das Doses", prompt, initialvalue=formatar_horarios([(minuto, quantidade) for _, minuto, quantidade in atuais])
+        )
+        if texto is None: return
+        try:
+            horarios = interpretar_horarios(texto)
+        except ValorInvalido as e:
+            messagebox.showerror("Erro", str(e))
+            return
+
+        def ao_sucesso(gravados):
+            self._confirmar_escrita(remedio_id) # As doses por dia podem ter mudado
+            if self.lembretes:
+                self.lembretes.atualizar_remedio(remedio_id, gravados)
+
+        self.escritor.enviar(
+            lambda conn: self.servico.definir_horarios(remedio_id, horarios),
+            ao_sucesso,
+            lambda e: self._desfazer_na_lista(remedio_id, "Erro ao definir os horários", e)
+        )
+
+    def tomar_dose(self):
+        """Registra a primeira dose de hoje ainda não tomada do remédio selecionado e debita a sua quantidade."""
+        registro = self._registro_selecionado()
+        if registro is None:
+            return
+        remedio_id = registro.id
 
+        try:
+            dose = self.servico.dose_pendente(remedio_id)
+            tem_horarios = dose is not None or bool(self.servico.horarios(remedio_id))
         except sqlite3.Error as e:
-            print(f"Erro na thread de notificação (SQLite): {e}")
-        except Exception as e:
-            print(f"Erro inesperado na thread de notificação: {e}")
-        finally:
-            if conn_thread:
-                conn_thread.close()
+            messagebox.showerror("Erro de Banco de Dados", f"Erro ao buscar as doses: {e}")
+            return
+        if not tem_horarios:
+            messagebox.showinfo("Sem Horários", f"'{registro.nome}' não tem horários de doses: o estoque é debitado a cada dia.\n\n"
+                                                "Use 'Horários' para debitar dose a dose.")
+            return
+        if dose is None:
+            messagebox.showinfo("Doses de Hoje", f"Todas as doses de hoje de '{registro.nome}' já foram registradas.")
+            return
 
-    def _loop_notificacao(self):
-        """Loop infinito que roda na thread de fundo."""
-        time.sleep(10)
-        
-        while True:
-            self._verificar_estoque_notificacao()
-            time.sleep(4 * 3600)
+        unidade_str = unidade_plural(dose.unidade, dose.quantidade)
+        if not messagebox.askyesno("Tomar Dose", f"Registrar a dose das {formatar_minuto(dose.minuto)} de "
+                                                 f"'{registro.nome}' ({dose.quantidade} {unidade_str})?"):
+            return
 
-    def iniciar_verificador_notificacoes(self):
-        """Inicia a thread de notificação em segundo plano."""
-        if not NOTIFIER_AVAILABLE:
-            print("Notificações desabilitadas. Thread de verificação não iniciada.")
+        def ao_sucesso(estoque):
+            if estoque is None:
+                # Outro processo (ou um clique anterior) registrou a mesma dose: nada foi debitado
+                self.atualizar_remedio_na_lista(remedio_id)
+            else:
+                self._confirmar_estoque(remedio_id, estoque)
+
+        self._exibir_estoque_previsto(registro, max(0, registro.estoque - dose.quantidade))
+        self.escritor.enviar(
+            lambda conn: self.servico.tomar_dose(dose.horario_id, dose.dia),
+            ao_sucesso,
+            lambda e: self._desfazer_na_lista(remedio_id, "Erro ao registrar a dose", e)
+        )
+
+    def mostrar_historico(self):
+        """Abre uma janela com as reposições do remédio selecionado e os totais por período."""
+        registro = self._registro_selecionado()
+        if registro is None:
             return
-            
-        self.notification_thread = threading.Thread(target=self._loop_notificacao)
-        self.notification_thread.daemon = True
-        self.notification_thread.start()
-        print("Thread de notificação iniciada.")
+        remedio_id, nome_remedio = registro.id, registro.nome
+        janela = tk.Toplevel(self.root)
+        janela.title(f"Histórico - {nome_remedio}")
+        janela.geometry("520x480")
 
-    def agendar_notificacao_main_thread(self, titulo, mensagem):
-        """Função segura para ser chamada pela thread de fundo."""
-        if not (NOTIFIER_AVAILABLE and self.toaster):
+        # --- Consumo observado x prescrito ---
+        try:
+            consumo = self.servico.consumo(remedio_id)
+        except (sqlite3.Error, ErroRemedios) as e:
+            messagebox.showerror("Erro de Banco de Dados", f"Erro ao buscar o consumo: {e}", parent=janela)
+            janela.destroy()
             return
+        ttk.Label(janela, text=self._resumo_consumo(consumo), justify="left").pack(anchor="w", padx=15, pady=(10, 0))
+
+        # --- Reposições ---
+        entradas_frame = ttk.LabelFrame(janela, text=f"Últimas {HISTORICO_MAX_LINHAS} Reposições", padding=(10, 10))
+        entradas_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        tree_entradas = ttk.Treeview(entradas_frame, columns=("data", "quantidade"), show="headings", height=8)
+        tree_entradas.heading("data", text="Data")
+        tree_entradas.heading("quantidade", text="Quantidade")
+        tree_entradas.column("data", width=200, anchor="center")
+        tree_entradas.column("quantidade", width=120, anchor="center")
+        tree_entradas.pack(fill="both", expand=True)
+
+        # --- Totais por período ---
+        totais_frame = ttk.LabelFrame(janela, text="Totais por Período", padding=(10, 10))
+        totais_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        periodo_var = tk.StringVar(value="mes")
+        ttk.Combobox(totais_frame, textvariable=periodo_var, values=list(PERIODOS), state="readonly", width=10).pack(anchor="w")
+        tree_totais = ttk.Treeview(totais_frame, columns=("periodo", "total", "reposicoes"), show="headings", height=6)
+        tree_totais.heading("periodo", text="Período")
+        tree_totais.heading("total", text="Total")
+        tree_totais.heading("reposicoes", text="Reposições")
+        for coluna in ("periodo", "total", "reposicoes"):
+            tree_totais.column(coluna, width=120, anchor="center")
+        tree_totais.pack(fill="both", expand=True, pady=(5, 0))
+
+        def carregar_totais(*_):
+            tree_totais.delete(*tree_totais.get_children())
+            try:
+                totais = self.servico.totais_por_periodo(remedio_id, periodo_var.get())
+            except (sqlite3.Error, ErroRemedios) as e:
+                messagebox.showerror("Erro de Banco de Dados", f"Erro ao buscar os totais: {e}", parent=janela)
+                return
+            for periodo, total, reposicoes in totais:
+                tree_totais.insert("", "end", values=(periodo, total, reposicoes))
 
         try:
-            icon_path = resource_path("cardiogram.ico")
-            
-            self.toaster.show_toast(
-                title=titulo,
-                msg=mensagem,
-                duration=10,
-                icon_path=icon_path,
-                threaded=True
-            )
-            print(f"Notificação agendada exibida: {titulo}")
+            entradas = self.servico.historico(remedio_id, limite=HISTORICO_MAX_LINHAS)
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro de Banco de Dados", f"Erro ao buscar o histórico: {e}", parent=janela)
+            janela.destroy()
+            return
+        for data_adicao, quantidade in entradas:
+            tree_entradas.insert("", "end", values=(data_adicao, quantidade))
+
+        periodo_var.trace_add("write", carregar_totais)
+        carregar_totais()
+
+    @staticmethod
+    def _resumo_consumo(consumo):
+        """Texto com o consumo observado nas reposições e o prescrito."""
+        if consumo is None:
+            return "Nenhuma reposição registrada."
+        linhas = [f"Reposições: {consumo.reposicoes} (total {consumo.quantidade_total}), "
+                  f"última em {consumo.ultima_reposicao[:10]}"]
+        if consumo.intervalo_medio is not None:
+            linhas.append(f"Intervalo entre reposições: último {consumo.intervalo_ultimo:.1f} dias, "
+                          f"médio {consumo.intervalo_medio:.1f} dias")
+        if consumo.consumo_observado is None:
+            linhas.append(f"Consumo prescrito: {consumo.doses_por_dia}/dia (histórico insuficiente para comparar)")
+        else:
+            linhas.append(f"Consumo observado: {consumo.consumo_observado:.2f}/dia "
+                          f"(prescrito: {consumo.doses_por_dia}/dia)")
+            linhas.append(f"Fim previsto pelo consumo observado: {consumo.data_fim_ajustada.strftime('%d/%m/%Y')}")
+        return "\n".join(linhas)
+
+    # --- Lógica de Notificação e Threads ---
+
+    @metricas.cronometrar("notificacoes.verificacao")
+    def _verificar_estoque_notificacao(self, todos=False):
+        """
+        Verifica o estoque e entrega os alertas ao despachante, que os junta em
+        uma notificação. Só avisa dos remédios (de todos os pacientes) que subiram
+        de nível de alerta desde a última verificação; com 'todos', avisa de todos
+        os do paciente da lista que estão no limite e sem esperar o intervalo entre
+        notificações (botão de teste).
+        """
+        if not self.notificador:
+            return
+
+        logger.debug("Executando verificação de estoque (notificação).")
+        
+        try:
+            alertas = (self.servico.verificar_alertas(self.paciente_id) if todos
+                       else self.servico.verificar_alertas_novos(registrar=False))
+            for alerta in alertas:
+                logger.info("Estoque baixo detectado para: %s", alerta.nome)
+            self.notificador.enviar(alertas, forcar=todos)
+                        
+            logger.debug("Verificação de notificações concluída.")
+
+        except sqlite3.Error as e:
+            logger.error("Erro na verificação de notificações (SQLite): %s", e)
         except Exception as e:
-            print(f"Erro ao tentar MOSTRAR notificação: {e}")
+            logger.exception("Erro inesperado na verificação de notificações: %s", e)
+
+    def _tarefa_alertas(self, todos=False):
+        """
+        Verifica os alertas (na thread do agendador) e calcula o próximo dia em que
+        algum remédio sobe de nível; a virada desse dia verifica de novo. Mudanças
+        de estoque antecipam a verificação (_estoque_mudou).
+        """
+        self._verificar_estoque_notificacao(todos)
+        try:
+            self._proximo_prazo = self.servico.proximo_prazo_alerta()
+        except sqlite3.Error as e:
+            logger.error("Erro ao calcular o próximo prazo de alerta: %s", e)
+
+    def _estoque_mudou(self):
+        """Antecipa a verificação de alertas depois de uma escrita confirmada."""
+        if self.notificador:
+            self.agendador.agendar_em(
+                "alertas", ATRASO_MUDANCA_ESTOQUE_S, self._tarefa_alertas
+            )
 
     def testar_notificacao_agora(self):
         """Força uma verificação de estoque (para testes)."""
-        if not NOTIFIER_AVAILABLE:
+        if not self.notificador:
             messagebox.showwarning("Notificações Desabilitadas",
-                                 "A biblioteca 'win10toast' não foi encontrada. As notificações estão desativadas.")
+                                 "A biblioteca 'win10toast' não foi encontrada. As notificações estão desativadas.\n\nUse --notificacoes=arquivo para gravá-las em um arquivo.")
             return
 
         messagebox.showinfo("Teste de Notificação", 
-                            "Verificação de estoque em segundo plano iniciada.\n\nSe houver remédios com 5 dias ou menos de estoque, você receberá uma notificação em alguns segundos.")
+                            "Verificação de estoque em segundo plano iniciada.\n\nSe houver remédios dentro do limite de alerta configurado, você receberá uma notificação em alguns segundos.")
         
-        threading.Thread(target=self._verificar_estoque_notificacao).start()
+        # Antecipa a verificação agendada para agora
+        self.agendador.agendar_em("alertas", 0, lambda: self._tarefa_alertas(todos=True))
 
     # --- Funções do Ícone da Bandeja (System Tray) ---
 
     def setup_tray_icon(self):
-        """Configura o ícone na bandeja do sistema."""
+        """Configura o ícone na bandeja do sistema (em uma thread, que também importa o pystray)."""
+        threading.Thread(target=self._executar_bandeja, daemon=True).start()
+
+    def _executar_bandeja(self):
+        """
+        Decodifica o cardiogram.png uma vez só, com o Pillow (fora da thread da
+        interface): a mesma imagem é o ícone da bandeja e o da janela.
+        """
         try:
-            image_path = resource_path("cardiogram.png")
-            image = Image.open(image_path)
+            from pystray import Icon as TrayIcon, Menu, MenuItem
+            from PIL import Image
+
+            image = Image.open(resource_path("cardiogram.png"))
+            image.load()
+            self.root.after(0, self._usar_icone, image)
             
             menu = Menu(
                 MenuItem('Abrir Gerenciador', self.on_menu_mostrar, default=True),
+                MenuItem('Diagnóstico', self.on_menu_diagnostico),
                 MenuItem('Sair', self.on_menu_sair)
             )
             
             self.tray_icon = TrayIcon("GerenciadorRemedios", image, "Gerenciador de Remédios", menu)
-            
-            threading.Thread(target=self.tray_icon.run, daemon=True).start()
-            
         except Exception as e:
-            print(f"Erro ao criar ícone da bandeja: {e}")
-            global TRAY_AVAILABLE
-            TRAY_AVAILABLE = False
-            self.root.protocol("WM_DELETE_WINDOW", self.sair_app)
+            logger.error("Erro ao criar ícone da bandeja: %s", e)
+            self.root.after(0, self._bandeja_indisponivel)
+            return
+        self.tray_icon.run()
+
+    def _usar_icone(self, image):
+        """Na thread da interface: a imagem já decodificada para a bandeja vira o ícone das janelas."""
+        try:
+            from PIL import ImageTk
+            self._icone_janela = ImageTk.PhotoImage(image)
+            self.root.iconphoto(True, self._icone_janela)
+        except (ImportError, tk.TclError) as e:
+            logger.warning("Não foi possível usar o ícone da bandeja na janela: %s", e)
+            self._icone_janela = definir_icone_janela(self.root)
+
+    def _bandeja_indisponivel(self):
+        """Sem bandeja, fechar a janela sai do programa (e ela não pode ficar escondida)."""
+        global TRAY_AVAILABLE
+        TRAY_AVAILABLE = False
+        if self._icone_janela is None:
+            self._icone_janela = definir_icone_janela(self.root)
+        self.root.protocol("WM_DELETE_WINDOW", self.sair_app)
+        self.mostrar_janela()
 
     def on_menu_mostrar(self):
         """Chamado pela thread do pystray para agendar 'mostrar_janela'."""
         self.root.after(0, self.mostrar_janela)
 
+    def on_menu_diagnostico(self):
+        """Chamado pela thread do pystray para agendar 'mostrar_diagnostico'."""
+        self.root.after(0, self.mostrar_diagnostico)
+
+    def mostrar_diagnostico(self):
+        """Grava todas as métricas no log e mostra as operações que mais somaram tempo."""
+        logger.info("Métricas:\n%s", metricas.resumo())
+        messagebox.showinfo(
+            "Diagnóstico",
+            f"{metricas.resumo(LINHAS_DIAGNOSTICO)}\n\nMétricas completas gravadas em:\n{ARQUIVO_LOG}"
+        )
+
     def on_menu_sair(self):
         """Chamado pela thread do pystray para agendar 'sair_app'."""
         self.root.after(0, self.sair_app)
@@ -681,38 +1304,113 @@ class App:
         self.root.lift()
         self.root.focus_force()
 
+    def atender_outra_instancia(self, pedido):
+        """Pedido de uma segunda instância do programa (chega na thread da trava de instância)."""
+        if pedido == MOSTRAR:
+            logger.info("Programa aberto de novo; mostrando a janela.")
+            self.root.after(0, self.mostrar_janela)
+
     def sair_app(self):
         """Fecha o aplicativo completamente (de forma segura)."""
-        print("Fechando aplicativo...")
+        logger.info("Fechando aplicativo.")
+        logger.info("Métricas:\n%s", metricas.resumo())
         
         if self.tray_icon and TRAY_AVAILABLE:
             self.tray_icon.stop()
-            print("Ícone da bandeja parado.")
+            logger.info("Ícone da bandeja parado.")
         
-        if self.db_conn:
-            self.db_conn.close()
-            print("Conexão DB fechada.")
+        self.agendador.parar()
+        if self.notificador and self.notificador.pendentes():
+            logger.info("%d alerta(s) não exibido(s); voltam na próxima verificação.", self.notificador.pendentes())
+
+        if self.servidor_api:
+            self.servidor_api.parar()
+            logger.info("API parada.")
+
+        # Grava o que ainda estiver na fila antes de fechar as conexões
+        self.escritor.parar()
+        logger.info("Fila de escrita esvaziada.")
+
+        if self.db:
+            self.db.fechar_todas()
+            logger.info("Conexões DB fechadas.")
             
-        print("Agendando destruição da janela em 100ms...")
+        logger.debug("Agendando destruição da janela em 100ms.")
         self.root.after(100, self.root.destroy)
 
 
-if __name__ == "__main__":
-    root = tk.Tk()
-    
-    icon_image = None
+def linhas_fora_de_ordem(atual, nova):
+    """
+    Ids de 'atual' (a ordem exibida) que precisam mudar de lugar para a lista
+    ficar na ordem de 'nova' (os mesmos ids, na ordem certa): todos menos a
+    maior sequência de 'atual' que já está na ordem de 'nova'. Mover só esses
+    é o mínimo de movimentos.
+    """
+    posicoes = {iid: posicao for posicao, iid in enumerate(nova)}
+    # Maior subsequência crescente das posições novas, na ordem exibida (O(n log n))
+    finais, indices_finais, anteriores = [], [], []
+    for indice, iid in enumerate(atual):
+        posicao = posicoes[iid]
+        k = bisect.bisect_left(finais, posicao)
+        if k == len(finais):
+            finais.append(posicao)
+            indices_finais.append(indice)
+        else:
+            finais[k] = posicao
+            indices_finais[k] = indice
+        anteriores.append(indices_finais[k - 1] if k else -1)
+
+    ficam = set()
+    indice = indices_finais[-1] if indices_finais else -1
+    while indice >= 0:
+        ficam.add(atual[indice])
+        indice = anteriores[indice]
+    return {iid for iid in atual if iid not in ficam}
+
+
+def definir_icone_janela(root):
+    """
+    Usa o cardiogram.png como ícone de todas as janelas quando não há bandeja
+    (com ela, o ícone vem da imagem da bandeja; ver App._executar_bandeja). O
+    próprio Tk decodifica o PNG (sem importar o Pillow); a imagem retornada
+    precisa continuar referenciada.
+    """
     try:
-        png_path = resource_path("cardiogram.png")
-        pil_image = Image.open(png_path)
-        icon_image = ImageTk.PhotoImage(pil_image)
+        icon_image = tk.PhotoImage(file=resource_path("cardiogram.png"))
         root.iconphoto(True, icon_image)
-    except Exception as e:
-        print(f"Não foi possível carregar o ícone .png da janela: {e}")
+        return icon_image
+    except tk.TclError as e:
+        logger.warning("Não foi possível carregar o ícone .png da janela: %s", e)
         try:
             icon_path = resource_path("cardiogram.ico")
             root.iconbitmap(icon_path)
         except Exception as e2:
-            print(f"Também falhou ao carregar o .ico: {e2}")
-            
+            logger.warning("Também falhou ao carregar o .ico: %s", e2)
+    return None
+
+
+def _fim_do_inicio():
+    perfil.marcar("primeira exibição")
+    perfil.relatorio()
+
+
+if __name__ == "__main__":
+    configurar_diagnostico()
+    perfil.marcar("importações")
+    # Com o programa já aberto (ex.: o .bat do login e um clique no atalho), a
+    # segunda instância só pede para a primeira aparecer e termina antes de criar o Tk
+    instancia = InstanciaUnica(DB_PATH)
+    if not instancia.adquirir(CONFERIR if "--minimized" in sys.argv else MOSTRAR):
+        sys.exit(0)
+    perfil.marcar("trava de instância")
+    root = tk.Tk()
+    perfil.marcar("janela Tk")
+    # Com a bandeja, o PNG é decodificado uma vez, na thread dela, para os dois ícones
+    icon_image = None if TRAY_AVAILABLE else definir_icone_janela(root)
+    perfil.marcar("ícone")
+
     app = App(root)
-    root.mainloop()
\ No newline at end of file
+    instancia.atender(app.atender_outra_instancia)
+    root.after_idle(_fim_do_inicio)
+    root.mainloop()
+    instancia.liberar()
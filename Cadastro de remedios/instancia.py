@@ -0,0 +1,134 @@
+"""
+Uma só janela do programa por banco de dados.
+
+A primeira instância ocupa uma porta TCP em 127.0.0.1 (calculada a partir do
+caminho do banco, então cada usuário e cada banco têm a sua) e fica ouvindo
+nela. Uma segunda instância não consegue ocupar a porta: em vez de abrir
+outra janela, conecta nela, pede para a primeira mostrar a janela e
+termina. A porta é liberada pelo sistema quando o processo termina, mesmo
+que ele feche de forma abrupta, então não há arquivo de trava esquecido.
+"""
+import logging
+import socket
+import sys
+import threading
+import zlib
+
+PORTA_BASE = 47200
+FAIXA_PORTAS = 500
+TEMPO_RESPOSTA_S = 5 # Espera pela resposta da primeira instância (ela pode estar iniciando)
+
+MOSTRAR = "mostrar" # Pede para a primeira instância mostrar a janela
+CONFERIR = "conferir" # Só confere se há uma instância (ex.: início minimizado)
+
+logger = logging.getLogger(__name__)
+
+
+def porta_do_banco(caminho_banco):
+    """Porta da trava do banco: a mesma para o mesmo caminho, diferente (quase sempre) para outros."""
+    return PORTA_BASE + zlib.crc32(caminho_banco.encode("utf-8")) % FAIXA_PORTAS
+
+
+class InstanciaUnica:
+    """Trava de instância única por socket, com repasse de pedidos à instância que já está aberta."""
+
+    def __init__(self, caminho_banco, porta=None):
+        self.caminho_banco = caminho_banco
+        self.porta = porta if porta is not None else porta_do_banco(caminho_banco)
+        self._socket = None
+        self._ao_pedido = None
+        self._pedidos_antes = [] # Pedidos que chegaram antes de atender() ser chamado
+        self._trava = threading.Lock()
+
+    def adquirir(self, pedido=MOSTRAR):
+        """
+        Tenta ser a instância principal. Retorna True se conseguiu (ou se não deu
+        para saber: aí o programa segue como antes, sem trava). Retorna False se
+        outra instância deste banco já está aberta; ela recebe o 'pedido'.
+        """
+        servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if sys.platform == "win32":
+            # Sem isso o Windows deixa outro processo ocupar a mesma porta
+            servidor.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        else:
+            # Nos outros sistemas só permite reabrir a porta logo depois de fechar
+            # (conexões em TIME_WAIT); duas instâncias ouvindo continua impossível
+            servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            servidor.bind(("127.0.0.1", self.porta))
+            servidor.listen(5)
+        except OSError:
+            servidor.close()
+            return not self._repassar(pedido)
+
+        self._socket = servidor
+        threading.Thread(target=self._ouvir, name="instancia", daemon=True).start()
+        return True
+
+    def _repassar(self, pedido):
+        """Envia o pedido à instância que ocupa a porta. Retorna True se ela é deste banco e respondeu."""
+        try:
+            with socket.create_connection(("127.0.0.1", self.porta), timeout=TEMPO_RESPOSTA_S) as conexao:
+                conexao.sendall(f"{pedido} {self.caminho_banco}\n".encode("utf-8"))
+                resposta = conexao.makefile("r", encoding="utf-8").readline().strip()
+        except OSError as e:
+            logger.warning("A porta %d da trava de instância está ocupada, mas não respondeu (%s). "
+                           "Seguindo sem a trava.", self.porta, e)
+            return False
+        if resposta != "ok":
+            logger.warning("A porta %d da trava de instância é usada por outro programa. Seguindo sem a trava.",
+                           self.porta)
+            return False
+        logger.info("Outra instância já está aberta; pedido '%s' repassado a ela.", pedido)
+        return True
+
+    def atender(self, ao_pedido):
+        """
+        Passa a entregar os pedidos das próximas instâncias a 'ao_pedido(pedido)'
+        (chamada na thread da trava). Os que chegaram antes são entregues agora.
+        """
+        with self._trava:
+            self._ao_pedido = ao_pedido
+            pedidos, self._pedidos_antes = self._pedidos_antes, []
+        for pedido in pedidos:
+            ao_pedido(pedido)
+
+    def _ouvir(self):
+        while True:
+            try:
+                conexao, _ = self._socket.accept()
+            except OSError:
+                return # Socket fechado em liberar()
+            with conexao:
+                try:
+                    conexao.settimeout(TEMPO_RESPOSTA_S)
+                    pedido, _, caminho = conexao.makefile("r", encoding="utf-8").readline().strip().partition(" ")
+                    if caminho != self.caminho_banco:
+                        conexao.sendall(b"outro\n")
+                        continue
+                    conexao.sendall(b"ok\n")
+                except OSError as e:
+                    logger.debug("Conexão na trava de instância falhou: %s", e)
+                    continue
+            self._entregar(pedido)
+
+    def _entregar(self, pedido):
+        with self._trava:
+            ao_pedido = self._ao_pedido
+            if ao_pedido is None:
+                self._pedidos_antes.append(pedido)
+                return
+        try:
+            ao_pedido(pedido)
+        except Exception:
+            logger.exception("Erro ao atender pedido '%s' de outra instância.", pedido)
+
+    def liberar(self):
+        """Libera a porta (a próxima instância passa a ser a principal)."""
+        if self._socket is not None:
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR) # Acorda o accept() da thread
+            except OSError:
+                pass
+            self._socket.close()
+            self._socket = None
@@ -0,0 +1,162 @@
+"""
+Lembretes dos horários das doses.
+
+Um único heap guarda a próxima ocorrência de cada horário, de todos os
+remédios, e só a primeira tem um temporizador: a tarefa "lembretes" do
+Agendador, remarcada para o novo topo a cada mudança. Parado, o motor não
+custa nada além dessa tarefa (nenhuma consulta ao banco, nenhum
+'root.after' por dose). Cada disparo retira do heap as doses vencidas (as
+do mesmo minuto saem juntas, em um lembrete só), pergunta ao banco quais
+ainda não foram tomadas e devolve cada horário ao heap na sua próxima
+ocorrência.
+"""
+import heapq
+import logging
+import threading
+from datetime import date, datetime, time, timedelta
+
+from diagnostico import metricas
+
+TAREFA = "lembretes" # Nome da tarefa no Agendador
+TAREFA_CARGA = "lembretes_carga" # Separada: armar o temporizador antes da carga não a substitui
+
+logger = logging.getLogger(__name__)
+
+# Posições de uma entrada do heap. Os horários têm ids únicos, então a
+# comparação das entradas nunca passa do id (as outras posições podem mudar).
+QUANDO, HORARIO, REMEDIO, MINUTO, DIA, ATIVA = range(6)
+
+
+class MotorLembretes:
+    """Heap das próximas doses de todos os remédios, com um único temporizador no Agendador."""
+
+    def __init__(self, servico, agendador, ao_lembrar, relogio=None):
+        """
+        'ao_lembrar(doses)' recebe, na thread do agendador, as Dose de cada disparo
+        que ainda não foram tomadas (doses de dias anteriores, de quando o
+        computador estava desligado ou suspenso, não são lembradas).
+        """
+        self.servico = servico
+        self.agendador = agendador
+        self.ao_lembrar = ao_lembrar
+        self.relogio = relogio or agendador.relogio
+        self._heap = []
+        self._entradas = {} # horario_id -> entrada ativa no heap
+        self._por_remedio = {} # remedio_id -> ids dos horários
+        self._inativas = 0 # Entradas descartadas que ainda estão no heap
+        self._trava = threading.Lock()
+
+    def iniciar(self):
+        """Carrega os horários na thread do agendador (sem atrasar quem chamou) e arma o temporizador."""
+        self.agendador.agendar_em(TAREFA_CARGA, 0, self.recarregar)
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def proximo(self):
+        """Horário (timestamp) do próximo lembrete, ou None."""
+        with self._trava:
+            self._limpar_topo()
+            return self._heap[0][QUANDO] if self._heap else None
+
+    @metricas.cronometrar("lembretes.carga")
+    def recarregar(self):
+        """Relê todos os horários do banco e remonta o heap (a virada do dia também recarrega)."""
+        horarios = list(self.servico.listar_horarios())
+        agora = self.relogio()
+        with self._trava:
+            self._heap, self._entradas, self._por_remedio, self._inativas = [], {}, {}, 0
+            ocorrencias = {}
+            for horario_id, remedio_id, minuto in horarios:
+                self._heap.append(self._criar_entrada(horario_id, remedio_id, minuto, agora, ocorrencias))
+            heapq.heapify(self._heap)
+            self._armar()
+        logger.info("Lembretes: %d horário(s) carregado(s).", len(horarios))
+
+    def atualizar_remedio(self, remedio_id, horarios):
+        """
+        Troca os horários do remédio no heap ('horarios' como os de
+        ServicoEstoque.horarios; vazio quando o remédio é removido).
+        """
+        agora = self.relogio()
+        with self._trava:
+            for horario_id in self._por_remedio.pop(remedio_id, ()):
+                self._entradas.pop(horario_id)[ATIVA] = False
+                self._inativas += 1
+            ocorrencias = {}
+            for horario_id, minuto, _ in horarios:
+                heapq.heappush(self._heap, self._criar_entrada(horario_id, remedio_id, minuto, agora, ocorrencias))
+            if self._inativas > len(self._heap) // 2:
+                self._compactar()
+            self._armar()
+
+    def _disparar(self):
+        """Tarefa do agendador: lembra as doses vencidas e remarca cada horário."""
+        agora = self.relogio()
+        hoje = date.fromtimestamp(agora)
+        vencidas = []
+        with self._trava:
+            ocorrencias = {}
+            while self._heap and self._heap[0][QUANDO] <= agora:
+                entrada = heapq.heappop(self._heap)
+                if not entrada[ATIVA]:
+                    self._inativas -= 1
+                    continue
+                if entrada[DIA] == hoje:
+                    vencidas.append(entrada[HORARIO])
+                heapq.heappush(self._heap, self._criar_entrada(
+                    entrada[HORARIO], entrada[REMEDIO], entrada[MINUTO], agora, ocorrencias
+                ))
+            self._armar()
+
+        if not vencidas:
+            return
+        doses = self.servico.doses_pendentes(vencidas, hoje)
+        metricas.contar("lembretes.doses", len(doses))
+        if doses:
+            self.ao_lembrar(doses)
+
+    def _criar_entrada(self, horario_id, remedio_id, minuto, agora, ocorrencias):
+        """
+        Entrada da próxima ocorrência do horário depois de 'agora' (e a registra
+        como a ativa). 'ocorrencias' guarda as já calculadas para o mesmo 'agora':
+        há no máximo uma por minuto do dia, por mais horários que existam.
+        """
+        if minuto not in ocorrencias:
+            ocorrencias[minuto] = self._ocorrencia(minuto, agora)
+        quando, dia = ocorrencias[minuto]
+        entrada = [quando, horario_id, remedio_id, minuto, dia, True]
+        self._entradas[horario_id] = entrada
+        self._por_remedio.setdefault(remedio_id, set()).add(horario_id)
+        return entrada
+
+    @staticmethod
+    def _ocorrencia(minuto, agora):
+        """(timestamp, dia) da primeira vez em que o relógio marca o 'minuto' do dia depois de 'agora'."""
+        dia = date.fromtimestamp(agora)
+        horario = time(minuto // 60, minuto % 60)
+        # Pela data e hora locais, e não meia-noite + minutos: certo também nos dias de horário de verão
+        quando = datetime.combine(dia, horario).timestamp()
+        if quando <= agora:
+            dia += timedelta(days=1)
+            quando = datetime.combine(dia, horario).timestamp()
+        return quando, dia
+
+    def _limpar_topo(self):
+        while self._heap and not self._heap[0][ATIVA]:
+            heapq.heappop(self._heap)
+            self._inativas -= 1
+
+    def _compactar(self):
+        """Tira do heap as entradas descartadas (quando já são mais da metade)."""
+        self._heap = [entrada for entrada in self._heap if entrada[ATIVA]]
+        heapq.heapify(self._heap)
+        self._inativas = 0
+
+    def _armar(self):
+        """Marca a tarefa do agendador para a primeira dose do heap (ou a cancela)."""
+        self._limpar_topo()
+        if self._heap:
+            self.agendador.agendar(TAREFA, self._heap[0][QUANDO], self._disparar)
+        else:
+            self.agendador.cancelar(TAREFA)
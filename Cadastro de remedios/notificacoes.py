@@ -0,0 +1,245 @@
+"""
+Despacho das notificações de estoque baixo e dos lembretes de doses.
+
+Os alertas de uma verificação viram uma única notificação (um resumo com
+no máximo 'max_itens' remédios), e entre duas notificações passa pelo menos
+'intervalo_minimo_s': o que chegar antes disso espera e é juntado ao próximo
+resumo. Os lembretes de doses têm hora certa: saem na hora, também em um
+resumo por disparo. Quem exibe é um backend trocável: o toast do Windows,
+um arquivo de log, o console ou uma lista em memória (para testes, em
+qualquer sistema).
+"""
+import importlib.util
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from diagnostico import metricas
+from remedios_core import formatar_minuto, mensagem_alerta, nome_alerta, unidade_plural
+
+logger = logging.getLogger(__name__)
+
+MAX_ITENS_RESUMO = 5 # Remédios listados por extenso em um resumo
+INTERVALO_MINIMO_S = 60 # Tempo mínimo entre duas notificações
+ESPERA_BACKEND_OCUPADO_S = 15 # Nova tentativa quando o backend ainda mostra a anterior
+ARQUIVO_NOTIFICACOES = os.path.join(os.path.expanduser("~"), "remedios_notificacoes.log") # Para 'arquivo' sem caminho
+
+
+class BackendToast:
+    """
+    Exibe as notificações com o win10toast (um toast por vez). Sem 'toaster',
+    o win10toast só é importado na primeira notificação. Sem 'em_thread',
+    exibir() só volta quando o toast sai da tela (para processos que terminam
+    logo depois, como o --check).
+    """
+
+    def __init__(self, toaster=None, icon_path=None, duracao=10, em_thread=True):
+        self.toaster = toaster
+        self.icon_path = icon_path
+        self.duracao = duracao
+        self.em_thread = em_thread
+
+    def exibir(self, titulo, mensagem):
+        if self.toaster is None:
+            from win10toast import ToastNotifier
+            self.toaster = ToastNotifier()
+        # Com threaded=True o win10toast devolve False se ainda houver um toast na tela
+        return self.toaster.show_toast(
+            title=titulo,
+            msg=mensagem,
+            duration=self.duracao,
+            icon_path=self.icon_path,
+            threaded=self.em_thread
+        ) is not False
+
+
+class BackendArquivo:
+    """Acrescenta as notificações a um arquivo de texto."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._trava = threading.Lock()
+
+    def exibir(self, titulo, mensagem):
+        with self._trava, open(self.caminho, "a", encoding="utf-8") as arquivo:
+            arquivo.write(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {titulo}\n{mensagem}\n\n")
+        return True
+
+
+class BackendConsole:
+    """Escreve as notificações na saída padrão (sem console, como no pythonw.exe, não aparecem)."""
+
+    def exibir(self, titulo, mensagem):
+        if sys.stdout is not None:
+            print(f"{titulo}\n{mensagem}\n", flush=True)
+        return True
+
+
+class BackendMemoria:
+    """Guarda as notificações em uma lista (para testes)."""
+
+    def __init__(self):
+        self.exibidas = []
+
+    def exibir(self, titulo, mensagem):
+        self.exibidas.append((titulo, mensagem))
+        return True
+
+
+def criar_backend(especificacao, icon_path=None, em_thread=True):
+    """
+    Backend de uma opção de linha de comando: 'toast', 'arquivo[:caminho]' ou
+    'console'. Retorna None para o toast se o win10toast não estiver instalado;
+    levanta ValueError se a especificação for desconhecida.
+    """
+    nome, _, caminho = especificacao.partition(":")
+    if nome == "toast":
+        if importlib.util.find_spec("win10toast") is None:
+            return None
+        return BackendToast(icon_path=icon_path, em_thread=em_thread)
+    if nome == "arquivo":
+        return BackendArquivo(caminho or ARQUIVO_NOTIFICACOES)
+    if nome == "console":
+        return BackendConsole()
+    raise ValueError(f"Destino de notificações desconhecido: '{especificacao}'. Use toast, arquivo[:caminho] ou console.")
+
+
+def montar_resumo(alertas, max_itens=MAX_ITENS_RESUMO):
+    """Título e texto de uma notificação com todos os alertas (os mais urgentes primeiro)."""
+    if len(alertas) == 1:
+        return mensagem_alerta(alertas[0])
+
+    alertas = sorted(alertas, key=lambda alerta: (-alerta.nivel, alerta.dias_restantes, alerta.nome))
+    linhas = [f"{nome_alerta(alerta)}: {alerta.estoque} {unidade_plural(alerta.unidade, alerta.estoque)} ({alerta.dias_restantes} dias)"
+              for alerta in alertas[:max_itens]]
+    if len(alertas) > max_itens:
+        linhas.append(f"... e mais {len(alertas) - max_itens}.")
+    return f"{len(alertas)} remédios com estoque baixo!", "\n".join(linhas)
+
+
+def montar_lembrete(doses, max_itens=MAX_ITENS_RESUMO):
+    """Título e texto do lembrete das doses (Dose) que venceram juntas."""
+    linhas = [f"{formatar_minuto(dose.minuto)} {nome_alerta(dose)}: "
+              f"{dose.quantidade} {unidade_plural(dose.unidade, dose.quantidade)}"
+              for dose in doses[:max_itens]]
+    if len(doses) > max_itens:
+        linhas.append(f"... e mais {len(doses) - max_itens}.")
+    titulo = "Hora do remédio!" if len(doses) == 1 else f"Hora de {len(doses)} remédios!"
+    return titulo, "\n".join(linhas)
+
+
+class Despachante:
+    """Junta os alertas em resumos e limita quantas notificações são exibidas."""
+
+    def __init__(self, backend, agendador=None, max_itens=MAX_ITENS_RESUMO,
+                 intervalo_minimo_s=INTERVALO_MINIMO_S, relogio=time.time, ao_exibir=None):
+        """
+        'agendador' (um Agendador) exibe os alertas que ficaram esperando assim que
+        o intervalo passar; sem ele, eles saem junto com o próximo envio.
+        'ao_exibir(alertas)' recebe os Alerta de cada resumo exibido (para gravar
+        os níveis avisados só depois que o aviso de fato saiu).
+        """
+        self.backend = backend
+        self.agendador = agendador
+        self.ao_exibir = ao_exibir
+        self.max_itens = max_itens
+        self.intervalo_minimo_s = intervalo_minimo_s
+        self.relogio = relogio
+        self._pendentes = {} # remedio_id -> Alerta (o mais recente de cada remédio)
+        self._doses_pendentes = {} # (horario_id, dia) -> Dose ainda não exibida
+        self._ultima_exibicao = None
+        self._trava = threading.Lock()
+
+    def enviar(self, alertas, forcar=False):
+        """Enfileira os alertas de uma verificação; 'forcar' ignora o intervalo mínimo."""
+        with self._trava:
+            for alerta in alertas:
+                self._pendentes[alerta.remedio_id] = alerta
+            if not self._pendentes:
+                return
+
+            agora = self.relogio()
+            if not forcar and self._ultima_exibicao is not None:
+                espera = self._ultima_exibicao + self.intervalo_minimo_s - agora
+                if espera > 0:
+                    metricas.contar("notificacoes.adiadas")
+                    self._agendar_descarga(espera)
+                    return
+            # O backend e 'ao_exibir' (que grava no banco) rodam fora da trava: os
+            # alertas saem da fila aqui e voltam para ela se a exibição falhar
+            alertas = self._pendentes
+            self._pendentes = {}
+            anterior, self._ultima_exibicao = self._ultima_exibicao, agora
+        self._exibir(alertas, agora, anterior)
+
+    def lembrar(self, doses):
+        """
+        Exibe já o lembrete das doses, sem esperar o intervalo mínimo dos alertas.
+        Se o backend estiver ocupado, as doses esperam e saem junto com as próximas.
+        """
+        with self._trava:
+            for dose in doses:
+                self._doses_pendentes[dose.horario_id, dose.dia] = dose
+            if not self._doses_pendentes:
+                return
+            pendentes = self._doses_pendentes
+            self._doses_pendentes = {}
+
+        doses = sorted(pendentes.values(), key=lambda dose: (dose.dia, dose.minuto, dose.nome))
+        titulo, mensagem = montar_lembrete(doses, self.max_itens)
+        try:
+            exibida = self.backend.exibir(titulo, mensagem)
+        except Exception as e:
+            logger.error("Erro ao tentar mostrar lembrete: %s", e)
+            exibida = False
+
+        if not exibida:
+            with self._trava:
+                for chave, dose in pendentes.items():
+                    self._doses_pendentes.setdefault(chave, dose)
+            if self.agendador is not None:
+                self.agendador.agendar_em("lembretes_pendentes", ESPERA_BACKEND_OCUPADO_S, lambda: self.lembrar(()))
+            return
+        logger.info("Lembrete exibido: %s (%d dose(s))", titulo, len(doses))
+        metricas.contar("notificacoes.lembretes")
+
+    def pendentes(self):
+        """Quantos alertas ainda esperam para ser exibidos."""
+        with self._trava:
+            return len(self._pendentes)
+
+    def _descarregar(self):
+        self.enviar(())
+
+    def _agendar_descarga(self, segundos):
+        if self.agendador is not None:
+            self.agendador.agendar_em("notificacoes", segundos, self._descarregar)
+
+    def _exibir(self, alertas, agora, ultima_exibicao_anterior):
+        """Mostra o resumo de 'alertas' (já fora da fila); se falhar, eles voltam para a fila."""
+        titulo, mensagem = montar_resumo(list(alertas.values()), self.max_itens)
+        try:
+            exibida = self.backend.exibir(titulo, mensagem)
+        except Exception as e:
+            logger.error("Erro ao tentar mostrar notificação: %s", e)
+            exibida = False
+
+        if not exibida:
+            with self._trava:
+                # Um alerta mais novo do mesmo remédio, enviado enquanto isso, vale mais
+                for remedio_id, alerta in alertas.items():
+                    self._pendentes.setdefault(remedio_id, alerta)
+                if self._ultima_exibicao == agora: # Nenhuma outra exibição saiu enquanto isso
+                    self._ultima_exibicao = ultima_exibicao_anterior
+                self._agendar_descarga(ESPERA_BACKEND_OCUPADO_S)
+            return
+        logger.info("Notificação exibida: %s (%d remédio(s))", titulo, len(alertas))
+        metricas.contar("notificacoes.exibidas")
+        if self.ao_exibir is not None:
+            try:
+                self.ao_exibir(list(alertas.values()))
+            except Exception as e:
+                logger.error("Erro ao registrar os alertas exibidos: %s", e)
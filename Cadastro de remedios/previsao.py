@@ -0,0 +1,100 @@
+"""
+Previsão de término de estoque em lote.
+
+Recebe todos os pares (estoque, doses_por_dia) de uma vez e calcula os dias
+restantes e a data prevista de fim com uma única data "hoje" como âncora.
+Usa NumPy quando disponível e cai para Python puro quando não.
+"""
+import importlib.util
+from array import array
+from datetime import date
+
+# O NumPy só é importado no primeiro lote grande: a importação sozinha
+# custa mais que o resto do início do programa
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+np = None
+
+# Marcadores usados no lugar dos dias restantes quando não há previsão
+SEM_ESTOQUE = -1 # estoque <= 0 ("Acabou!")
+SEM_PREVISAO = -2 # doses_por_dia <= 0 ("N/A")
+
+LIMITE_NUMPY = 256 # Abaixo disso, converter para arrays do NumPy não compensa
+
+
+def prever_lote(estoques, doses_por_dia, hoje=None):
+    """
+    Calcula os dias restantes e a data prevista de fim de cada item.
+
+    Retorna dois arrays do mesmo tamanho da entrada: os dias restantes
+    (ou SEM_ESTOQUE / SEM_PREVISAO) e o ordinal da data de fim
+    (date.toordinal(), 0 quando não há previsão).
+    """
+    if hoje is None:
+        hoje = date.today()
+    base = hoje.toordinal()
+
+    if NUMPY_AVAILABLE and len(estoques) >= LIMITE_NUMPY:
+        return _prever_numpy(estoques, doses_por_dia, base)
+    return _prever_python(estoques, doses_por_dia, base)
+
+
+def _carregar_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+def _prever_numpy(estoques, doses_por_dia, base):
+    _carregar_numpy()
+    estoques = np.asarray(estoques, dtype=np.int64)
+    doses_por_dia = np.asarray(doses_por_dia, dtype=np.int64)
+
+    validos = (doses_por_dia > 0) & (estoques > 0)
+    dias = np.where(estoques <= 0, SEM_ESTOQUE, SEM_PREVISAO).astype(np.int64)
+    np.floor_divide(estoques, doses_por_dia, out=dias, where=validos)
+    datas_fim = np.where(validos, dias + base, 0)
+    return dias, datas_fim
+
+
+def _prever_python(estoques, doses_por_dia, base):
+    dias = array('q')
+    datas_fim = array('q')
+    for estoque, doses_dia in zip(estoques, doses_por_dia):
+        if doses_dia > 0 and estoque > 0:
+            dias_restantes = estoque // doses_dia
+            dias.append(dias_restantes)
+            datas_fim.append(base + dias_restantes)
+        elif estoque <= 0:
+            dias.append(SEM_ESTOQUE)
+            datas_fim.append(0)
+        else:
+            dias.append(SEM_PREVISAO)
+            datas_fim.append(0)
+    return dias, datas_fim
+
+
+def _para_lista(valores):
+    return valores.tolist() if hasattr(valores, "tolist") else valores
+
+
+def formatar_previsoes(dias_restantes, datas_fim):
+    """
+    Converte o resultado de prever_lote nos textos da lista
+    ("12 dias", "dd/mm/YYYY"). Cada data só é formatada uma vez por chamada.
+    """
+    cache = {}
+    textos = []
+    for dias, data_fim in zip(_para_lista(dias_restantes), _para_lista(datas_fim)):
+        if dias >= 0:
+            texto = cache.get(dias)
+            if texto is None:
+                texto = cache[dias] = (f"{dias} dias", date.fromordinal(data_fim).strftime("%d/%m/%Y"))
+        elif dias == SEM_ESTOQUE:
+            texto = ("Acabou!", "N/A")
+        else:
+            texto = ("N/A", "N/A")
+        textos.append(texto)
+    return textos
+
@@ -0,0 +1,87 @@
+"""
+Cache em memória dos remédios carregados na lista.
+
+Guarda, por id, os valores de cada remédio já convertidos (números como
+int, a unidade como texto), para que a interface não precise reler o banco
+nem desmontar os textos exibidos ("10 comprimido") a cada clique. Os
+registros são atualizados no lugar a cada escrita confirmada e descartados
+quando a virada do dia debita o estoque.
+"""
+
+
+class Registro:
+    """Um remédio como a lista o mostra (as colunas de COLUNAS_LISTA)."""
+
+    __slots__ = ("id", "nome", "doses_por_dia", "estoque", "unidade")
+
+    def __init__(self, remedio_id, nome, doses_por_dia, estoque, unidade):
+        self.id = remedio_id
+        self.nome = nome
+        self.doses_por_dia = doses_por_dia
+        self.estoque = estoque
+        self.unidade = unidade
+
+    def com_estoque(self, estoque):
+        """Cópia do registro com outro estoque (para mostrar uma escrita ainda não confirmada)."""
+        return Registro(self.id, self.nome, self.doses_por_dia, estoque, self.unidade)
+
+    def __repr__(self):
+        return f"Registro({self.id}, {self.nome!r}, {self.doses_por_dia}, {self.estoque}, {self.unidade!r})"
+
+
+class CacheRegistros:
+    """Registros por id, usados só pela thread da interface."""
+
+    def __init__(self):
+        self._registros = {}
+
+    def __len__(self):
+        return len(self._registros)
+
+    def __contains__(self, remedio_id):
+        return remedio_id in self._registros
+
+    def obter(self, remedio_id):
+        """O registro do remédio, ou None se ele não estiver no cache."""
+        return self._registros.get(remedio_id)
+
+    def guardar(self, linhas):
+        """
+        Guarda as linhas (id, nome, doses_por_dia, estoque_atual, unidade) lidas do
+        banco, atualizando no lugar os registros que já existem. Retorna os
+        registros na mesma ordem das linhas.
+        """
+        registros = []
+        for remedio_id, nome, doses_por_dia, estoque, unidade in linhas:
+            registro = self._registros.get(remedio_id)
+            if registro is None:
+                registro = self._registros[remedio_id] = Registro(remedio_id, nome, doses_por_dia, estoque, unidade)
+            else:
+                registro.nome = nome
+                registro.doses_por_dia = doses_por_dia
+                registro.estoque = estoque
+                registro.unidade = unidade
+            registros.append(registro)
+        return registros
+
+    def igual(self, linha):
+        """Se o registro guardado tem os mesmos valores da linha (id, nome, doses_por_dia, estoque_atual, unidade)."""
+        registro = self._registros.get(linha[0])
+        return registro is not None and (
+            registro.nome, registro.doses_por_dia, registro.estoque, registro.unidade
+        ) == tuple(linha[1:])
+
+    def definir_estoque(self, remedio_id, estoque):
+        """Muda o estoque de um registro no lugar. Retorna o registro (None se não estiver no cache)."""
+        registro = self._registros.get(remedio_id)
+        if registro is not None:
+            registro.estoque = estoque
+        return registro
+
+    def remover(self, *ids):
+        for remedio_id in ids:
+            self._registros.pop(remedio_id, None)
+
+    def invalidar(self):
+        """Descarta todos os registros (ex.: depois do débito de um dia)."""
+        self._registros.clear()
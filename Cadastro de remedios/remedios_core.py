@@ -0,0 +1,1487 @@
+"""
+Núcleo do Gerenciador de Remédios, sem interface gráfica.
+
+Contém o esquema do banco, o débito diário, as previsões e a verificação
+de estoque baixo. Erros de validação e de banco viram exceções, e quem usa
+o núcleo (a janela Tk, scripts, benchmarks) decide como mostrá-los.
+"""
+import logging
+import os
+import re
+import sqlite3
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import previsao
+from diagnostico import metricas
+
+logger = logging.getLogger(__name__)
+
+# --- Configuração de Caminhos ---
+DB_PATH = os.path.join(os.path.expanduser("~"), "remedios.db")
+
+# --- Limites de Validação ---
+MAX_VALOR = 10_000_000 # limite para evitar overflow
+MAX_TAMANHO_NOME = 30
+
+# --- Configuração das Notificações ---
+LIMITE_DIAS_PADRAO = 5 # Dias restantes a partir dos quais um remédio gera alerta
+
+# --- Versão do Esquema ---
+VERSAO_ESQUEMA = 5 # Gravada em PRAGMA user_version; ver ServicoEstoque._MIGRACOES
+
+# --- Pacientes ---
+# Cada remédio pertence a um paciente (o nome só se repete entre pacientes). Quem
+# usa o programa para uma pessoa só fica sempre no paciente padrão.
+PACIENTE_PADRAO = 1
+NOME_PACIENTE_PADRAO = "Principal"
+
+# --- Modos de Armazenamento do Estoque ---
+# Cada remédio guarda o estoque que tinha na sua 'data_ancora'. O estoque de hoje é esse
+# valor menos as doses dos dias entre a âncora e a última verificação (app_info.last_run_date).
+MODO_DEBITO = "debito" # A virada do dia debita todas as linhas (âncora = última verificação)
+MODO_ANCORA = "ancora" # A virada do dia só move last_run_date; o estoque é calculado na leitura
+
+ESTOQUE_HOJE_SQL = """MAX(0, estoque_atual - doses_por_dia * COALESCE(
+    CAST(julianday((SELECT last_run_date FROM app_info WHERE id = 1)) AS INTEGER)
+    - CAST(julianday(data_ancora) AS INTEGER), 0))"""
+# Os remédios com horários (debito_por_dose) só perdem estoque quando uma dose é
+# tomada: a passagem dos dias não os debita, em nenhum dos dois modos. As migrações
+# anteriores aos horários usam ESTOQUE_HOJE_SQL, como foram publicadas.
+ESTOQUE_HOJE_DOSES_SQL = f"CASE WHEN debito_por_dose THEN estoque_atual ELSE {ESTOQUE_HOJE_SQL} END"
+
+# Colunas das linhas devolvidas pelas consultas da lista
+COLUNAS_LISTA = "id, nome, doses_por_dia, estoque_atual, unidade"
+
+# Ordenações da lista: chave -> expressão sobre 'remedios' (nunca NULL, porque a
+# paginação compara pares (chave, id)). 'fim' ordena pelos dias restantes e pela
+# data prevista do fim, que andam juntos; os remédios sem dose diária vão para o
+# fim da lista. Os índices são por paciente, (paciente_id, chave). Só o estoque
+# não tem índice: no modo âncora o estoque de hoje é calculado, e no modo débito
+# o índice seria reescrito em toda linha a cada dia.
+DIA_SEM_FIM = 9_999_999 # Dia juliano depois de qualquer data
+ORDENACOES = {
+    "nome": "nome COLLATE NOCASE",
+    "doses": "doses_por_dia",
+    "estoque": None, # Depende do modo de armazenamento; ver _chave_ordenacao
+    "fim": f"COALESCE(dia_fim, {DIA_SEM_FIM})",
+}
+
+# Busca por nome: o índice FTS5 separa o nome em palavras sem acentos nem
+# maiúsculas ("Dipirona Sódica" -> "dipirona", "sodica"); a busca casa o começo
+# das palavras. O 'prefix' guarda os prefixos curtos prontos no índice.
+TOKENIZADOR_BUSCA = "unicode61 remove_diacritics 2"
+PREFIXOS_BUSCA = "1 2 3"
+
+# Diferença entre o dia juliano do SQLite (CAST(julianday(...) AS INTEGER)) e date.toordinal()
+DIFERENCA_JULIANO = 1721424
+
+# Nomes por consulta "IN (...)" (o SQLite limita os parâmetros de um comando)
+TAMANHO_LOTE_CONSULTA = 500
+
+# Formato das datas do histórico: texto de tamanho fixo, que ordena como as datas.
+# Assim o índice (remedio_id, data_adicao) responde consultas por intervalo.
+FORMATO_DATA = "%Y-%m-%d %H:%M:%S"
+
+# Chave de agrupamento de cada período dos totais do histórico
+PERIODOS = {
+    "dia": "substr(data_adicao, 1, 10)",
+    "semana": "strftime('%Y-S%W', data_adicao)",
+    "mes": "substr(data_adicao, 1, 7)",
+    "ano": "substr(data_adicao, 1, 4)",
+}
+
+# Níveis de alerta de um remédio, do menos para o mais grave. O último nível
+# notificado fica em remedios.nivel_alerta: só uma subida de nível gera notificação.
+NIVEL_NENHUM = 0
+NIVEL_LIMITE = 1 # Dias restantes dentro do limite de alerta
+NIVEL_ULTIMO_DIA = 2 # O estoque não cobre mais um dia inteiro
+
+NIVEL_SQL = f"""CASE
+    WHEN estoque_atual <= 0 OR doses_por_dia <= 0 THEN {NIVEL_NENHUM}
+    WHEN estoque_atual / doses_por_dia = 0 THEN {NIVEL_ULTIMO_DIA}
+    WHEN estoque_atual / doses_por_dia <= limite_dias THEN {NIVEL_LIMITE}
+    ELSE {NIVEL_NENHUM} END"""
+
+# 'paciente' só vem preenchido quando há mais de um paciente cadastrado
+Alerta = namedtuple(
+    "Alerta", "remedio_id nome estoque unidade dias_restantes nivel paciente", defaults=(NIVEL_LIMITE, None)
+)
+PACIENTE_ALERTA_SQL = """CASE WHEN (SELECT COUNT(*) FROM pacientes) > 1
+    THEN (SELECT nome FROM pacientes WHERE id = paciente_id) END"""
+
+# Consumo observado nas reposições comparado com o prescrito. Intervalos em dias;
+# 'consumo_observado' (unidades/dia) e 'data_fim_ajustada' ficam None enquanto o
+# histórico não cobre pelo menos um dia entre a primeira e a última reposição.
+Consumo = namedtuple(
+    "Consumo",
+    "reposicoes quantidade_total primeira_reposicao ultima_reposicao intervalo_ultimo "
+    "intervalo_medio consumo_observado doses_por_dia estoque data_fim_ajustada"
+)
+
+# --- Horários das Doses ---
+# Um remédio com horários é debitado dose a dose (tomar_dose) e não pela virada do
+# dia; as doses_por_dia passam a ser a soma das quantidades dos horários. O horário
+# é o minuto do dia (0 = 00:00) e a quantidade, as unidades de cada dose.
+MINUTOS_DIA = 24 * 60
+MAX_HORARIOS = 48 # Horários por remédio
+
+# Uma dose de um horário em um dia. 'paciente' como em Alerta.
+Dose = namedtuple("Dose", "horario_id remedio_id nome minuto quantidade unidade dia paciente")
+
+
+# --- Exceções ---
+
+class ErroRemedios(Exception):
+    """Erro base do núcleo."""
+
+
+class ErroValidacao(ErroRemedios):
+    """Um valor informado não passa nas regras de validação."""
+
+
+class ValorInvalido(ErroValidacao):
+    """Um número é grande demais (ou fora da faixa permitida)."""
+
+
+class NomeInvalido(ErroValidacao):
+    """Um nome é grande demais (ou vazio)."""
+
+
+class RemedioDuplicado(ErroRemedios):
+    """Já existe um remédio com esse nome."""
+
+
+class RemedioNaoEncontrado(ErroRemedios):
+    """Não existe remédio com esse id."""
+
+
+class PacienteDuplicado(ErroRemedios):
+    """Já existe um paciente com esse nome."""
+
+
+class PacienteNaoEncontrado(ErroRemedios):
+    """Não existe paciente com esse id ou nome."""
+
+
+class HorarioNaoEncontrado(ErroRemedios):
+    """Não existe horário de dose com esse id."""
+
+
+# --- Validação ---
+
+def validar_valores(valores):
+    """Verifica se os valores são convertíveis para C INT; levanta ValorInvalido se não."""
+    for val in valores:
+        if val > MAX_VALOR:
+            raise ValorInvalido(f"Os valores são muito altos. Máximo permitido: {MAX_VALOR}")
+
+
+def validar_nome(nome):
+    """Verifica o tamanho do nome; levanta NomeInvalido se passar do máximo."""
+    if len(nome) > MAX_TAMANHO_NOME:
+        raise NomeInvalido(
+            f"A palavra utilizada é muito grande. O Máximo permitido são {MAX_TAMANHO_NOME} caracteres."
+        )
+
+
+def validar_remedio(nome, doses_por_dia, estoque, limite_dias):
+    """Regras do cadastro de um remédio. Retorna o nome sem espaços nas pontas."""
+    nome = nome.strip()
+    if not nome:
+        raise NomeInvalido("O nome do remédio é obrigatório.")
+    if doses_por_dia <= 0 or estoque < 0 or limite_dias < 0:
+        raise ValorInvalido("Doses/dia deve ser > 0 e estoque e dias de alerta >= 0.")
+    validar_nome(nome)
+    validar_valores((estoque, doses_por_dia, limite_dias))
+    return nome
+
+
+def consulta_busca(texto):
+    """
+    Consulta FTS5 para o texto digitado: cada palavra vira um prefixo e todas
+    precisam aparecer ("dip sod" -> '"dip"* "sod"*'). None se não houver palavras.
+    """
+    palavras = re.findall(r"\w+", texto or "")
+    if not palavras:
+        return None
+    return " ".join(f'"{palavra}"*' for palavra in palavras)
+
+
+def validar_horarios(horarios):
+    """
+    Regras dos horários de um remédio ((minuto, quantidade)). Retorna a lista
+    em ordem de horário; levanta ValorInvalido.
+    """
+    horarios = sorted(horarios)
+    for minuto, quantidade in horarios:
+        if not 0 <= minuto < MINUTOS_DIA:
+            raise ValorInvalido(f"Horário inválido: minuto {minuto} do dia.")
+        if quantidade <= 0:
+            raise ValorInvalido("A quantidade de uma dose deve ser um número positivo.")
+    if len({minuto for minuto, _ in horarios}) != len(horarios):
+        raise ValorInvalido("Há horários repetidos.")
+    if len(horarios) > MAX_HORARIOS:
+        raise ValorInvalido(f"São permitidos no máximo {MAX_HORARIOS} horários por remédio.")
+    validar_valores([sum(quantidade for _, quantidade in horarios)])
+    return horarios
+
+
+def interpretar_horarios(texto):
+    """
+    Horários digitados ("08:00, 14:00 20:00x2": a quantidade da dose vem depois
+    do "x", 1 se omitida) como uma lista de (minuto, quantidade), em ordem.
+    Texto vazio = sem horários. Levanta ValorInvalido.
+    """
+    horarios = []
+    for parte in re.split(r"[\s,;]+", (texto or "").strip()):
+        if not parte:
+            continue
+        encontrado = re.fullmatch(r"(\d{1,2})[:hH](\d{2})(?:[xX](\d+))?", parte)
+        if not encontrado or int(encontrado[1]) > 23 or int(encontrado[2]) > 59:
+            raise ValorInvalido(f"Horário inválido: '{parte}'. Use HH:MM, com xN para doses de N unidades.")
+        horarios.append((int(encontrado[1]) * 60 + int(encontrado[2]), int(encontrado[3] or 1)))
+    return validar_horarios(horarios)
+
+
+def formatar_minuto(minuto):
+    """Minuto do dia como "HH:MM"."""
+    return f"{minuto // 60:02d}:{minuto % 60:02d}"
+
+
+def formatar_horarios(horarios):
+    """Texto de uma lista de (minuto, quantidade), no formato de interpretar_horarios."""
+    return " ".join(formatar_minuto(minuto) + (f"x{quantidade}" if quantidade != 1 else "")
+                    for minuto, quantidade in horarios)
+
+
+def unidade_plural(unidade, quantidade):
+    """Pluraliza "comprimido" se necessário."""
+    return "comprimidos" if unidade == "comprimido" and quantidade != 1 else unidade
+
+
+def formatar_data(valor):
+    """Data/hora (date, datetime ou texto já formatado) no formato gravado no histórico."""
+    if isinstance(valor, str):
+        return valor
+    if not isinstance(valor, datetime):
+        valor = datetime.combine(valor, datetime.min.time())
+    return valor.strftime(FORMATO_DATA)
+
+
+def nome_alerta(alerta):
+    """Nome do remédio de um Alerta, com o paciente quando há mais de um."""
+    return f"{alerta.nome} ({alerta.paciente})" if alerta.paciente else alerta.nome
+
+
+def mensagem_alerta(alerta):
+    """Monta o título e o texto da notificação de um Alerta."""
+    unidade_str = unidade_plural(alerta.unidade, alerta.estoque)
+
+    if alerta.nivel == NIVEL_ULTIMO_DIA:
+        titulo = "Estoque Acabando Hoje!"
+        mensagem = (f"O remédio '{nome_alerta(alerta)}' não tem estoque para amanhã. "
+                    f"Restam apenas {alerta.estoque} {unidade_str}.")
+    else:
+        titulo = "Alerta de Estoque Baixo!"
+        mensagem = (f"O remédio '{nome_alerta(alerta)}' está acabando. "
+                    f"Restam apenas {alerta.estoque} {unidade_str} ({alerta.dias_restantes} dias).")
+    return titulo, mensagem
+
+
+class ServicoEstoque:
+    """Operações sobre o estoque de remédios, usando as conexões de um GerenciadorConexoes."""
+
+    def __init__(self, db):
+        self.db = db
+        self.modo_estoque = MODO_DEBITO
+        self.busca_indexada = False # Há o índice FTS5 'remedios_busca' (senão a busca usa LIKE)
+
+    @contextmanager
+    def _transacao(self, imediata=False):
+        """
+        Entrega a conexão da thread dentro de uma transação. Se já houver uma
+        aberta (ex.: um lote do EscritorBanco), participa dela sem fazer commit.
+        Com 'imediata', trava a escrita já no início (para ler e depois gravar
+        sem que outra conexão escreva no meio).
+        """
+        conn = self.db.conexao()
+        if conn.in_transaction:
+            yield conn
+        else:
+            with conn:
+                if imediata:
+                    conn.execute("BEGIN IMMEDIATE")
+                yield conn
+
+    # --- Esquema ---
+
+    def _check_and_add_column(self, conn, table_name, column_name, column_definition):
+        """Verifica se uma coluna existe e, se não, a adiciona. Retorna True se adicionou."""
+        # 'table_xinfo' também lista as colunas geradas, que 'table_info' esconde
+        columns = [info[1] for info in conn.execute(f"PRAGMA table_xinfo({table_name})")]
+        if column_name in columns:
+            return False
+        logger.info("Adicionando coluna '%s' à tabela '%s'.", column_name, table_name)
+        conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_definition}")
+        return True
+
+    def inicializar(self):
+        """
+        Aplica as migrações pendentes do esquema e lê o modo de armazenamento do
+        estoque. Com o banco na versão atual (PRAGMA user_version), só lê o modo.
+        """
+        conn = self.db.conexao()
+        versao = conn.execute("PRAGMA user_version").fetchone()[0]
+        if versao < VERSAO_ESQUEMA:
+            # As migrações que recriam uma tabela rodam com as chaves estrangeiras
+            # desligadas (senão o DROP TABLE apagaria as linhas filhas em cascata);
+            # o PRAGMA não tem efeito dentro de uma transação, então vem antes dela.
+            # As chaves são conferidas antes do commit.
+            conn.execute("PRAGMA foreign_keys = OFF")
+            try:
+                with self._transacao(imediata=True) as conn:
+                    # Relê com a trava de escrita: outra instância pode ter migrado antes
+                    versao = conn.execute("PRAGMA user_version").fetchone()[0]
+                    for numero in range(versao + 1, VERSAO_ESQUEMA + 1):
+                        logger.info("Atualizando o banco para a versão %d do esquema.", numero)
+                        self._MIGRACOES[numero - 1](self, conn)
+                    violacao = conn.execute("PRAGMA foreign_key_check").fetchone()
+                    if violacao is not None:
+                        raise sqlite3.IntegrityError(f"Chave estrangeira inválida depois da migração: {tuple(violacao)}")
+                    conn.execute(f"PRAGMA user_version = {VERSAO_ESQUEMA}")
+            finally:
+                conn.execute("PRAGMA foreign_keys = ON")
+        elif versao > VERSAO_ESQUEMA:
+            logger.warning("O banco está na versão %d do esquema, mais nova que a deste programa (%d).",
+                           versao, VERSAO_ESQUEMA)
+
+        resultado = conn.execute("SELECT modo_estoque FROM app_info WHERE id = 1").fetchone()
+        self.modo_estoque = resultado[0] if resultado else MODO_DEBITO
+        self.busca_indexada = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'remedios_busca'"
+        ).fetchone() is not None
+
+    # Cada migração leva o esquema da versão anterior para a sua, dentro da
+    # transação de inicializar(). Nunca altere uma migração já publicada:
+    # acrescente uma nova ao fim de _MIGRACOES e aumente VERSAO_ESQUEMA.
+
+    def _migracao_1(self, conn):
+        """
+        Esquema completo até a versão 1. Os bancos de antes das versões (user_version 0)
+        podem estar em qualquer etapa anterior, então tudo aqui é idempotente.
+        """
+        # Tabela de Remédios
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS remedios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL UNIQUE,
+            doses_por_dia INTEGER NOT NULL,
+            estoque_atual INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+
+        # Tabela de Histórico de Estoque
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS historico_estoque (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            remedio_id INTEGER NOT NULL,
+            quantidade_adicionada INTEGER NOT NULL,
+            data_adicao DATE NOT NULL,
+            FOREIGN KEY (remedio_id) REFERENCES remedios (id) ON DELETE CASCADE
+        )
+        """)
+
+        # Consultas do histórico por remédio e intervalo de datas. O índice também
+        # cobre a quantidade, então históricos e totais não leem a tabela, e o
+        # ON DELETE CASCADE da remoção de um remédio deixa de varrer o histórico.
+        # Antes de criá-lo, as datas antigas (gravadas como o str() de um datetime,
+        # com microssegundos) são normalizadas para FORMATO_DATA.
+        existe_indice = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_historico_remedio_data'"
+        ).fetchone()
+        if not existe_indice:
+            conn.execute("""
+                UPDATE historico_estoque
+                SET data_adicao = COALESCE(strftime('%Y-%m-%d %H:%M:%S', data_adicao), data_adicao)
+            """)
+            conn.execute("""
+                CREATE INDEX idx_historico_remedio_data
+                ON historico_estoque (remedio_id, data_adicao, quantidade_adicionada)
+            """)
+
+        # Estatísticas de consumo por remédio, mantidas pelo gatilho a cada reposição
+        # (cadastro com estoque, adicionar estoque), para que o consumo observado
+        # seja uma leitura pela chave em vez de agregar o histórico. Na criação, são
+        # preenchidas uma única vez a partir do histórico existente.
+        existe_estatisticas = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'estatisticas_consumo'"
+        ).fetchone()
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS estatisticas_consumo (
+            remedio_id INTEGER PRIMARY KEY,
+            reposicoes INTEGER NOT NULL,
+            quantidade_total INTEGER NOT NULL,
+            primeira_reposicao TEXT NOT NULL,
+            ultima_reposicao TEXT NOT NULL,
+            ultima_quantidade INTEGER NOT NULL,
+            intervalo_ultimo REAL,
+            FOREIGN KEY (remedio_id) REFERENCES remedios (id) ON DELETE CASCADE
+        )
+        """)
+        if not existe_estatisticas:
+            conn.execute("""
+            INSERT INTO estatisticas_consumo
+            SELECT remedio_id, COUNT(*), SUM(quantidade_adicionada), MIN(data_adicao), MAX(data_adicao),
+                   MAX(CASE WHEN ordem = 1 THEN quantidade_adicionada END),
+                   MAX(CASE WHEN ordem = 1 THEN julianday(data_adicao) - julianday(anterior) END)
+            FROM (
+                SELECT remedio_id, data_adicao, quantidade_adicionada,
+                       ROW_NUMBER() OVER janela AS ordem, LEAD(data_adicao) OVER janela AS anterior
+                FROM historico_estoque
+                WINDOW janela AS (PARTITION BY remedio_id ORDER BY data_adicao DESC, id DESC)
+            )
+            GROUP BY remedio_id
+            """)
+        # Uma reposição com data anterior à última (ex.: importação) só muda o último
+        # intervalo se cair entre a penúltima e a última reposição.
+        conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_estatisticas_consumo AFTER INSERT ON historico_estoque
+        BEGIN
+            INSERT INTO estatisticas_consumo (remedio_id, reposicoes, quantidade_total, primeira_reposicao,
+                                              ultima_reposicao, ultima_quantidade, intervalo_ultimo)
+            VALUES (NEW.remedio_id, 1, NEW.quantidade_adicionada, NEW.data_adicao,
+                    NEW.data_adicao, NEW.quantidade_adicionada, NULL)
+            ON CONFLICT (remedio_id) DO UPDATE SET
+                reposicoes = reposicoes + 1,
+                quantidade_total = quantidade_total + excluded.quantidade_total,
+                primeira_reposicao = MIN(primeira_reposicao, excluded.primeira_reposicao),
+                ultima_reposicao = MAX(ultima_reposicao, excluded.ultima_reposicao),
+                ultima_quantidade = CASE WHEN excluded.ultima_reposicao >= ultima_reposicao
+                    THEN excluded.ultima_quantidade ELSE ultima_quantidade END,
+                intervalo_ultimo = CASE
+                    WHEN excluded.ultima_reposicao >= ultima_reposicao
+                        THEN julianday(excluded.ultima_reposicao) - julianday(ultima_reposicao)
+                    WHEN intervalo_ultimo IS NULL
+                         OR julianday(excluded.ultima_reposicao) > julianday(ultima_reposicao) - intervalo_ultimo
+                        THEN julianday(ultima_reposicao) - julianday(excluded.ultima_reposicao)
+                    ELSE intervalo_ultimo END;
+        END
+        """)
+
+        # Tabela para rastrear a última execução
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS app_info (
+            id INTEGER PRIMARY KEY,
+            last_run_date TEXT NOT NULL
+        )
+        """)
+
+        self._check_and_add_column(conn, 'remedios', 'unidade', 'TEXT NOT NULL DEFAULT "comprimido"')
+
+        # Âncora do estoque: a data em que 'estoque_atual' era o estoque do remédio.
+        # Bancos antigos são ancorados na última verificação, o que não muda nenhum valor.
+        if self._check_and_add_column(conn, 'remedios', 'data_ancora', 'TEXT'):
+            conn.execute("""
+                UPDATE remedios SET data_ancora = COALESCE(
+                    (SELECT last_run_date FROM app_info WHERE id = 1), date('now', 'localtime'))
+            """)
+        self._check_and_add_column(conn, 'app_info', 'modo_estoque', f'TEXT NOT NULL DEFAULT "{MODO_DEBITO}"')
+
+        # Remédios novos nascem ancorados na última verificação
+        conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_remedios_ancora AFTER INSERT ON remedios
+        WHEN NEW.data_ancora IS NULL
+        BEGIN
+            UPDATE remedios SET data_ancora = COALESCE(
+                (SELECT last_run_date FROM app_info WHERE id = 1), date('now', 'localtime'))
+            WHERE id = NEW.id;
+        END
+        """)
+
+        # Limite de alerta por remédio e dias restantes calculados pelo próprio SQLite.
+        # As colunas geradas são VIRTUAL porque o SQLite não permite adicionar uma STORED
+        # com ALTER TABLE; o índice guarda o valor. 'dia_fim' é o dia (juliano) em que o
+        # estoque acaba, então a verificação de notificações só lê os remédios cujo
+        # 'dia_fim - limite_dias' já chegou, nos dois modos de armazenamento.
+        self._check_and_add_column(conn, 'remedios', 'limite_dias', f'INTEGER NOT NULL DEFAULT {LIMITE_DIAS_PADRAO}')
+        self._check_and_add_column(
+            conn, 'remedios', 'dias_restantes',
+            'INTEGER GENERATED ALWAYS AS (CASE WHEN doses_por_dia > 0 THEN estoque_atual / doses_por_dia END) VIRTUAL'
+        )
+        self._check_and_add_column(
+            conn, 'remedios', 'dia_fim',
+            'INTEGER GENERATED ALWAYS AS (CAST(julianday(data_ancora) AS INTEGER) + dias_restantes) VIRTUAL'
+        )
+        conn.execute("DROP INDEX IF EXISTS idx_remedios_alerta")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_remedios_fim_alerta ON remedios (dia_fim - limite_dias)")
+
+        # Verificação incremental de alertas: o último nível notificado de cada remédio,
+        # o dia da última verificação e os remédios alterados desde então. O índice
+        # parcial só guarda os remédios já em alerta, então o débito diário (que
+        # reescreve 'dia_fim' de todas as linhas) só mexe em poucas entradas dele.
+        self._check_and_add_column(conn, 'remedios', 'nivel_alerta', f'INTEGER NOT NULL DEFAULT {NIVEL_NENHUM}')
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_remedios_ultimo_dia ON remedios (dia_fim) WHERE nivel_alerta > 0"
+        )
+        self._check_and_add_column(conn, 'app_info', 'dia_alertas', 'INTEGER')
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS remedios_alterados (
+            remedio_id INTEGER PRIMARY KEY
+        )
+        """)
+        # Os gatilhos usam ON CONFLICT DO NOTHING, e não INSERT OR IGNORE: dentro de
+        # um upsert em 'remedios' o OR IGNORE seria trocado pelo ABORT do comando
+        # externo. São recriados para corrigir os bancos com a versão antiga.
+        conn.execute("DROP TRIGGER IF EXISTS trg_remedios_alterados_insert")
+        conn.execute("""
+        CREATE TRIGGER trg_remedios_alterados_insert AFTER INSERT ON remedios
+        BEGIN
+            INSERT INTO remedios_alterados (remedio_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+        END
+        """)
+        # Não marca quando a linha só foi reancorada (débito diário, migração de modo):
+        # o estoque novo é exatamente o que a linha antiga previa para a nova âncora.
+        # A passagem dos dias é tratada pela própria verificação.
+        conn.execute("DROP TRIGGER IF EXISTS trg_remedios_alterados_update")
+        conn.execute("""
+        CREATE TRIGGER trg_remedios_alterados_update
+        AFTER UPDATE OF estoque_atual, doses_por_dia, limite_dias, data_ancora ON remedios
+        WHEN NEW.doses_por_dia IS NOT OLD.doses_por_dia OR NEW.limite_dias IS NOT OLD.limite_dias
+             OR NEW.estoque_atual IS NOT MAX(0, OLD.estoque_atual - OLD.doses_por_dia * (
+                    CAST(julianday(NEW.data_ancora) AS INTEGER) - CAST(julianday(OLD.data_ancora) AS INTEGER)))
+        BEGIN
+            INSERT INTO remedios_alterados (remedio_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+        END
+        """)
+
+        # Visão com o estoque de hoje, usada por todas as leituras
+        conn.execute("DROP VIEW IF EXISTS remedios_hoje")
+        conn.execute(f"""
+        CREATE VIEW remedios_hoje AS
+        SELECT id, nome, doses_por_dia, {ESTOQUE_HOJE_SQL} AS estoque_atual, unidade,
+               limite_dias, data_ancora, dia_fim, nivel_alerta
+        FROM remedios
+        """)
+
+    def _migracao_2(self, conn):
+        """Índice FTS5 dos nomes para a busca, mantido pelos gatilhos."""
+        try:
+            conn.execute(f"""
+            CREATE VIRTUAL TABLE remedios_busca USING fts5(
+                nome, content='remedios', content_rowid='id',
+                tokenize='{TOKENIZADOR_BUSCA}', prefix='{PREFIXOS_BUSCA}'
+            )
+            """)
+        except sqlite3.OperationalError as e:
+            # SQLite compilado sem FTS5: a busca continua funcionando, com LIKE
+            logger.warning("Índice de busca indisponível (%s); a busca vai percorrer os nomes.", e)
+            return
+
+        conn.execute("""
+        CREATE TRIGGER trg_remedios_busca_insert AFTER INSERT ON remedios
+        BEGIN
+            INSERT INTO remedios_busca (rowid, nome) VALUES (NEW.id, NEW.nome);
+        END
+        """)
+        conn.execute("""
+        CREATE TRIGGER trg_remedios_busca_delete AFTER DELETE ON remedios
+        BEGIN
+            INSERT INTO remedios_busca (remedios_busca, rowid, nome) VALUES ('delete', OLD.id, OLD.nome);
+        END
+        """)
+        conn.execute("""
+        CREATE TRIGGER trg_remedios_busca_update AFTER UPDATE OF nome ON remedios
+        BEGIN
+            INSERT INTO remedios_busca (remedios_busca, rowid, nome) VALUES ('delete', OLD.id, OLD.nome);
+            INSERT INTO remedios_busca (rowid, nome) VALUES (NEW.id, NEW.nome);
+        END
+        """)
+        conn.execute("INSERT INTO remedios_busca (remedios_busca) VALUES ('rebuild')")
+
+    def _migracao_3(self, conn):
+        """Índices das ordenações da lista (ORDENACOES), com o id no fim de cada um."""
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_remedios_ordem_nome ON remedios ({ORDENACOES['nome']})")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_remedios_ordem_doses ON remedios ({ORDENACOES['doses']})")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_remedios_ordem_fim ON remedios ({ORDENACOES['fim']})")
+
+    def _recriar_tabela(self, conn, tabela, definicao, colunas):
+        """
+        Troca 'tabela' por uma nova com a 'definicao' (o corpo do CREATE TABLE),
+        copiando as 'colunas'. Os ids não mudam, então as chaves estrangeiras das
+        outras tabelas e o índice FTS5 continuam valendo. Os gatilhos e índices da
+        tabela antiga são recriados como estavam; as visões são apagadas (não
+        podem apontar para uma tabela que sumiu) e ficam para quem chamou.
+        Precisa das chaves estrangeiras desligadas (ver inicializar).
+        """
+        esquema = conn.execute(
+            "SELECT type, sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+            (tabela,)
+        ).fetchall()
+        for (visao,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'view'").fetchall():
+            conn.execute(f"DROP VIEW {visao}")
+
+        conn.execute(f"CREATE TABLE {tabela}_nova ({definicao})")
+        lista = ", ".join(colunas)
+        conn.execute(f"INSERT INTO {tabela}_nova ({lista}) SELECT {lista} FROM {tabela}")
+        conn.execute(f"DROP TABLE {tabela}")
+        conn.execute(f"ALTER TABLE {tabela}_nova RENAME TO {tabela}")
+        for _, sql in sorted(esquema): # Índices antes dos gatilhos
+            conn.execute(sql)
+
+    def _migracao_4(self, conn):
+        """
+        Pacientes. 'remedios' é recriada para trocar o UNIQUE do nome por
+        UNIQUE (paciente_id, nome); os remédios existentes ficam com o paciente
+        padrão. Os índices das consultas por paciente começam por paciente_id.
+        """
+        conn.execute("""
+        CREATE TABLE pacientes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL UNIQUE
+        )
+        """)
+        conn.execute("INSERT INTO pacientes (id, nome) VALUES (?, ?)", (PACIENTE_PADRAO, NOME_PACIENTE_PADRAO))
+
+        # Os índices das ordenações passam a ser por paciente (abaixo)
+        for nome in ("nome", "doses", "fim"):
+            conn.execute(f"DROP INDEX idx_remedios_ordem_{nome}")
+        self._recriar_tabela(conn, "remedios", f"""
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            paciente_id INTEGER NOT NULL DEFAULT {PACIENTE_PADRAO} REFERENCES pacientes (id),
+            nome TEXT NOT NULL,
+            doses_por_dia INTEGER NOT NULL,
+            estoque_atual INTEGER NOT NULL DEFAULT 0,
+            unidade TEXT NOT NULL DEFAULT "comprimido",
+            data_ancora TEXT,
+            limite_dias INTEGER NOT NULL DEFAULT {LIMITE_DIAS_PADRAO},
+            dias_restantes INTEGER GENERATED ALWAYS AS (CASE WHEN doses_por_dia > 0 THEN estoque_atual / doses_por_dia END) VIRTUAL,
+            dia_fim INTEGER GENERATED ALWAYS AS (CAST(julianday(data_ancora) AS INTEGER) + dias_restantes) VIRTUAL,
+            nivel_alerta INTEGER NOT NULL DEFAULT {NIVEL_NENHUM},
+            UNIQUE (paciente_id, nome)
+        """, ("id", "nome", "doses_por_dia", "estoque_atual", "unidade", "data_ancora", "limite_dias", "nivel_alerta"))
+
+        # A lista de um paciente (em ordem de id ou pelas ORDENACOES) e a sua
+        # verificação de alertas percorrem só as linhas dele
+        conn.execute("CREATE INDEX idx_remedios_paciente ON remedios (paciente_id)")
+        for nome in ("nome", "doses", "fim"):
+            conn.execute(f"CREATE INDEX idx_remedios_ordem_{nome} ON remedios (paciente_id, {ORDENACOES[nome]})")
+
+        conn.execute(f"""
+        CREATE VIEW remedios_hoje AS
+        SELECT id, paciente_id, nome, doses_por_dia, {ESTOQUE_HOJE_SQL} AS estoque_atual, unidade,
+               limite_dias, data_ancora, dia_fim, nivel_alerta
+        FROM remedios
+        """)
+
+        # O histórico guarda o paciente de cada reposição, para percorrer o de um paciente pelo índice
+        conn.execute("ALTER TABLE historico_estoque ADD COLUMN paciente_id INTEGER REFERENCES pacientes (id)")
+        conn.execute("UPDATE historico_estoque SET paciente_id = ?", (PACIENTE_PADRAO,))
+        conn.execute("""
+            CREATE INDEX idx_historico_paciente ON historico_estoque (paciente_id, remedio_id, data_adicao)
+        """)
+
+    def _migracao_5(self, conn):
+        """
+        Horários das doses. Os remédios com horários (debito_por_dose) saem do
+        débito diário: cada dose tomada fica em 'doses_tomadas' (uma vez por
+        horário e dia, então marcar de novo não debita de novo) e debita a sua
+        quantidade. A visão passa a usar ESTOQUE_HOJE_DOSES_SQL, que não desconta os
+        dias desses remédios. A virada do dia só muda a âncora desses remédios
+        (para 'dia_fim' contar a partir do dia certo); o índice parcial limita
+        essa atualização às linhas deles.
+        """
+        conn.execute("ALTER TABLE remedios ADD COLUMN debito_por_dose INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX idx_remedios_por_dose ON remedios (id) WHERE debito_por_dose")
+        # UNIQUE (remedio_id, minuto) também é o índice dos horários de um remédio
+        conn.execute(f"""
+        CREATE TABLE horarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            remedio_id INTEGER NOT NULL REFERENCES remedios (id) ON DELETE CASCADE,
+            minuto INTEGER NOT NULL CHECK (minuto >= 0 AND minuto < {MINUTOS_DIA}),
+            quantidade INTEGER NOT NULL CHECK (quantidade > 0),
+            UNIQUE (remedio_id, minuto)
+        )
+        """)
+        conn.execute("""
+        CREATE TABLE doses_tomadas (
+            horario_id INTEGER NOT NULL REFERENCES horarios (id) ON DELETE CASCADE,
+            dia TEXT NOT NULL,
+            tomada_em TEXT NOT NULL,
+            PRIMARY KEY (horario_id, dia)
+        ) WITHOUT ROWID
+        """)
+
+        conn.execute("DROP VIEW remedios_hoje")
+        conn.execute(f"""
+        CREATE VIEW remedios_hoje AS
+        SELECT id, paciente_id, nome, doses_por_dia, {ESTOQUE_HOJE_DOSES_SQL} AS estoque_atual, unidade,
+               limite_dias, data_ancora, dia_fim, nivel_alerta
+        FROM remedios
+        """)
+
+    _MIGRACOES = (_migracao_1, _migracao_2, _migracao_3, _migracao_4, _migracao_5)
+
+    def migrar_modo_estoque(self, novo_modo):
+        """Troca o modo de armazenamento do estoque sem mudar o estoque de nenhum remédio."""
+        if novo_modo not in (MODO_DEBITO, MODO_ANCORA):
+            raise ValorInvalido(f"Modo de estoque desconhecido: '{novo_modo}'. Use '{MODO_DEBITO}' ou '{MODO_ANCORA}'.")
+        if novo_modo == self.modo_estoque:
+            return False
+
+        with self._transacao() as conn:
+            if novo_modo == MODO_DEBITO:
+                # Grava o estoque calculado e ancora tudo na última verificação
+                conn.execute(f"""
+                    UPDATE remedios
+                    SET estoque_atual = {ESTOQUE_HOJE_SQL},
+                        data_ancora = (SELECT last_run_date FROM app_info WHERE id = 1)
+                    WHERE NOT debito_por_dose
+                """)
+            # No modo débito as âncoras já são a última verificação: não há o que converter
+
+            conn.execute("UPDATE app_info SET modo_estoque = ? WHERE id = 1", (novo_modo,))
+        self.modo_estoque = novo_modo
+        return True
+
+    # --- Débito diário ---
+
+    def _ultima_verificacao(self):
+        """app_info.last_run_date (texto 'AAAA-MM-DD'), ou None antes da primeira execução."""
+        resultado = self.db.conexao().execute("SELECT last_run_date FROM app_info WHERE id = 1").fetchone()
+        return resultado[0] if resultado else None
+
+    def dias_desde_ultima_verificacao(self, hoje=None):
+        """Dias entre a última verificação e hoje (None antes da primeira execução)."""
+        ultima = self._ultima_verificacao()
+        if ultima is None:
+            return None
+        return ((hoje or date.today()) - date.fromisoformat(ultima)).days
+
+    @metricas.cronometrar("debito")
+    def debitar_dias(self, dias_passados=None, hoje=None):
+        """
+        Debita o estoque dos remédios com base nos dias que se passaram.
+        Retorna True se algum dia foi debitado.
+
+        Vários processos podem chamar ao mesmo tempo (a janela, o --check, a API):
+        a leitura de last_run_date, o débito e a gravação da nova data são uma
+        transação BEGIN IMMEDIATE, e a data só muda se ainda for a lida
+        (compare-and-set). Quem chega depois vê a data já movida e não debita de
+        novo. Se já foi debitado hoje, volta sem pedir a trava de escrita.
+        Os remédios com horários não são debitados (perdem estoque dose a dose, em
+        tomar_dose), só ganham a nova âncora.
+        """
+        hoje = hoje or date.today()
+        hoje_str = hoje.strftime('%Y-%m-%d')
+
+        if dias_passados is None and self._ultima_verificacao() == hoje_str:
+            logger.info("Verificação automática de estoque: nenhum dia se passou.")
+            return False
+
+        with self._transacao(imediata=True) as conn:
+            ultima = self._ultima_verificacao()
+            if ultima is None:
+                logger.info("Primeira execução. Configurando data de verificação de estoque.")
+                conn.execute("INSERT INTO app_info (id, last_run_date) VALUES (1, ?)", (hoje_str,))
+                return False
+            if dias_passados is None:
+                dias_passados = (hoje - date.fromisoformat(ultima)).days
+
+            if dias_passados <= 0:
+                logger.info("Verificação automática de estoque: nenhum dia se passou.")
+                return False
+
+            cursor = conn.execute(
+                "UPDATE app_info SET last_run_date = ? WHERE id = 1 AND last_run_date = ?", (hoje_str, ultima)
+            )
+            if cursor.rowcount != 1:
+                # Só acontece dentro de uma transação já aberta sem trava (leitura velha)
+                logger.info("Outro processo já debitou até %s.", hoje_str)
+                return False
+
+            logger.info("Detectado(s) %d dia(s) para debitar. Atualizando estoque.", dias_passados)
+
+            # No modo âncora o estoque é calculado na leitura: basta mover last_run_date
+            if self.modo_estoque == MODO_DEBITO:
+                conn.execute("""
+                    UPDATE remedios
+                    SET estoque_atual = MAX(0, estoque_atual - (doses_por_dia * ?)),
+                        data_ancora = ?
+                    WHERE doses_por_dia > 0 AND NOT debito_por_dose
+                """, (dias_passados, hoje_str))
+            # Nos dois modos, os remédios com horários mudam só de âncora (o estoque fica):
+            # sem isso, 'dia_fim' contaria os dias a partir de uma âncora velha e os alertas,
+            # a ordem 'fim' e o próximo prazo tratariam o estoque como se fosse debitado
+            conn.execute("UPDATE remedios SET data_ancora = ? WHERE debito_por_dose", (hoje_str,))
+
+        logger.info("Estoque debitado por %d dia(s).", dias_passados)
+        return True
+
+    # --- Consultas ---
+
+    def contar(self, paciente_id=None):
+        """Quantos remédios existem no banco (ou só do paciente)."""
+        if paciente_id is None:
+            return self.db.conexao().execute("SELECT COUNT(*) FROM remedios").fetchone()[0]
+        return self.db.conexao().execute(
+            "SELECT COUNT(*) FROM remedios WHERE paciente_id = ?", (paciente_id,)
+        ).fetchone()[0]
+
+    # --- Pacientes ---
+
+    def listar_pacientes(self):
+        """(id, nome) de todos os pacientes, em ordem alfabética."""
+        return self.db.conexao().execute("SELECT id, nome FROM pacientes ORDER BY nome COLLATE NOCASE").fetchall()
+
+    def cadastrar_paciente(self, nome):
+        """Cadastra um paciente. Retorna o id."""
+        nome = nome.strip()
+        if not nome:
+            raise NomeInvalido("O nome do paciente não pode ser vazio.")
+        validar_nome(nome)
+        try:
+            with self._transacao() as conn:
+                return conn.execute("INSERT INTO pacientes (nome) VALUES (?)", (nome,)).lastrowid
+        except sqlite3.IntegrityError as e:
+            raise PacienteDuplicado(f"O paciente '{nome}' já está cadastrado.") from e
+
+    def obter_paciente_id(self, nome):
+        """Id do paciente com esse nome; levanta PacienteNaoEncontrado se não existir."""
+        resultado = self.db.conexao().execute("SELECT id FROM pacientes WHERE nome = ?", (nome.strip(),)).fetchone()
+        if resultado is None:
+            raise PacienteNaoEncontrado(f"Paciente '{nome}' não encontrado.")
+        return resultado[0]
+
+    def _ids_busca(self, busca, paciente_id=None):
+        """
+        Subconsulta com os ids dos remédios cujo nome casa com o texto 'busca'
+        (e, se houver, do paciente), a coluna do id dentro dela e os parâmetros
+        (None se o texto não tiver palavras). Recebe mais condições nessa coluna,
+        ORDER BY e LIMIT: o FTS5 percorre os ids em ordem e para no limite, sem
+        juntar todos os resultados. O paciente de cada id é conferido pela chave
+        primária de 'remedios', no caminho.
+        """
+        consulta = consulta_busca(busca)
+        if consulta is None:
+            return None, None, ()
+        if self.busca_indexada:
+            if paciente_id is None:
+                return "SELECT rowid FROM remedios_busca WHERE remedios_busca MATCH ?", "rowid", (consulta,)
+            # CROSS JOIN fixa o FTS5 por fora, em ordem de id
+            return ("SELECT b.rowid FROM remedios_busca b CROSS JOIN remedios r ON r.id = b.rowid "
+                    "WHERE b.remedios_busca MATCH ? AND r.paciente_id = ?"), "b.rowid", (consulta, paciente_id)
+        palavras = re.findall(r"\w+", busca)
+        condicoes = " AND ".join("nome LIKE ?" for _ in palavras)
+        parametros = tuple(f"%{palavra}%" for palavra in palavras)
+        if paciente_id is not None:
+            condicoes += " AND paciente_id = ?"
+            parametros += (paciente_id,)
+        return f"SELECT rowid FROM remedios WHERE {condicoes}", "rowid", parametros
+
+    def _consulta_lista(self, condicao, ordem, parametros, limite, busca, paciente_id=None):
+        """
+        Linhas de COLUNAS_LISTA com 'id' na 'condicao', na 'ordem' de id, filtradas
+        por 'busca' e, se houver, pelo paciente (índice por paciente, que termina no id).
+        """
+        subconsulta, coluna, parametros_busca = self._ids_busca(busca, paciente_id)
+        if subconsulta is None:
+            filtro_paciente = ""
+            if paciente_id is not None:
+                filtro_paciente = "AND paciente_id = ?"
+                parametros = (*parametros, paciente_id)
+            return self.db.conexao().execute(
+                f"SELECT {COLUNAS_LISTA} FROM remedios_hoje WHERE id {condicao} {filtro_paciente} ORDER BY id {ordem} LIMIT ?",
+                (*parametros, limite)
+            ).fetchall()
+        return self.db.conexao().execute(f"""
+            SELECT {COLUNAS_LISTA} FROM remedios_hoje
+            WHERE id IN ({subconsulta} AND {coluna} {condicao} ORDER BY {coluna} {ordem} LIMIT ?)
+            ORDER BY id {ordem}
+        """, (*parametros_busca, *parametros, limite)).fetchall()
+
+    def _chave_ordenacao(self, ordem):
+        """(expressão SQL, decrescente) de uma ordenação como "fim" ou "-fim" (decrescente)."""
+        decrescente = ordem.startswith("-")
+        nome = ordem.lstrip("-")
+        if nome not in ORDENACOES:
+            raise ValorInvalido(f"Ordenação desconhecida: '{nome}'. Use {', '.join(ORDENACOES)}.")
+        if nome == "estoque":
+            # No modo débito a coluna já é o estoque de hoje
+            return ("estoque_atual" if self.modo_estoque == MODO_DEBITO else ESTOQUE_HOJE_DOSES_SQL), decrescente
+        return ORDENACOES[nome], decrescente
+
+    def _consulta_ordenada(self, ordem, remedio_id, relacao, limite, busca, paciente_id=None):
+        """
+        Linhas de COLUNAS_LISTA na 'ordem', a partir de 'remedio_id' (0 = do começo):
+        'relacao' ">=" ou ">" pega as linhas dele em diante e "<" as de antes dele
+        (devolvidas na ordem da lista). Pagina pelo par (chave, id), sem OFFSET,
+        então cada página percorre só as suas linhas no índice (paciente_id, chave).
+        Sem 'paciente_id', pega a página de cada paciente no índice e junta as
+        páginas (não há índice só da chave).
+        """
+        chave, decrescente = self._chave_ordenacao(ordem)
+        conn = self.db.conexao()
+        para_tras = relacao == "<"
+        sentido = "DESC" if decrescente != para_tras else "ASC"
+        comparacao = "<" if sentido == "DESC" else ">"
+
+        condicoes, parametros = [], []
+        if remedio_id:
+            linha = conn.execute(f"SELECT {chave} FROM remedios WHERE id = ?", (remedio_id,)).fetchone()
+            if linha is not None:
+                # (chave, id) > (valor, remedio_id) escrito de um jeito que usa o índice da chave
+                igual = "=" if relacao == ">=" else ""
+                condicoes.append(f"{chave} {comparacao}= ? AND ({chave} {comparacao} ? OR id {comparacao}{igual} ?)")
+                parametros += [linha[0], linha[0], remedio_id]
+            elif relacao != ">=":
+                return [] # A linha de referência foi apagada
+        if paciente_id is not None:
+            condicoes.append("paciente_id = ?")
+            parametros.append(paciente_id)
+        else:
+            condicoes.append("paciente_id = pacientes.paciente")
+        subconsulta, _, parametros_busca = self._ids_busca(busca)
+        if subconsulta is not None:
+            condicoes.append(f"id IN ({subconsulta})")
+            parametros += parametros_busca
+
+        colunas = f"id, nome, doses_por_dia, {ESTOQUE_HOJE_DOSES_SQL} AS estoque_atual, unidade"
+        onde = " AND ".join(condicoes)
+        ordenacao = f"ORDER BY {chave} {sentido}, id {sentido} LIMIT ?"
+        if paciente_id is not None:
+            remedios = conn.execute(
+                f"SELECT {colunas} FROM remedios WHERE {onde} {ordenacao}", (*parametros, limite)
+            ).fetchall()
+        else:
+            # A subconsulta correlacionada roda uma vez por paciente (com 'id' como
+            # 'paciente', os nomes das colunas de fora continuam sendo só de remedios)
+            remedios = conn.execute(f"""
+                SELECT {colunas} FROM (SELECT id AS paciente FROM pacientes) AS pacientes
+                CROSS JOIN remedios ON remedios.id IN (SELECT id FROM remedios WHERE {onde} {ordenacao})
+                {ordenacao}
+            """, (*parametros, limite, limite)).fetchall()
+        if para_tras:
+            remedios.reverse()
+        return remedios
+
+    def listar(self, a_partir_de=0, limite=-1, busca=None, ordem=None, paciente_id=None):
+        """
+        Remédios com id >= 'a_partir_de', em ordem de id (sem limite por padrão).
+        Com 'busca' (o texto digitado), só aqueles com palavras do nome que
+        começam pelas palavras da busca, sem diferenciar acentos e maiúsculas.
+        Com 'ordem' (uma chave de ORDENACOES, com "-" na frente para decrescente),
+        os remédios vêm nessa ordem, a partir do de id 'a_partir_de' (0 = do começo).
+        Com 'paciente_id', só os remédios desse paciente (senão, de todos).
+        """
+        if ordem:
+            return self._consulta_ordenada(ordem, a_partir_de, ">=", limite, busca, paciente_id)
+        return self._consulta_lista(">= ?", "ASC", (a_partir_de,), limite, busca, paciente_id)
+
+    def listar_depois(self, remedio_id, limite, busca=None, ordem=None, paciente_id=None):
+        """Página de remédios logo depois de 'remedio_id' (paginação por id ou pela 'ordem')."""
+        if ordem:
+            return self._consulta_ordenada(ordem, remedio_id, ">", limite, busca, paciente_id)
+        return self._consulta_lista("> ?", "ASC", (remedio_id,), limite, busca, paciente_id)
+
+    def listar_antes(self, remedio_id, limite, busca=None, ordem=None, paciente_id=None):
+        """Página de remédios logo antes de 'remedio_id', na ordem da lista."""
+        if ordem:
+            return self._consulta_ordenada(ordem, remedio_id, "<", limite, busca, paciente_id)
+        remedios = self._consulta_lista("< ?", "DESC", (remedio_id,), limite, busca, paciente_id)
+        remedios.reverse()
+        return remedios
+
+    def obter(self, remedio_id, busca=None, paciente_id=None):
+        """
+        Linha (id, nome, doses_por_dia, estoque_atual, unidade) do remédio, ou None
+        (também se não casar com 'busca' ou for de outro paciente que 'paciente_id').
+        """
+        remedios = self._consulta_lista("= ?", "ASC", (remedio_id,), 1, busca, paciente_id)
+        return remedios[0] if remedios else None
+
+    def obter_limite_alerta(self, remedio_id):
+        """(nome, limite_dias) do remédio; levanta RemedioNaoEncontrado se não existir."""
+        resultado = self.db.conexao().execute(
+            "SELECT nome, limite_dias FROM remedios WHERE id = ?", (remedio_id,)
+        ).fetchone()
+        if resultado is None:
+            raise RemedioNaoEncontrado(f"Remédio {remedio_id} não encontrado.")
+        return resultado
+
+    def consumo(self, remedio_id):
+        """
+        Consumo observado do remédio (um Consumo), lido das estatísticas mantidas a
+        cada reposição; None se ele nunca foi reposto. Levanta RemedioNaoEncontrado.
+        """
+        # O que foi reposto antes da última reposição foi consumido entre a primeira e a última
+        resultado = self.db.conexao().execute("""
+            SELECT r.doses_por_dia, r.estoque_atual, e.reposicoes, e.quantidade_total,
+                   e.primeira_reposicao, e.ultima_reposicao, e.intervalo_ultimo,
+                   julianday(e.ultima_reposicao) - julianday(e.primeira_reposicao),
+                   e.quantidade_total - e.ultima_quantidade,
+                   (SELECT last_run_date FROM app_info WHERE id = 1)
+            FROM remedios_hoje r LEFT JOIN estatisticas_consumo e ON e.remedio_id = r.id
+            WHERE r.id = ?
+        """, (remedio_id,)).fetchone()
+        if resultado is None:
+            raise RemedioNaoEncontrado(f"Remédio {remedio_id} não encontrado.")
+        (doses_por_dia, estoque, reposicoes, quantidade_total, primeira, ultima,
+         intervalo_ultimo, periodo, consumido, ultima_verificacao) = resultado
+        if reposicoes is None:
+            return None
+
+        intervalo_medio = periodo / (reposicoes - 1) if reposicoes > 1 else None
+        consumo_observado = consumido / periodo if periodo >= 1 and consumido > 0 else None
+        data_fim_ajustada = None
+        if consumo_observado and ultima_verificacao:
+            data_fim_ajustada = date.fromisoformat(ultima_verificacao) + timedelta(days=int(estoque / consumo_observado))
+        return Consumo(reposicoes, quantidade_total, primeira, ultima, intervalo_ultimo,
+                       intervalo_medio, consumo_observado, doses_por_dia, estoque, data_fim_ajustada)
+
+    def prever(self, remedios, hoje=None):
+        """Dias restantes e datas de fim (ordinais) das linhas de 'listar'/'obter', em lote."""
+        return previsao.prever_lote([r[3] for r in remedios], [r[2] for r in remedios], hoje)
+
+    def _dia_ultima_verificacao(self):
+        """Dia juliano de app_info.last_run_date (None antes da primeira execução)."""
+        resultado = self.db.conexao().execute(
+            "SELECT CAST(julianday(last_run_date) AS INTEGER) FROM app_info WHERE id = 1"
+        ).fetchone()
+        return resultado[0] if resultado else None
+
+    @metricas.cronometrar("alertas.completa")
+    def verificar_alertas(self, paciente_id=None):
+        """
+        Remédios com estoque dentro do seu limite de alerta, como uma lista de Alerta
+        (de todos os pacientes, ou só do 'paciente_id').
+        """
+        # O limite é avaliado na consulta, pelo índice 'idx_remedios_fim_alerta':
+        # só os remédios em risco são lidos, não a tabela inteira. Com um paciente,
+        # o índice por paciente limita a leitura às linhas dele.
+        dia = self._dia_ultima_verificacao()
+        if dia is None:
+            return []
+        filtro_paciente, parametros = ("", (dia,)) if paciente_id is None else ("AND paciente_id = ?", (dia, paciente_id))
+        remedios = self.db.conexao().execute(f"""
+            SELECT id, nome, doses_por_dia, estoque_atual, unidade, {NIVEL_SQL}, {PACIENTE_ALERTA_SQL} FROM remedios_hoje
+            WHERE dia_fim - limite_dias <= ? AND estoque_atual > 0 {filtro_paciente}
+        """, parametros).fetchall()
+
+        dias_restantes, _ = previsao.prever_lote([r[3] for r in remedios], [r[2] for r in remedios])
+        return [
+            Alerta(remedio_id, nome, estoque, unidade, int(dias), nivel, paciente)
+            for (remedio_id, nome, _, estoque, unidade, nivel, paciente), dias in zip(remedios, dias_restantes)
+        ]
+
+    @metricas.cronometrar("alertas.incremental")
+    def verificar_alertas_novos(self, registrar=True):
+        """
+        Verificação incremental: reavalia só os remédios alterados desde a última
+        verificação e os que cruzaram um nível de alerta com a passagem dos dias.
+        Retorna os Alerta dos remédios que subiram de nível (os que já foram
+        notificados no mesmo nível não voltam).
+
+        Sem 'registrar', o nível dos que subiram não é gravado: eles continuam
+        marcados como alterados (voltam na próxima verificação) até que quem os
+        exibiu chame registrar_alertas. Assim um alerta que não chegou a ser
+        exibido não é dado como avisado.
+        """
+        with self._transacao(imediata=True) as conn:
+            dia = self._dia_ultima_verificacao()
+            if dia is None:
+                return []
+            ultimo_dia = conn.execute("SELECT dia_alertas FROM app_info WHERE id = 1").fetchone()[0]
+            if ultimo_dia is None:
+                ultimo_dia = 0 # Primeira verificação: todos os dias já passados contam
+
+            # Cada parte usa um índice: a chave primária da tabela de alterados,
+            # 'idx_remedios_fim_alerta' (entrada no limite) e 'idx_remedios_ultimo_dia'
+            # (os que já estão em alerta e chegaram ao último dia ou ficaram sem estoque)
+            remedios = conn.execute(f"""
+                WITH candidatos(id) AS (
+                    SELECT remedio_id FROM remedios_alterados
+                    UNION SELECT id FROM remedios WHERE dia_fim - limite_dias > :ultimo AND dia_fim - limite_dias <= :dia
+                    UNION SELECT id FROM remedios WHERE nivel_alerta > 0 AND dia_fim <= :dia
+                )
+                SELECT id, nome, doses_por_dia, estoque_atual, unidade, nivel_alerta, {NIVEL_SQL}, {PACIENTE_ALERTA_SQL}
+                FROM remedios_hoje WHERE id IN candidatos
+            """, {"ultimo": ultimo_dia, "dia": dia}).fetchall()
+
+            novos = [r for r in remedios if r[6] > r[5]]
+            conn.executemany(
+                "UPDATE remedios SET nivel_alerta = ? WHERE id = ?",
+                [(r[6], r[0]) for r in remedios if r[6] < r[5] or (registrar and r[6] > r[5])]
+            )
+            conn.execute("DELETE FROM remedios_alterados")
+            if not registrar:
+                conn.executemany("INSERT INTO remedios_alterados (remedio_id) VALUES (?)", [(r[0],) for r in novos])
+            conn.execute("UPDATE app_info SET dia_alertas = ? WHERE id = 1", (dia,))
+
+        dias_restantes, _ = previsao.prever_lote([r[3] for r in novos], [r[2] for r in novos])
+        return [
+            Alerta(remedio_id, nome, estoque, unidade, int(dias), nivel, paciente)
+            for (remedio_id, nome, _, estoque, unidade, _, nivel, paciente), dias in zip(novos, dias_restantes)
+        ]
+
+    def registrar_alertas(self, alertas):
+        """
+        Grava o nível dos Alerta já exibidos (os de verificar_alertas_novos sem
+        'registrar'). Os remédios ficam marcados como alterados: se o estoque
+        mudou depois da verificação, a próxima corrige o nível gravado.
+        """
+        with self._transacao() as conn:
+            conn.executemany(
+                "UPDATE remedios SET nivel_alerta = ? WHERE id = ?", [(a.nivel, a.remedio_id) for a in alertas]
+            )
+            conn.executemany(
+                "INSERT INTO remedios_alterados (remedio_id) VALUES (?) ON CONFLICT DO NOTHING",
+                [(a.remedio_id,) for a in alertas]
+            )
+
+    def proximo_prazo_alerta(self):
+        """
+        Primeiro dia (date) depois da última verificação em que algum remédio
+        sobe de nível de alerta, ou None se nenhum vai subir.
+        """
+        dia = self._dia_ultima_verificacao()
+        if dia is None:
+            return None
+        # A entrada no limite vem do índice da expressão (uma única entrada); o último
+        # dia, dos remédios que já estão no limite (índice parcial)
+        resultado = self.db.conexao().execute("""
+            SELECT MIN(prazo) FROM (
+                SELECT MIN(dia_fim - limite_dias) AS prazo FROM remedios WHERE dia_fim - limite_dias > :dia
+                UNION ALL SELECT MIN(dia_fim) FROM remedios WHERE nivel_alerta > 0 AND dia_fim > :dia
+            )
+        """, {"dia": dia}).fetchone()[0]
+        return date.fromordinal(resultado - DIFERENCA_JULIANO) if resultado is not None else None
+
+    # --- Histórico de reposições ---
+
+    @staticmethod
+    def _filtro_intervalo(inicio, fim):
+        """Condições e parâmetros de 'data_adicao' em [inicio, fim) (qualquer um pode ser None)."""
+        condicoes, parametros = [], []
+        if inicio is not None:
+            condicoes.append("AND data_adicao >= ?")
+            parametros.append(formatar_data(inicio))
+        if fim is not None:
+            condicoes.append("AND data_adicao < ?")
+            parametros.append(formatar_data(fim))
+        return " ".join(condicoes), parametros
+
+    def historico(self, remedio_id, inicio=None, fim=None, limite=None):
+        """
+        Reposições do remédio com data em [inicio, fim), as mais recentes primeiro,
+        como tuplas (data_adicao, quantidade). Só percorre o intervalo no índice.
+        """
+        filtro, parametros = self._filtro_intervalo(inicio, fim)
+        return self.db.conexao().execute(f"""
+            SELECT data_adicao, quantidade_adicionada FROM historico_estoque
+            WHERE remedio_id = ? {filtro}
+            ORDER BY data_adicao DESC LIMIT ?
+        """, (remedio_id, *parametros, -1 if limite is None else limite)).fetchall()
+
+    def totais_por_periodo(self, remedio_id, periodo="mes", inicio=None, fim=None):
+        """
+        Total reposto do remédio por período ('dia', 'semana', 'mes' ou 'ano'), do
+        mais recente para o mais antigo, como tuplas (periodo, total, reposicoes).
+        """
+        if periodo not in PERIODOS:
+            raise ValorInvalido(f"Período desconhecido: '{periodo}'. Use {', '.join(PERIODOS)}.")
+        filtro, parametros = self._filtro_intervalo(inicio, fim)
+        return self.db.conexao().execute(f"""
+            SELECT {PERIODOS[periodo]} AS chave, SUM(quantidade_adicionada), COUNT(*)
+            FROM historico_estoque
+            WHERE remedio_id = ? {filtro}
+            GROUP BY chave ORDER BY chave DESC
+        """, (remedio_id, *parametros)).fetchall()
+
+    # --- Importação e exportação em lote ---
+
+    def gravar_remedios(self, remedios, paciente_id=PACIENTE_PADRAO):
+        """
+        Grava em uma transação os remédios (nome, doses_por_dia, estoque, unidade,
+        limite_dias) do paciente, já validados: os novos são cadastrados (com o estoque
+        inicial no histórico, como em cadastrar) e os que já existem (mesmo nome) são
+        atualizados. O estoque é o de hoje, como em definir_estoque.
+        Os remédios com horários têm as doses por dia dadas pelos horários: os
+        registros que as mudariam não são gravados. Retorna as posições desses registros.
+        """
+        nomes = list({remedio[0] for remedio in remedios})
+        with self._transacao(imediata=True) as conn:
+            existentes, com_horarios = set(), {}
+            for inicio in range(0, len(nomes), TAMANHO_LOTE_CONSULTA):
+                parte = nomes[inicio:inicio + TAMANHO_LOTE_CONSULTA]
+                for nome, doses_por_dia, por_dose in conn.execute(
+                    f"""SELECT nome, doses_por_dia, debito_por_dose FROM remedios
+                        WHERE paciente_id = ? AND nome IN ({', '.join('?' * len(parte))})""",
+                    (paciente_id, *parte)
+                ):
+                    existentes.add(nome)
+                    if por_dose:
+                        com_horarios[nome] = doses_por_dia
+            rejeitados = [posicao for posicao, remedio in enumerate(remedios)
+                          if com_horarios.get(remedio[0], remedio[1]) != remedio[1]]
+            if rejeitados:
+                remedios = [remedio for remedio in remedios if com_horarios.get(remedio[0], remedio[1]) == remedio[1]]
+            # Estoque inicial de cada remédio novo (o do último registro, se o nome se repetir no lote)
+            novos = {remedio[0]: remedio[2] for remedio in remedios if remedio[0] not in existentes}
+            conn.executemany("""
+                INSERT INTO remedios (nome, doses_por_dia, estoque_atual, unidade, limite_dias, paciente_id, data_ancora)
+                VALUES (?, ?, ?, ?, ?, ?, (SELECT last_run_date FROM app_info WHERE id = 1))
+                ON CONFLICT (paciente_id, nome) DO UPDATE SET
+                    doses_por_dia = excluded.doses_por_dia,
+                    estoque_atual = excluded.estoque_atual,
+                    unidade = excluded.unidade,
+                    limite_dias = excluded.limite_dias,
+                    data_ancora = excluded.data_ancora
+            """, ((*remedio, paciente_id) for remedio in remedios))
+            agora = formatar_data(datetime.now())
+            conn.executemany("""
+                INSERT INTO historico_estoque (remedio_id, paciente_id, quantidade_adicionada, data_adicao)
+                SELECT id, paciente_id, ?, ? FROM remedios WHERE paciente_id = ? AND nome = ?
+            """, ((estoque, agora, paciente_id, nome) for nome, estoque in novos.items() if estoque > 0))
+        return rejeitados
+
+    def gravar_reposicoes(self, reposicoes, paciente_id=PACIENTE_PADRAO):
+        """
+        Grava em uma transação entradas de histórico (nome, quantidade, data_adicao)
+        dos remédios do paciente, sem mudar o estoque. Retorna as posições das
+        entradas cujo remédio não existe.
+        """
+        nomes = list({nome for nome, _, _ in reposicoes})
+        faltando = []
+        with self._transacao(imediata=True) as conn:
+            ids = {}
+            for inicio in range(0, len(nomes), TAMANHO_LOTE_CONSULTA):
+                parte = nomes[inicio:inicio + TAMANHO_LOTE_CONSULTA]
+                ids.update(conn.execute(
+                    f"SELECT nome, id FROM remedios WHERE paciente_id = ? AND nome IN ({', '.join('?' * len(parte))})",
+                    (paciente_id, *parte)
+                ))
+            linhas = []
+            for posicao, (nome, quantidade, data_adicao) in enumerate(reposicoes):
+                if nome in ids:
+                    linhas.append((ids[nome], paciente_id, quantidade, formatar_data(data_adicao)))
+                else:
+                    faltando.append(posicao)
+            conn.executemany(
+                "INSERT INTO historico_estoque (remedio_id, paciente_id, quantidade_adicionada, data_adicao) VALUES (?, ?, ?, ?)",
+                linhas
+            )
+        return faltando
+
+    def exportar_remedios(self, paciente_id=PACIENTE_PADRAO):
+        """Gera (nome, doses_por_dia, estoque, unidade, limite_dias) dos remédios do paciente, sem carregá-los todos."""
+        yield from self.db.conexao().execute(
+            "SELECT nome, doses_por_dia, estoque_atual, unidade, limite_dias FROM remedios_hoje WHERE paciente_id = ? ORDER BY id",
+            (paciente_id,)
+        )
+
+    def exportar_historico(self, paciente_id=PACIENTE_PADRAO):
+        """Gera (nome, quantidade, data_adicao) do histórico do paciente, por remédio e data."""
+        yield from self.db.conexao().execute("""
+            SELECT r.nome, h.quantidade_adicionada, h.data_adicao
+            FROM historico_estoque h JOIN remedios r ON r.id = h.remedio_id
+            WHERE h.paciente_id = ?
+            ORDER BY h.remedio_id, h.data_adicao
+        """, (paciente_id,))
+
+    # --- Escritas ---
+
+    def cadastrar(self, nome, doses_por_dia, estoque, unidade="comprimido",
+                  limite_dias=LIMITE_DIAS_PADRAO, data_adicao=None, paciente_id=PACIENTE_PADRAO):
+        """Cadastra um remédio do paciente (e o estoque inicial no histórico). Retorna o id."""
+        nome = validar_remedio(nome, doses_por_dia, estoque, limite_dias)
+
+        try:
+            with self._transacao() as conn:
+                cursor = conn.execute(
+                    "INSERT INTO remedios (nome, doses_por_dia, estoque_atual, unidade, limite_dias, paciente_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (nome, doses_por_dia, estoque, unidade, limite_dias, paciente_id)
+                )
+                remedio_id = cursor.lastrowid
+
+                if estoque > 0:
+                    conn.execute(
+                        "INSERT INTO historico_estoque (remedio_id, paciente_id, quantidade_adicionada, data_adicao) "
+                        "VALUES (?, ?, ?, ?)",
+                        (remedio_id, paciente_id, estoque, formatar_data(data_adicao or datetime.now()))
+                    )
+        except sqlite3.IntegrityError as e:
+            if "FOREIGN KEY" in str(e):
+                raise PacienteNaoEncontrado(f"Paciente {paciente_id} não encontrado.") from e
+            raise RemedioDuplicado(f"O remédio '{nome}' já está cadastrado.") from e
+        return remedio_id
+
+    def adicionar_estoque(self, remedio_id, quantidade, data_adicao=None):
+        """Soma uma quantidade ao estoque de hoje do remédio e registra no histórico. Retorna o novo estoque."""
+        if quantidade <= 0:
+            raise ValorInvalido("A quantidade deve ser um número positivo.")
+        validar_valores((quantidade,))
+
+        with self._transacao() as conn:
+            # Reancora o remédio na última verificação
+            cursor = conn.execute(f"""
+                UPDATE remedios
+                SET estoque_atual = {ESTOQUE_HOJE_DOSES_SQL} + ?,
+                    data_ancora = (SELECT last_run_date FROM app_info WHERE id = 1)
+                WHERE id = ?
+            """, (quantidade, remedio_id))
+            if cursor.rowcount == 0:
+                raise RemedioNaoEncontrado(f"Remédio {remedio_id} não encontrado.")
+            conn.execute("""
+                INSERT INTO historico_estoque (remedio_id, paciente_id, quantidade_adicionada, data_adicao)
+                SELECT id, paciente_id, ?, ? FROM remedios WHERE id = ?
+            """, (quantidade, formatar_data(data_adicao or datetime.now()), remedio_id))
+            # Recém-ancorado na última verificação: a coluna já é o estoque de hoje
+            return conn.execute("SELECT estoque_atual FROM remedios WHERE id = ?", (remedio_id,)).fetchone()[0]
+
+    def definir_estoque(self, remedio_id, quantidade):
+        """Define o estoque de hoje do remédio (e o reancora na última verificação). Retorna o novo estoque."""
+        if quantidade < 0:
+            raise ValorInvalido("O estoque não pode ser negativo.")
+        validar_valores((quantidade,))
+
+        with self._transacao() as conn:
+            cursor = conn.execute("""
+                UPDATE remedios
+                SET estoque_atual = ?,
+                    data_ancora = (SELECT last_run_date FROM app_info WHERE id = 1)
+                WHERE id = ?
+            """, (quantidade, remedio_id))
+            if cursor.rowcount == 0:
+                raise RemedioNaoEncontrado(f"Remédio {remedio_id} não encontrado.")
+        return quantidade
+
+    def definir_limite_alerta(self, remedio_id, limite_dias):
+        """Define com quantos dias restantes o remédio passa a gerar alerta."""
+        if limite_dias < 0:
+            raise ValorInvalido("O limite não pode ser negativo.")
+        validar_valores((limite_dias,))
+
+        with self._transacao() as conn:
+            cursor = conn.execute("UPDATE remedios SET limite_dias = ? WHERE id = ?", (limite_dias, remedio_id))
+            if cursor.rowcount == 0:
+                raise RemedioNaoEncontrado(f"Remédio {remedio_id} não encontrado.")
+
+    def remover(self, remedio_id):
+        """Remove o remédio (o histórico vai junto, por ON DELETE CASCADE)."""
+        with self._transacao() as conn:
+            cursor = conn.execute("DELETE FROM remedios WHERE id = ?", (remedio_id,))
+            if cursor.rowcount == 0:
+                raise RemedioNaoEncontrado(f"Remédio {remedio_id} não encontrado.")
+
+    # --- Horários das doses ---
+
+    def horarios(self, remedio_id):
+        """(id, minuto, quantidade) dos horários do remédio, em ordem de horário."""
+        return self.db.conexao().execute(
+            "SELECT id, minuto, quantidade FROM horarios WHERE remedio_id = ? ORDER BY minuto", (remedio_id,)
+        ).fetchall()
+
+    def listar_horarios(self):
+        """Gera (id, remedio_id, minuto) de todos os horários, sem carregá-los todos."""
+        yield from self.db.conexao().execute("SELECT id, remedio_id, minuto FROM horarios")
+
+    def definir_horarios(self, remedio_id, horarios):
+        """
+        Troca os horários do remédio pelos 'horarios' ((minuto, quantidade), como
+        os de interpretar_horarios). Com horários, o remédio passa a ser debitado
+        dose a dose e as doses_por_dia viram a soma das quantidades; sem nenhum,
+        volta ao débito diário. O estoque de hoje não muda (o remédio é reancorado
+        na última verificação). Um horário que continua (mesmo minuto) mantém o id
+        e as doses já tomadas. Retorna os horários gravados, como horarios().
+        """
+        horarios = validar_horarios(horarios)
+        minutos = [minuto for minuto, _ in horarios]
+
+        with self._transacao(imediata=True) as conn:
+            # As expressões do SET leem a linha de antes: o estoque de hoje pelo modo antigo
+            cursor = conn.execute(f"""
+                UPDATE remedios
+                SET estoque_atual = {ESTOQUE_HOJE_DOSES_SQL},
+                    data_ancora = (SELECT last_run_date FROM app_info WHERE id = 1),
+                    debito_por_dose = ?,
+                    doses_por_dia = COALESCE(?, doses_por_dia)
+                WHERE id = ?
+            """, (bool(horarios), sum(quantidade for _, quantidade in horarios) or None, remedio_id))
+            if cursor.rowcount == 0:
+                raise RemedioNaoEncontrado(f"Remédio {remedio_id} não encontrado.")
+            conn.execute(
+                f"DELETE FROM horarios WHERE remedio_id = ? AND minuto NOT IN ({', '.join('?' * len(minutos))})",
+                (remedio_id, *minutos)
+            )
+            conn.executemany("""
+                INSERT INTO horarios (remedio_id, minuto, quantidade) VALUES (?, ?, ?)
+                ON CONFLICT (remedio_id, minuto) DO UPDATE SET quantidade = excluded.quantidade
+            """, ((remedio_id, minuto, quantidade) for minuto, quantidade in horarios))
+            return self.horarios(remedio_id)
+
+    def doses_pendentes(self, horario_ids, dia):
+        """
+        Doses (Dose) dos horários 'horario_ids' no 'dia' (um date) que ainda não
+        foram tomadas, em ordem de horário e nome. Horários que não existem mais
+        são ignorados.
+        """
+        ids = list(horario_ids)
+        conn = self.db.conexao()
+        linhas = []
+        for inicio in range(0, len(ids), TAMANHO_LOTE_CONSULTA):
+            parte = ids[inicio:inicio + TAMANHO_LOTE_CONSULTA]
+            linhas += conn.execute(f"""
+                SELECT h.id, r.id, r.nome, h.minuto, h.quantidade, r.unidade, {PACIENTE_ALERTA_SQL}
+                FROM horarios h JOIN remedios r ON r.id = h.remedio_id
+                WHERE h.id IN ({', '.join('?' * len(parte))})
+                  AND NOT EXISTS (SELECT 1 FROM doses_tomadas t WHERE t.horario_id = h.id AND t.dia = ?)
+            """, (*parte, dia.isoformat())).fetchall()
+        linhas.sort(key=lambda linha: (linha[3], linha[2]))
+        return [Dose(horario_id, remedio_id, nome, minuto, quantidade, unidade, dia, paciente)
+                for horario_id, remedio_id, nome, minuto, quantidade, unidade, paciente in linhas]
+
+    def dose_pendente(self, remedio_id, dia=None):
+        """A primeira dose (Dose) do remédio no 'dia' (hoje) ainda não tomada, ou None."""
+        dia = dia or date.today()
+        resultado = self.db.conexao().execute("""
+            SELECT h.id FROM horarios h
+            WHERE h.remedio_id = ?
+              AND NOT EXISTS (SELECT 1 FROM doses_tomadas t WHERE t.horario_id = h.id AND t.dia = ?)
+            ORDER BY h.minuto LIMIT 1
+        """, (remedio_id, dia.isoformat())).fetchone()
+        if resultado is None:
+            return None
+        doses = self.doses_pendentes(resultado, dia)
+        return doses[0] if doses else None
+
+    @metricas.cronometrar("doses.tomar")
+    def tomar_dose(self, horario_id, dia=None, tomada_em=None):
+        """
+        Registra a dose do horário no 'dia' (hoje) e debita a sua quantidade do
+        estoque de hoje do remédio. Retorna o novo estoque, ou None se essa dose já
+        estava registrada (não debita de novo, nem vinda de outro processo).
+        Levanta HorarioNaoEncontrado.
+        """
+        dia = dia or date.today()
+        with self._transacao(imediata=True) as conn:
+            horario = conn.execute("SELECT remedio_id, quantidade FROM horarios WHERE id = ?", (horario_id,)).fetchone()
+            if horario is None:
+                raise HorarioNaoEncontrado(f"Horário {horario_id} não encontrado.")
+            remedio_id, quantidade = horario
+            cursor = conn.execute(
+                "INSERT INTO doses_tomadas (horario_id, dia, tomada_em) VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+                (horario_id, dia.isoformat(), formatar_data(tomada_em or datetime.now()))
+            )
+            if cursor.rowcount == 0:
+                return None
+            # Reancora na última verificação, como adicionar_estoque
+            conn.execute(f"""
+                UPDATE remedios
+                SET estoque_atual = MAX(0, {ESTOQUE_HOJE_DOSES_SQL} - ?),
+                    data_ancora = (SELECT last_run_date FROM app_info WHERE id = 1)
+                WHERE id = ?
+            """, (quantidade, remedio_id))
+            return conn.execute("SELECT estoque_atual FROM remedios WHERE id = ?", (remedio_id,)).fetchone()[0]
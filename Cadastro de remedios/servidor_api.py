@@ -0,0 +1,372 @@
+"""
+API HTTP/JSON local sobre o banco de estoque.
+
+Serve em 127.0.0.1 (só para programas da própria máquina, como o painel da
+farmácia e scripts) a lista de remédios, a previsão de término, os alertas
+de estoque baixo e as escritas de estoque. As requisições são atendidas por
+um grupo fixo de threads: cada uma lê pela sua própria conexão (o
+GerenciadorConexoes abre uma por thread, em WAL, e a reaproveita), e toda
+escrita passa pela fila do EscritorBanco, a mesma thread de escrita da
+janela, em vez de abrir transações concorrentes no banco.
+
+Rotas:
+  GET  /remedios?paciente=&busca=&ordem=&depois=&limite=
+  GET  /remedios/<id>
+  GET  /remedios/<id>/previsao
+  POST /remedios/<id>/estoque   {"quantidade": n}  soma ao estoque
+  PUT  /remedios/<id>/estoque   {"estoque": n}     define o estoque
+  GET  /alertas?paciente=
+  GET  /pacientes
+
+O POST de estoque não é idempotente: repeti-lo soma a quantidade de novo. Se a
+fila de escrita não responder a tempo, a resposta diz o que aconteceu:
+  503  a escrita foi cancelada antes de começar; nada foi gravado e pode repetir
+  202  {"pendente": true}: a escrita já começou e termina sem esta requisição;
+       não repita, confira o estoque em GET /remedios/<id>
+
+Uso (sem a janela; com ela, use gerenciador_remedios.py --api[=porta]):
+  python servidor_api.py [--porta 8765] [--banco remedios.db] [--trabalhadores 8]
+"""
+import argparse
+import json
+import logging
+import re
+import sqlite3
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as TempoEsgotado
+from datetime import date
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from agendador import Agendador, proxima_meia_noite
+from banco import GerenciadorConexoes
+from diagnostico import configurar_logging, metricas
+from escritor import EscritorBanco
+from remedios_core import (
+    DB_PATH, ErroValidacao, PacienteNaoEncontrado, RemedioNaoEncontrado, ServicoEstoque,
+)
+
+ENDERECO = "127.0.0.1" # Só conexões da própria máquina
+PORTA_PADRAO = 8765
+TRABALHADORES = 8 # Threads que atendem requisições (cada uma com a sua conexão de leitura)
+LIMITE_PADRAO = 200 # Remédios por página da lista
+LIMITE_MAXIMO = 1000
+TEMPO_MAX_ESCRITA_S = 10 # Espera pela fila de escrita antes de responder 503
+TEMPO_OCIOSO_S = 30 # Conexão keep-alive parada por mais que isso é fechada (libera a thread)
+TAMANHO_MAX_CORPO = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+_ROTA_REMEDIO = re.compile(r"^/remedios/(\d+)(/previsao|/estoque)?$")
+
+
+class EscritaPendente(Exception):
+    """A escrita já começou na thread de escrita, mas não terminou a tempo da resposta."""
+
+    def __init__(self, remedio_id):
+        super().__init__("A escrita ainda está sendo gravada; confira o estoque antes de repetir.")
+        self.remedio_id = remedio_id
+
+
+class ErroRequisicao(Exception):
+    """Resposta de erro com o status HTTP e a mensagem."""
+
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def _inteiro(parametros, nome, padrao=None):
+    valores = parametros.get(nome)
+    if not valores:
+        return padrao
+    try:
+        return int(valores[0])
+    except ValueError:
+        raise ErroRequisicao(HTTPStatus.BAD_REQUEST, f"Parâmetro '{nome}' não é um número inteiro.") from None
+
+
+def _texto(parametros, nome):
+    valores = parametros.get(nome)
+    return (valores[0].strip() or None) if valores else None
+
+
+def _data(dias, data_fim):
+    """A data de fim (ordinal de prever_lote) em ISO, ou None quando não há previsão."""
+    return date.fromordinal(int(data_fim)).isoformat() if dias >= 0 else None
+
+
+def _campo_inteiro(corpo, campo):
+    valor = corpo.get(campo) if isinstance(corpo, dict) else None
+    if isinstance(valor, bool) or not isinstance(valor, int):
+        raise ErroRequisicao(HTTPStatus.BAD_REQUEST, f"Campo '{campo}' deve ser um número inteiro.")
+    return valor
+
+
+class ApiEstoque:
+    """As operações da API sobre o ServicoEstoque, já em dicionários prontos para o JSON."""
+
+    def __init__(self, servico, escritor, ao_alterar=None):
+        """'ao_alterar(remedio_id)' é chamada depois de cada escrita confirmada (a janela atualiza a linha)."""
+        self.servico = servico
+        self.escritor = escritor
+        self.ao_alterar = ao_alterar
+
+    def _remedios(self, linhas):
+        dias_restantes, datas_fim = self.servico.prever(linhas)
+        return [
+            {"id": remedio_id, "nome": nome, "doses_por_dia": doses_por_dia, "estoque": estoque,
+             "unidade": unidade, "dias_restantes": int(dias) if dias >= 0 else None,
+             "data_fim": _data(dias, data_fim)}
+            for (remedio_id, nome, doses_por_dia, estoque, unidade), dias, data_fim
+            in zip(linhas, dias_restantes, datas_fim)
+        ]
+
+    def listar(self, parametros):
+        limite = min(max(_inteiro(parametros, "limite", LIMITE_PADRAO), 1), LIMITE_MAXIMO)
+        depois = _inteiro(parametros, "depois")
+        busca, ordem = _texto(parametros, "busca"), _texto(parametros, "ordem")
+        paciente_id = _inteiro(parametros, "paciente")
+        if depois is None:
+            linhas = self.servico.listar(0, limite, busca, ordem, paciente_id)
+        else:
+            linhas = self.servico.listar_depois(depois, limite, busca, ordem, paciente_id)
+        # 'proximo' vai no 'depois' da página seguinte (paginação por chave, não por OFFSET)
+        proximo = linhas[-1][0] if len(linhas) == limite else None
+        return {"remedios": self._remedios(linhas), "proximo": proximo}
+
+    def obter(self, remedio_id):
+        linha = self.servico.obter(remedio_id)
+        if linha is None:
+            raise RemedioNaoEncontrado(f"Remédio {remedio_id} não encontrado.")
+        return self._remedios([linha])[0]
+
+    def previsao(self, remedio_id):
+        """A previsão pela dose prescrita e, se houver reposições, pelo consumo observado."""
+        resultado = self.obter(remedio_id)
+        consumo = self.servico.consumo(remedio_id)
+        resultado["consumo_observado"] = consumo.consumo_observado if consumo else None
+        resultado["data_fim_ajustada"] = (
+            consumo.data_fim_ajustada.isoformat() if consumo and consumo.data_fim_ajustada else None
+        )
+        return resultado
+
+    def alertas(self, parametros):
+        return {"alertas": [alerta._asdict() for alerta in self.servico.verificar_alertas(_inteiro(parametros, "paciente"))]}
+
+    def pacientes(self):
+        return {"pacientes": [{"id": paciente_id, "nome": nome} for paciente_id, nome in self.servico.listar_pacientes()]}
+
+    def _gravar(self, remedio_id, funcao):
+        """
+        Roda 'funcao()' na thread de escrita e espera o commit. Retorna o resultado.
+        Se o commit demorar, cancela o comando (nada foi gravado: 503) ou, se ele
+        já começou, levanta EscritaPendente (202), para que uma nova tentativa do
+        cliente não grave a mesma escrita duas vezes.
+        """
+        futuro = Future()
+        comando = self.escritor.enviar(lambda conn: funcao(), futuro.set_result, futuro.set_exception)
+        try:
+            resultado = futuro.result(TEMPO_MAX_ESCRITA_S)
+        except TempoEsgotado:
+            if comando.cancelar():
+                raise ErroRequisicao(
+                    HTTPStatus.SERVICE_UNAVAILABLE, "A fila de escrita não respondeu a tempo; nada foi gravado."
+                ) from None
+            if self.ao_alterar:
+                futuro.add_done_callback(lambda f: f.exception() is None and self.ao_alterar(remedio_id))
+            raise EscritaPendente(remedio_id) from None
+        if self.ao_alterar:
+            self.ao_alterar(remedio_id)
+        return resultado
+
+    def adicionar_estoque(self, remedio_id, corpo):
+        quantidade = _campo_inteiro(corpo, "quantidade")
+        estoque = self._gravar(remedio_id, lambda: self.servico.adicionar_estoque(remedio_id, quantidade))
+        return {"id": remedio_id, "estoque": estoque}
+
+    def definir_estoque(self, remedio_id, corpo):
+        quantidade = _campo_inteiro(corpo, "estoque")
+        estoque = self._gravar(remedio_id, lambda: self.servico.definir_estoque(remedio_id, quantidade))
+        return {"id": remedio_id, "estoque": estoque}
+
+
+class ManipuladorAPI(BaseHTTPRequestHandler):
+    """Uma conexão HTTP/1.1 (keep-alive): roteia cada requisição para a ApiEstoque do servidor."""
+
+    protocol_version = "HTTP/1.1"
+    timeout = TEMPO_OCIOSO_S
+    # Cabeçalhos e corpo saem em dois envios; com o algoritmo de Nagle, o segundo
+    # esperaria o ACK atrasado do cliente (~40 ms por resposta em keep-alive)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._atender("GET")
+
+    def do_POST(self):
+        self._atender("POST")
+
+    def do_PUT(self):
+        self._atender("PUT")
+
+    def _atender(self, metodo):
+        with metricas.medir(f"api: {metodo}"):
+            try:
+                status, resposta = HTTPStatus.OK, self._rotear(metodo)
+            except EscritaPendente as e:
+                status, resposta = HTTPStatus.ACCEPTED, {"id": e.remedio_id, "pendente": True, "mensagem": str(e)}
+            except ErroRequisicao as e:
+                status, resposta = e.status, {"erro": str(e)}
+            except (RemedioNaoEncontrado, PacienteNaoEncontrado) as e:
+                status, resposta = HTTPStatus.NOT_FOUND, {"erro": str(e)}
+            except ErroValidacao as e:
+                status, resposta = HTTPStatus.BAD_REQUEST, {"erro": str(e)}
+            except sqlite3.Error as e:
+                logger.error("Erro de banco de dados na API (%s %s): %s", metodo, self.path, e)
+                status, resposta = HTTPStatus.INTERNAL_SERVER_ERROR, {"erro": "Erro de banco de dados."}
+            self._responder(status, resposta)
+
+    def _rotear(self, metodo):
+        url = urlsplit(self.path)
+        parametros = parse_qs(url.query)
+        api = self.server.api
+
+        if url.path == "/remedios" and metodo == "GET":
+            return api.listar(parametros)
+        if url.path == "/alertas" and metodo == "GET":
+            return api.alertas(parametros)
+        if url.path == "/pacientes" and metodo == "GET":
+            return api.pacientes()
+
+        rota = _ROTA_REMEDIO.match(url.path)
+        if rota is None:
+            raise ErroRequisicao(HTTPStatus.NOT_FOUND, f"Rota desconhecida: {url.path}")
+        remedio_id, subrota = int(rota.group(1)), rota.group(2)
+        if subrota is None and metodo == "GET":
+            return api.obter(remedio_id)
+        if subrota == "/previsao" and metodo == "GET":
+            return api.previsao(remedio_id)
+        if subrota == "/estoque" and metodo == "POST":
+            return api.adicionar_estoque(remedio_id, self._ler_corpo())
+        if subrota == "/estoque" and metodo == "PUT":
+            return api.definir_estoque(remedio_id, self._ler_corpo())
+        raise ErroRequisicao(HTTPStatus.METHOD_NOT_ALLOWED, f"Método {metodo} não aceito em {url.path}")
+
+    def _ler_corpo(self):
+        try:
+            tamanho = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            tamanho = -1
+        if not 0 < tamanho <= TAMANHO_MAX_CORPO:
+            raise ErroRequisicao(HTTPStatus.BAD_REQUEST, "Corpo ausente ou grande demais.")
+        try:
+            return json.loads(self.rfile.read(tamanho))
+        except (ValueError, UnicodeDecodeError):
+            raise ErroRequisicao(HTTPStatus.BAD_REQUEST, "O corpo não é um JSON válido.") from None
+
+    def _responder(self, status, resposta):
+        corpo = json.dumps(resposta, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *args):
+        logger.debug("%s %s", self.address_string(), formato % args)
+
+
+class ServidorAPI(HTTPServer):
+    """
+    HTTPServer que entrega cada conexão a um grupo fixo de threads, em vez de
+    abrir uma thread por conexão: as threads (e as conexões com o banco delas)
+    são reaproveitadas entre as requisições. Uma conexão keep-alive ocupa a
+    thread até fechar ou ficar TEMPO_OCIOSO_S parada.
+    """
+
+    request_queue_size = 128
+
+    def __init__(self, api, porta=PORTA_PADRAO, trabalhadores=TRABALHADORES):
+        super().__init__((ENDERECO, porta), ManipuladorAPI)
+        self.api = api
+        self._grupo = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix="api")
+        self._thread = None
+
+    @property
+    def porta(self):
+        return self.server_address[1]
+
+    def process_request(self, request, client_address):
+        self._grupo.submit(self._atender_conexao, request, client_address)
+
+    def _atender_conexao(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def iniciar(self):
+        """Atende as conexões em uma thread própria."""
+        self._thread = threading.Thread(target=self.serve_forever, name="api", daemon=True)
+        self._thread.start()
+        logger.info("API servindo em http://%s:%d", ENDERECO, self.porta)
+
+    def parar(self):
+        """Para de aceitar conexões e espera as requisições em andamento."""
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+        self._grupo.shutdown(wait=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API HTTP/JSON local do estoque de remédios.")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO, help="Porta em 127.0.0.1 (0 = qualquer livre)")
+    parser.add_argument("--banco", default=DB_PATH, help="Banco de dados (padrão: o do programa)")
+    parser.add_argument("--trabalhadores", type=int, default=TRABALHADORES, help="Threads que atendem requisições")
+    args = parser.parse_args(argv)
+
+    configurar_logging()
+    db = GerenciadorConexoes(args.banco)
+    servico = ServicoEstoque(db)
+    escritor = EscritorBanco(db, lambda funcao, *args: funcao(*args))
+    agendador = Agendador()
+    try:
+        servico.inicializar()
+        servico.debitar_dias()
+    except sqlite3.Error as e:
+        print(f"Erro de banco de dados: {e}", file=sys.stderr)
+        return 2
+
+    def virar_dia():
+        escritor.enviar(lambda conn: servico.debitar_dias())
+        agendador.agendar("virada_dia", proxima_meia_noite(), virar_dia)
+
+    escritor.iniciar()
+    agendador.agendar("virada_dia", proxima_meia_noite(), virar_dia)
+    agendador.iniciar()
+    servidor = ServidorAPI(ApiEstoque(servico, escritor), args.porta, args.trabalhadores)
+    # A linha abaixo é lida por quem inicia o servidor com --porta 0 (ex.: benchmarks/bench_api.py)
+    print(f"Servindo em http://{ENDERECO}:{servidor.porta}", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.parar()
+        agendador.parar()
+        escritor.parar()
+        db.fechar_todas()
+        logger.info("Métricas:\n%s", metricas.resumo())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
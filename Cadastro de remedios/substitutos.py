@@ -0,0 +1,110 @@
+"""
+Substitutos da interface para os testes e os benchmarks: uma Treeview e um
+'root' do Tk que funcionam sem tela, e a montagem de um App só com o banco e
+a lista.
+"""
+import gerenciador_remedios as gr
+
+
+class ArvoreSubstituta:
+    """
+    Imita a parte da API da ttk.Treeview usada pelo App, com os mesmos custos:
+    inserir no fim e trocar os valores de uma linha não dependem do tamanho da
+    lista; posições (index, move, inserir no meio) percorrem a lista. Conta as
+    chamadas que mudam a árvore em 'operacoes' (o que, numa Treeview de verdade,
+    vira trabalho do Tk).
+    """
+
+    def __init__(self):
+        self.itens = {} # iid -> valores (também os desligados)
+        self._ordem = [] # iids ligados, na ordem exibida
+        self._foco = ""
+        self.operacoes = 0
+
+    def get_children(self, item=""):
+        return tuple(self._ordem)
+
+    def insert(self, parent, index, iid=None, values=()):
+        self.operacoes += 1
+        iid = str(iid)
+        self.itens[iid] = tuple(values)
+        if index == "end":
+            self._ordem.append(iid)
+        else:
+            self._ordem.insert(index, iid)
+        return iid
+
+    def item(self, iid, option=None, **kw):
+        if "values" in kw:
+            self.operacoes += 1
+            self.itens[str(iid)] = tuple(kw["values"])
+            return None
+        return self.itens[str(iid)] if option == "values" else {"values": self.itens[str(iid)]}
+
+    def move(self, iid, parent, index):
+        self.operacoes += 1
+        iid = str(iid)
+        if iid in self._ordem:
+            self._ordem.remove(iid)
+        self._ordem.insert(index, iid)
+
+    def detach(self, *iids):
+        self.operacoes += len(iids)
+        desligados = {str(iid) for iid in iids}
+        self._ordem = [iid for iid in self._ordem if iid not in desligados]
+
+    def index(self, iid):
+        return self._ordem.index(str(iid))
+
+    def delete(self, *iids):
+        self.operacoes += len(iids)
+        apagados = {str(iid) for iid in iids}
+        self._ordem = [iid for iid in self._ordem if iid not in apagados]
+        for iid in apagados:
+            del self.itens[iid]
+        if self._foco in apagados:
+            self._foco = ""
+
+    def focus(self, iid=None):
+        if iid is None:
+            return self._foco
+        self._foco = str(iid)
+
+    def yview_scroll(self, numero, unidade):
+        pass
+
+
+class RaizSubstituta:
+    """Imita o 'root' do Tk para o que o App agenda com after/after_idle."""
+
+    def after(self, ms, funcao=None, *args):
+        pass
+
+    def after_idle(self, funcao, *args):
+        pass
+
+
+def criar_app(db_path, tree, root=None, modo_virtual=False):
+    """Monta um App sem interface, só com o banco e a lista."""
+    app = gr.App.__new__(gr.App)
+    app.root = root or RaizSubstituta()
+    app.db_name = db_path
+    app.db = None
+    app.notificador = None
+    app.lembretes = None
+    app._proximo_prazo = None
+    app._linhas_exibidas = {}
+    app.registros = gr.CacheRegistros()
+    app.modo_virtual = modo_virtual
+    app._inicio_janela = 0
+    app._tem_mais_antes = False
+    app._tem_mais_depois = False
+    app._carga_agendada = False
+    app._busca = None
+    app._busca_agendada = None
+    app._ordem = None
+    app._coluna_ordem = None
+    app.paciente_id = gr.PACIENTE_PADRAO
+    app.tree = tree
+    app._init_db()
+    return app
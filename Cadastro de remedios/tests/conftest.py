@@ -0,0 +1,33 @@
+"""
+Peças compartilhadas pelos testes: o caminho dos módulos do programa e um
+ServicoEstoque sobre um banco novo em uma pasta temporária.
+"""
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import remedios_core as core
+from banco import GerenciadorConexoes
+
+DIA_INICIAL = date(2024, 1, 1)
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = GerenciadorConexoes(str(tmp_path / "remedios.db"))
+    yield db
+    db.fechar_todas()
+
+
+@pytest.fixture(params=[core.MODO_DEBITO, core.MODO_ANCORA])
+def servico(request, db):
+    """Serviço já inicializado, com a primeira verificação em DIA_INICIAL, em cada modo do estoque."""
+    servico = core.ServicoEstoque(db)
+    servico.inicializar()
+    servico.debitar_dias(hoje=DIA_INICIAL)
+    servico.migrar_modo_estoque(request.param)
+    return servico
@@ -0,0 +1,48 @@
+"""Níveis de alerta gravados só depois que o aviso é exibido."""
+import pytest
+
+import remedios_core as core
+import verificacao
+
+
+@pytest.fixture
+def servico_hoje(db):
+    """Serviço com a primeira verificação hoje e um remédio no limite de alerta (2 dias de estoque)."""
+    servico = core.ServicoEstoque(db)
+    servico.inicializar()
+    servico.debitar_dias()
+    servico.cadastrar("Dipirona", 2, 4, limite_dias=5)
+    return servico
+
+
+def test_alerta_nao_registrado_volta_na_proxima_verificacao(servico_hoje):
+    primeira = servico_hoje.verificar_alertas_novos(registrar=False)
+    assert [a.nome for a in primeira] == ["Dipirona"]
+    assert servico_hoje.verificar_alertas_novos(registrar=False) == primeira
+
+    servico_hoje.registrar_alertas(primeira)
+    assert servico_hoje.verificar_alertas_novos(registrar=False) == []
+
+
+def test_registrar_nivel_antigo_e_corrigido_pela_proxima_verificacao(servico_hoje):
+    alertas = servico_hoje.verificar_alertas_novos(registrar=False)
+    servico_hoje.adicionar_estoque(alertas[0].remedio_id, 100)
+    servico_hoje.registrar_alertas(alertas) # Exibido depois da reposição
+
+    assert servico_hoje.verificar_alertas_novos() == []
+    nivel = servico_hoje.db.conexao().execute("SELECT nivel_alerta FROM remedios").fetchone()[0]
+    assert nivel == core.NIVEL_NENHUM
+
+
+def test_check_com_destino_falhando_nao_da_alerta_como_avisado(servico_hoje, tmp_path, monkeypatch):
+    monkeypatch.setattr(verificacao, "configurar_logging", lambda *args: None)
+    banco = servico_hoje.db.caminho
+    servico_hoje.db.fechar_todas()
+
+    # Uma pasta no lugar do arquivo: o destino não consegue exibir
+    assert verificacao.main(["--check", f"--banco={banco}", f"--notificacoes=arquivo:{tmp_path}"]) == verificacao.SAIDA_ERRO_ENVIO
+
+    arquivo = tmp_path / "avisos.log"
+    assert verificacao.main(["--check", f"--banco={banco}", f"--notificacoes=arquivo:{arquivo}"]) == verificacao.SAIDA_ALERTAS
+    assert "Dipirona" in arquivo.read_text(encoding="utf-8")
+    assert verificacao.main(["--check", f"--banco={banco}", f"--notificacoes=arquivo:{arquivo}"]) == verificacao.SAIDA_OK
@@ -0,0 +1,48 @@
+"""Escritas da API quando a fila de escrita não responde a tempo."""
+import threading
+from http import HTTPStatus
+
+import pytest
+
+import servidor_api
+from escritor import EscritorBanco
+from servidor_api import ApiEstoque, ErroRequisicao, EscritaPendente
+
+
+@pytest.fixture
+def api(servico, db, monkeypatch):
+    monkeypatch.setattr(servidor_api, "TEMPO_MAX_ESCRITA_S", 0.05)
+    escritor = EscritorBanco(db, lambda funcao, *args: funcao(*args))
+    yield ApiEstoque(servico, escritor)
+    escritor.parar()
+
+
+def test_escrita_que_nao_comecou_e_cancelada(api, servico):
+    remedio_id = servico.cadastrar("Losartana", 1, 10)
+    # Thread de escrita ainda parada: o comando só espera na fila
+    with pytest.raises(ErroRequisicao) as erro:
+        api.adicionar_estoque(remedio_id, {"quantidade": 5})
+    assert erro.value.status == HTTPStatus.SERVICE_UNAVAILABLE
+
+    api.escritor.iniciar()
+    api.escritor.parar()
+    assert servico.obter(remedio_id)[3] == 10 # O cliente pode repetir sem somar duas vezes
+
+
+def test_escrita_ja_comecada_fica_pendente(api, servico):
+    remedio_id = servico.cadastrar("Losartana", 1, 10)
+    liberar = threading.Event()
+    alterados = []
+    api.ao_alterar = alterados.append
+
+    def gravar():
+        liberar.wait(5)
+        return servico.adicionar_estoque(remedio_id, 5)
+
+    api.escritor.iniciar()
+    with pytest.raises(EscritaPendente):
+        api._gravar(remedio_id, gravar)
+    liberar.set()
+    api.escritor.parar()
+    assert servico.obter(remedio_id)[3] == 15
+    assert alterados == [remedio_id]
@@ -0,0 +1,62 @@
+"""Os dois modos do estoque contra o débito diário original, aplicado a uma cópia dos dados."""
+import sqlite3
+from datetime import timedelta
+
+from conftest import DIA_INICIAL
+
+# O débito de antes dos modos de armazenamento, rodado a cada virada do dia
+DEBITO_ORIGINAL = "UPDATE remedios SET estoque_atual = MAX(0, estoque_atual - doses_por_dia * ?)"
+
+# (nome, doses_por_dia, estoque): inclui sem estoque, sem dose diária e estoque que acaba no meio
+REMEDIOS = [
+    ("Sem estoque", 2, 0),
+    ("Sem dose diaria", 0, 15),
+    ("Acaba no meio", 3, 10),
+    ("Longo", 1, 500),
+    ("Exato", 2, 8),
+    ("Varias doses", 4, 37),
+]
+# Dias entre uma verificação e a seguinte (0 = aberto de novo no mesmo dia)
+INTERVALOS = [1, 3, 0, 7, 1, 30, 2]
+REPOSICOES = {3: ("Acaba no meio", 12), 5: ("Sem estoque", 6)} # Antes do intervalo de índice 3 e 5
+
+
+def _copia_original(remedios):
+    copia = sqlite3.connect(":memory:")
+    copia.execute("CREATE TABLE remedios (nome TEXT PRIMARY KEY, doses_por_dia INTEGER, estoque_atual INTEGER)")
+    copia.executemany("INSERT INTO remedios VALUES (?, ?, ?)", remedios)
+    return copia
+
+
+def _estoques(servico):
+    return dict(servico.db.conexao().execute("SELECT nome, estoque_atual FROM remedios_hoje"))
+
+
+def test_estoque_de_hoje_igual_ao_debito_original(servico):
+    ids = {}
+    conn = servico.db.conexao()
+    for nome, doses, estoque in REMEDIOS:
+        if doses > 0:
+            ids[nome] = servico.cadastrar(nome, doses, estoque)
+        else:
+            # O cadastro não aceita mais remédios sem dose diária, mas os bancos antigos podem tê-los
+            ids[nome] = conn.execute("""
+                INSERT INTO remedios (nome, doses_por_dia, estoque_atual, data_ancora)
+                VALUES (?, ?, ?, (SELECT last_run_date FROM app_info WHERE id = 1))
+            """, (nome, doses, estoque)).lastrowid
+            conn.commit()
+    copia = _copia_original(REMEDIOS)
+
+    hoje = DIA_INICIAL
+    for indice, dias in enumerate(INTERVALOS):
+        if indice in REPOSICOES:
+            nome, quantidade = REPOSICOES[indice]
+            servico.adicionar_estoque(ids[nome], quantidade)
+            copia.execute("UPDATE remedios SET estoque_atual = estoque_atual + ? WHERE nome = ?", (quantidade, nome))
+
+        hoje += timedelta(days=dias)
+        assert servico.debitar_dias(hoje=hoje) == (dias > 0)
+        if dias > 0:
+            copia.execute(DEBITO_ORIGINAL, (dias,))
+
+        assert _estoques(servico) == dict(copia.execute("SELECT nome, estoque_atual FROM remedios"))
@@ -0,0 +1,48 @@
+"""Remédios com horários (debito_por_dose) na virada do dia."""
+from datetime import timedelta
+
+import remedios_core as core
+from conftest import DIA_INICIAL
+
+
+def _cadastrar_com_horarios(servico, nome="Losartana", estoque=100):
+    """Remédio com duas doses de 1 por dia: 'estoque' dura estoque / 2 dias."""
+    remedio_id = servico.cadastrar(nome, 2, estoque, limite_dias=5)
+    servico.definir_horarios(remedio_id, [(8 * 60, 1), (20 * 60, 1)])
+    return remedio_id
+
+
+def test_estoque_alto_nao_gera_alerta_com_o_passar_dos_dias(servico):
+    # 100 unidades a 2 por dia duram 50 dias; com a âncora parada no cadastro,
+    # 'dia_fim' entraria no limite de 5 dias no dia 45 sem nenhuma dose tomada
+    _cadastrar_com_horarios(servico)
+    servico.verificar_alertas_novos()
+
+    for dias in (10, 46, 60):
+        servico.debitar_dias(hoje=DIA_INICIAL + timedelta(days=dias))
+        assert servico.verificar_alertas() == []
+        assert servico.verificar_alertas_novos() == []
+
+
+def test_dia_fim_conta_a_partir_da_ultima_verificacao(servico):
+    remedio_id = _cadastrar_com_horarios(servico)
+    hoje = DIA_INICIAL + timedelta(days=46)
+    servico.debitar_dias(hoje=hoje)
+
+    assert servico.proximo_prazo_alerta() == hoje + timedelta(days=50 - 5)
+    dia_fim = servico.db.conexao().execute("SELECT dia_fim FROM remedios WHERE id = ?", (remedio_id,)).fetchone()[0]
+    assert dia_fim == hoje.toordinal() + core.DIFERENCA_JULIANO + 50
+
+
+def test_doses_tomadas_aproximam_o_alerta(servico):
+    remedio_id = _cadastrar_com_horarios(servico, estoque=12)
+    servico.verificar_alertas_novos()
+    servico.debitar_dias(hoje=DIA_INICIAL + timedelta(days=30))
+    assert servico.verificar_alertas() == []
+
+    hoje = DIA_INICIAL + timedelta(days=30)
+    for horario_id, _, _ in servico.horarios(remedio_id):
+        servico.tomar_dose(horario_id, dia=hoje)
+
+    alertas = servico.verificar_alertas_novos()
+    assert [(a.remedio_id, a.estoque, a.dias_restantes) for a in alertas] == [(remedio_id, 10, 5)]
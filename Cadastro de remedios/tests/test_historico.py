@@ -0,0 +1,116 @@
+"""Histórico de reposições: consultas por intervalo, totais por período e estatísticas de consumo."""
+from datetime import date, datetime
+
+import pytest
+
+from remedios_core import ServicoEstoque, ValorInvalido
+
+REPOSICOES = [
+    ("2024-01-10 08:00:00", 30),
+    ("2024-01-31 23:59:59", 10),
+    ("2024-02-01 00:00:00", 20),
+    ("2024-02-15 12:30:00", 5),
+    ("2025-03-01 09:00:00", 60),
+]
+
+
+@pytest.fixture
+def remedio_id(servico):
+    remedio_id = servico.cadastrar("Losartana", 1, 0)
+    for data_adicao, quantidade in REPOSICOES:
+        servico.adicionar_estoque(remedio_id, quantidade, data_adicao)
+    return remedio_id
+
+
+def test_historico_usa_o_intervalo_semiaberto(servico, remedio_id):
+    # 'fim' fica de fora, 'inicio' fica dentro
+    assert servico.historico(remedio_id, date(2024, 1, 31), date(2024, 2, 1)) == [("2024-01-31 23:59:59", 10)]
+    assert servico.historico(remedio_id, date(2024, 2, 1), date(2024, 2, 15)) == [("2024-02-01 00:00:00", 20)]
+    assert servico.historico(remedio_id, datetime(2024, 2, 15, 12, 30), None) == [
+        ("2025-03-01 09:00:00", 60), ("2024-02-15 12:30:00", 5),
+    ]
+    assert servico.historico(remedio_id, fim=date(2024, 1, 10)) == []
+
+
+def test_historico_mais_recentes_primeiro_com_limite(servico, remedio_id):
+    assert servico.historico(remedio_id, limite=2) == [("2025-03-01 09:00:00", 60), ("2024-02-15 12:30:00", 5)]
+    assert len(servico.historico(remedio_id)) == len(REPOSICOES)
+
+
+def test_totais_por_periodo(servico, remedio_id):
+    assert servico.totais_por_periodo(remedio_id, "mes") == [("2025-03", 60, 1), ("2024-02", 25, 2), ("2024-01", 40, 2)]
+    assert servico.totais_por_periodo(remedio_id, "ano") == [("2025", 60, 1), ("2024", 65, 4)]
+    assert servico.totais_por_periodo(remedio_id, "dia", date(2024, 1, 31), date(2024, 2, 2)) == [
+        ("2024-02-01", 20, 1), ("2024-01-31", 10, 1),
+    ]
+    # Semana começando na segunda: 31/01 (quarta) e 01/02 (quinta) caem na mesma
+    semanas = servico.totais_por_periodo(remedio_id, "semana", date(2024, 1, 29), date(2024, 2, 5))
+    assert semanas == [("2024-S05", 30, 2)]
+
+    with pytest.raises(ValorInvalido):
+        servico.totais_por_periodo(remedio_id, "quinzena")
+
+
+def _estatisticas(servico, remedio_id):
+    return servico.db.conexao().execute("""
+        SELECT reposicoes, quantidade_total, primeira_reposicao, ultima_reposicao, ultima_quantidade, intervalo_ultimo
+        FROM estatisticas_consumo WHERE remedio_id = ?
+    """, (remedio_id,)).fetchone()
+
+
+def test_estatisticas_acompanham_cada_reposicao(servico):
+    remedio_id = servico.cadastrar("Losartana", 1, 30, data_adicao="2024-01-01 08:00:00")
+    assert _estatisticas(servico, remedio_id) == (1, 30, "2024-01-01 08:00:00", "2024-01-01 08:00:00", 30, None)
+
+    servico.adicionar_estoque(remedio_id, 20, "2024-01-21 08:00:00")
+    servico.adicionar_estoque(remedio_id, 10, "2024-01-31 20:00:00")
+    assert _estatisticas(servico, remedio_id) == (3, 60, "2024-01-01 08:00:00", "2024-01-31 20:00:00", 10, 10.5)
+
+    consumo = servico.consumo(remedio_id)
+    assert consumo.intervalo_medio == pytest.approx(15.25)
+    assert consumo.consumo_observado == pytest.approx(50 / 30.5)
+
+
+def test_reposicao_retroativa_so_muda_o_ultimo_intervalo_entre_as_duas_ultimas(servico):
+    remedio_id = servico.cadastrar("Losartana", 1, 30, data_adicao="2024-01-01 00:00:00")
+    servico.adicionar_estoque(remedio_id, 20, "2024-01-21 00:00:00")
+
+    # Antes da primeira: conta no total e na primeira data, o último intervalo fica
+    servico.adicionar_estoque(remedio_id, 5, "2023-12-01 00:00:00")
+    assert _estatisticas(servico, remedio_id) == (3, 55, "2023-12-01 00:00:00", "2024-01-21 00:00:00", 20, 20.0)
+
+    # Entre a penúltima e a última: passa a ser a penúltima
+    servico.adicionar_estoque(remedio_id, 7, "2024-01-16 00:00:00")
+    assert _estatisticas(servico, remedio_id) == (4, 62, "2023-12-01 00:00:00", "2024-01-21 00:00:00", 20, 5.0)
+
+    # Na mesma data da última conta como a mais recente
+    servico.adicionar_estoque(remedio_id, 3, "2024-01-21 00:00:00")
+    assert _estatisticas(servico, remedio_id) == (5, 65, "2023-12-01 00:00:00", "2024-01-21 00:00:00", 3, 0.0)
+
+
+def test_estatisticas_preenchidas_uma_vez_pelo_historico_existente(db):
+    # Banco de antes das versões, com datas no str() de um datetime e uma reposição lançada fora de ordem
+    conn = db.conexao()
+    with conn:
+        conn.execute("""CREATE TABLE remedios (id INTEGER PRIMARY KEY AUTOINCREMENT, nome TEXT NOT NULL UNIQUE,
+                        doses_por_dia INTEGER NOT NULL, estoque_atual INTEGER NOT NULL DEFAULT 0)""")
+        conn.execute("""CREATE TABLE historico_estoque (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        remedio_id INTEGER NOT NULL, quantidade_adicionada INTEGER NOT NULL, data_adicao DATE NOT NULL,
+                        FOREIGN KEY (remedio_id) REFERENCES remedios (id) ON DELETE CASCADE)""")
+        conn.execute("INSERT INTO remedios (nome, doses_por_dia, estoque_atual) VALUES ('Losartana', 1, 12)")
+        conn.execute("INSERT INTO remedios (nome, doses_por_dia, estoque_atual) VALUES ('Dipirona', 1, 0)")
+        conn.executemany("INSERT INTO historico_estoque (remedio_id, quantidade_adicionada, data_adicao) VALUES (1, ?, ?)", [
+            (30, "2024-01-01 08:00:00.123456"),
+            (10, "2024-01-31 08:00:00.654321"),
+            (20, "2024-01-21 08:00:00.000001"),
+        ])
+
+    servico = ServicoEstoque(db)
+    servico.inicializar()
+    assert _estatisticas(servico, 1) == (3, 60, "2024-01-01 08:00:00", "2024-01-31 08:00:00", 10, 10.0)
+    assert _estatisticas(servico, 2) is None
+
+    # Dali em diante, só o gatilho: a próxima abertura não preenche de novo
+    servico.adicionar_estoque(1, 5, "2024-02-10 08:00:00")
+    ServicoEstoque(db).inicializar()
+    assert _estatisticas(servico, 1) == (4, 65, "2024-01-01 08:00:00", "2024-02-10 08:00:00", 5, 10.0)
@@ -0,0 +1,79 @@
+"""Mais de um processo no mesmo banco: o débito do dia só uma vez e uma só janela por banco."""
+import queue
+import socket
+import threading
+from datetime import timedelta
+
+import pytest
+
+from banco import GerenciadorConexoes
+from conftest import DIA_INICIAL
+from instancia import CONFERIR, MOSTRAR, InstanciaUnica
+from remedios_core import ServicoEstoque
+
+
+def test_debito_do_dia_so_uma_vez_entre_dois_servicos(servico):
+    remedio_id = servico.cadastrar("Losartana", 2, 30)
+    outros = [GerenciadorConexoes(servico.db.caminho) for _ in range(2)]
+    servicos = [ServicoEstoque(db) for db in outros]
+    for outro in servicos:
+        outro.inicializar()
+
+    # Os dois "processos" viram o dia juntos, cada um com a sua conexão
+    largada = threading.Barrier(len(servicos))
+    resultados = []
+
+    def virar_dia(outro):
+        largada.wait()
+        resultados.append(outro.debitar_dias(hoje=DIA_INICIAL + timedelta(days=3)))
+
+    threads = [threading.Thread(target=virar_dia, args=(outro,)) for outro in servicos]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for db in outros:
+        db.fechar_todas()
+
+    assert sorted(resultados) == [False, True]
+    assert servico.obter(remedio_id)[3] == 30 - 2 * 3
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def primeira(tmp_path):
+    instancia = InstanciaUnica(str(tmp_path / "remedios.db"), _porta_livre())
+    assert instancia.adquirir()
+    yield instancia
+    instancia.liberar()
+
+
+def test_segunda_instancia_repassa_os_pedidos(primeira):
+    # Pedidos antes de atender() esperam; os seguintes são entregues na hora
+    assert not InstanciaUnica(primeira.caminho_banco, primeira.porta).adquirir(CONFERIR)
+    pedidos = queue.Queue()
+    primeira.atender(pedidos.put)
+    assert pedidos.get(timeout=5) == CONFERIR
+
+    assert not InstanciaUnica(primeira.caminho_banco, primeira.porta).adquirir(MOSTRAR)
+    assert pedidos.get(timeout=5) == MOSTRAR
+
+
+def test_outro_banco_na_mesma_porta_segue_sem_trava(primeira, tmp_path):
+    pedidos = queue.Queue()
+    primeira.atender(pedidos.put)
+    outra = InstanciaUnica(str(tmp_path / "outro.db"), primeira.porta)
+    assert outra.adquirir()
+    assert pedidos.empty()
+
+
+def test_porta_liberada_passa_para_a_proxima(primeira):
+    primeira.liberar()
+    proxima = InstanciaUnica(primeira.caminho_banco, primeira.porta)
+    assert proxima.adquirir()
+    proxima.liberar()
@@ -0,0 +1,109 @@
+"""Lista de remédios da janela, com a Treeview substituta (substitutos.py)."""
+import random
+import sqlite3
+
+import pytest
+
+import gerenciador_remedios as gr
+from substitutos import ArvoreSubstituta, criar_app
+
+
+class EscritorFalhando:
+    """Imita o EscritorBanco com uma escrita que sempre falha (ex.: banco travado por outro processo)."""
+
+    def enviar(self, funcao, ao_sucesso=None, ao_erro=None):
+        ao_erro(sqlite3.OperationalError("database is locked"))
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = criar_app(str(tmp_path / "lista.db"), ArvoreSubstituta())
+    gerador = random.Random(1)
+    for i in range(60):
+        app.servico.cadastrar(f"Remedio {i:02d}", gerador.randint(1, 3), gerador.randint(0, 40))
+    yield app
+    app.db.fechar_todas()
+
+
+def _ordem_do_banco(app):
+    return tuple(str(r[0]) for r in app.servico.listar(ordem=app._ordem, paciente_id=app.paciente_id))
+
+
+@pytest.mark.parametrize("ordem", [None, "fim", "-fim", "nome", "estoque"])
+def test_linha_alterada_vai_para_o_lugar_da_ordem(app, ordem):
+    app._ordem = ordem
+    app.atualizar_lista_remedios()
+    gerador = random.Random(2)
+    for _ in range(40):
+        remedio_id = gerador.randint(1, 60)
+        app.servico.definir_estoque(remedio_id, gerador.randint(0, 40))
+        app.atualizar_remedio_na_lista(remedio_id)
+        assert app.tree.get_children() == _ordem_do_banco(app)
+
+
+def test_atualizar_lista_mantem_o_foco(app):
+    app.atualizar_lista_remedios()
+    app.tree.focus("7")
+    app.servico.remover(3)
+    app.atualizar_lista_remedios()
+    assert app.tree.focus() == "7"
+    assert "3" not in app.tree.get_children()
+
+
+@pytest.mark.parametrize("ordem", [None, "nome"])
+def test_remocao_que_falha_devolve_a_linha_ao_mesmo_lugar(app, monkeypatch, ordem):
+    monkeypatch.setattr(gr.messagebox, "askyesno", lambda *args, **kw: True)
+    monkeypatch.setattr(gr.messagebox, "showerror", lambda *args, **kw: None)
+    app.escritor = EscritorFalhando()
+    app._ordem = ordem
+    app.atualizar_lista_remedios()
+    antes = app.tree.get_children()
+
+    app.tree.focus(antes[10])
+    app.remover_remedio_selecionado()
+
+    assert app.tree.get_children() == antes
+    assert app.registros.obter(int(antes[10])) is not None
+
+
+@pytest.mark.parametrize("ordem", [None, "fim", "-estoque", "nome"])
+def test_reconciliar_deixa_a_lista_igual_a_recarregada(app, ordem):
+    app._ordem = ordem
+    app.atualizar_lista_remedios()
+    gerador = random.Random(3)
+    for rodada in range(5):
+        for remedio_id in gerador.sample(range(1, 61 + rodada), 8):
+            if app.servico.obter(remedio_id) is not None:
+                app.servico.definir_estoque(remedio_id, gerador.randint(0, 40))
+        app.servico.remover(gerador.choice(app.servico.listar())[0])
+        app.servico.cadastrar(f"Novo {rodada}", 1, gerador.randint(0, 40))
+
+        app.tree.operacoes = 0
+        app.atualizar_lista_remedios()
+        assert app.tree.operacoes <= 8 * 3 + 2 # Só as linhas mudadas chegam à árvore
+        assert app.tree.get_children() == _ordem_do_banco(app)
+        valores = {iid: app.tree.item(iid, "values") for iid in app.tree.get_children()}
+        app._recarregar_lista()
+        assert {iid: app.tree.item(iid, "values") for iid in app.tree.get_children()} == valores
+
+
+def test_sem_mudancas_reconciliar_nao_mexe_na_arvore(app):
+    app._ordem = "fim"
+    app.atualizar_lista_remedios()
+    app.tree.operacoes = 0
+    app.atualizar_lista_remedios()
+    assert app.tree.operacoes == 0
+
+
+@pytest.mark.parametrize("atual, nova, movidas", [
+    ("abcde", "abcde", 0),
+    ("abcde", "bcdea", 1),
+    ("abcde", "eabcd", 1),
+    ("abcde", "edcba", 4),
+    ("xaby", "aybx", 2),
+])
+def test_linhas_fora_de_ordem_e_o_minimo(atual, nova, movidas):
+    mover = gr.linhas_fora_de_ordem(tuple(atual), list(nova))
+    assert len(mover) == movidas
+    ficam = [iid for iid in atual if iid not in mover]
+    assert ficam == [iid for iid in nova if iid not in mover]
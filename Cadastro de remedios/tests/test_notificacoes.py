@@ -0,0 +1,165 @@
+"""Despachante: resumo, intervalo mínimo, envio forçado e backend ocupado."""
+from datetime import date
+
+import pytest
+
+from notificacoes import ESPERA_BACKEND_OCUPADO_S, BackendMemoria, Despachante
+from remedios_core import NIVEL_LIMITE, NIVEL_ULTIMO_DIA, Alerta, Dose
+
+
+class AgendadorFalso:
+    """Guarda a última tarefa marcada com cada nome; o teste decide quando ela roda."""
+
+    def __init__(self):
+        self.tarefas = {}
+
+    def agendar_em(self, nome, segundos, funcao):
+        self.tarefas[nome] = (segundos, funcao)
+
+    def rodar(self, nome):
+        _, funcao = self.tarefas.pop(nome)
+        funcao()
+
+
+class BackendOcupado(BackendMemoria):
+    """Recusa as primeiras 'recusas' notificações, como o toast com outro ainda na tela."""
+
+    def __init__(self, recusas):
+        super().__init__()
+        self.recusas = recusas
+
+    def exibir(self, titulo, mensagem):
+        if self.recusas:
+            self.recusas -= 1
+            return False
+        return super().exibir(titulo, mensagem)
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+def alerta(remedio_id, estoque=4, nivel=NIVEL_LIMITE):
+    return Alerta(remedio_id, f"Remedio {remedio_id}", estoque, "comprimido", estoque // 2, nivel, None)
+
+
+@pytest.fixture
+def relogio():
+    return Relogio()
+
+
+@pytest.fixture
+def agendador():
+    return AgendadorFalso()
+
+
+def test_resumo_limita_os_itens_e_conta_o_resto():
+    despachante = Despachante(BackendMemoria(), max_itens=3, intervalo_minimo_s=0)
+    despachante.enviar([alerta(i, estoque=2 * i) for i in range(1, 8)] + [alerta(9, nivel=NIVEL_ULTIMO_DIA)])
+
+    [(titulo, mensagem)] = despachante.backend.exibidas
+    linhas = mensagem.split("\n")
+    assert titulo == "8 remédios com estoque baixo!"
+    assert len(linhas) == 4
+    assert linhas[0].startswith("Remedio 9:") # O nível mais alto primeiro, depois os que acabam antes
+    assert linhas[1].startswith("Remedio 1:")
+    assert linhas[-1] == "... e mais 5."
+    assert despachante.pendentes() == 0
+
+
+def test_alerta_unico_usa_a_mensagem_do_remedio():
+    despachante = Despachante(BackendMemoria(), intervalo_minimo_s=0)
+    despachante.enviar([alerta(1)])
+    assert despachante.backend.exibidas[0][0] == "Alerta de Estoque Baixo!"
+
+
+def test_alertas_dentro_do_intervalo_esperam_e_saem_juntos(relogio, agendador):
+    exibidos = []
+    despachante = Despachante(BackendMemoria(), agendador, intervalo_minimo_s=60, relogio=relogio,
+                              ao_exibir=exibidos.append)
+    despachante.enviar([alerta(1)])
+    assert len(despachante.backend.exibidas) == 1
+
+    relogio.agora += 10
+    despachante.enviar([alerta(2)])
+    relogio.agora += 5
+    despachante.enviar([alerta(3), alerta(2, estoque=2, nivel=NIVEL_ULTIMO_DIA)]) # O mais recente de cada remédio vale
+
+    assert len(despachante.backend.exibidas) == 1
+    assert despachante.pendentes() == 2
+    assert agendador.tarefas["notificacoes"][0] == pytest.approx(45)
+
+    relogio.agora += 45
+    agendador.rodar("notificacoes")
+    titulo, mensagem = despachante.backend.exibidas[1]
+    assert titulo == "2 remédios com estoque baixo!"
+    assert mensagem.split("\n")[0].startswith("Remedio 2: 2 comprimidos")
+    assert despachante.pendentes() == 0
+    assert [sorted(a.remedio_id for a in lote) for lote in exibidos] == [[1], [2, 3]]
+
+
+def test_forcar_ignora_o_intervalo_e_leva_os_que_esperavam(relogio, agendador):
+    despachante = Despachante(BackendMemoria(), agendador, intervalo_minimo_s=60, relogio=relogio)
+    despachante.enviar([alerta(1)])
+    relogio.agora += 10
+    despachante.enviar([alerta(2)])
+    assert despachante.pendentes() == 1
+
+    despachante.enviar([alerta(3)], forcar=True)
+    assert despachante.backend.exibidas[-1][0] == "2 remédios com estoque baixo!"
+    assert despachante.pendentes() == 0
+
+
+def test_backend_ocupado_tenta_de_novo_sem_perder_os_alertas(relogio, agendador):
+    exibidos = []
+    despachante = Despachante(BackendOcupado(recusas=2), agendador, intervalo_minimo_s=60, relogio=relogio,
+                              ao_exibir=exibidos.append)
+    despachante.enviar([alerta(1)])
+    assert despachante.pendentes() == 1
+    assert exibidos == []
+    assert agendador.tarefas["notificacoes"][0] == ESPERA_BACKEND_OCUPADO_S
+
+    relogio.agora += ESPERA_BACKEND_OCUPADO_S
+    despachante.enviar([alerta(2)]) # Nada foi exibido ainda: tenta na hora, e o backend recusa de novo
+    assert despachante.pendentes() == 2
+    assert despachante.backend.exibidas == []
+
+    relogio.agora += ESPERA_BACKEND_OCUPADO_S
+    agendador.rodar("notificacoes")
+    assert [titulo for titulo, _ in despachante.backend.exibidas] == ["2 remédios com estoque baixo!"]
+    assert despachante.pendentes() == 0
+    assert [len(lote) for lote in exibidos] == [2]
+
+
+def test_lembrete_com_backend_ocupado_sai_na_nova_tentativa(agendador):
+    despachante = Despachante(BackendOcupado(recusas=1), agendador)
+    hoje = date(2024, 1, 1)
+    despachante.lembrar([Dose(1, 1, "Losartana", 8 * 60, 1, "comprimido", hoje, None)])
+    assert despachante.backend.exibidas == []
+
+    agendador.rodar("lembretes_pendentes")
+    assert despachante.backend.exibidas == [("Hora do remédio!", "08:00 Losartana: 1 comprimido")]
+
+
+def test_backend_e_ao_exibir_rodam_fora_da_trava(agendador):
+    despachante = None
+    fora_da_trava = []
+
+    class BackendVerificando(BackendOcupado):
+        def exibir(self, titulo, mensagem):
+            fora_da_trava.append(not despachante._trava.locked())
+            return super().exibir(titulo, mensagem)
+
+    despachante = Despachante(BackendVerificando(recusas=1), agendador, intervalo_minimo_s=0,
+                              ao_exibir=lambda alertas: fora_da_trava.append(not despachante._trava.locked()))
+    despachante.enviar([alerta(1)])
+    assert despachante.pendentes() == 1 # A recusa devolveu o alerta para a fila
+    despachante.lembrar([Dose(1, 1, "Losartana", 8 * 60, 1, "comprimido", date(2024, 1, 1), None)])
+
+    agendador.rodar("notificacoes")
+    assert despachante.pendentes() == 0
+    assert fora_da_trava == [True] * 4
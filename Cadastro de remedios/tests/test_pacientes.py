@@ -0,0 +1,76 @@
+"""Pacientes: migração dos bancos antigos, nomes por paciente e consultas de um paciente."""
+import pytest
+
+import remedios_core as core
+import transferencia
+from remedios_core import PACIENTE_PADRAO, ServicoEstoque
+
+
+def test_banco_antigo_fica_com_o_paciente_padrao(db, monkeypatch):
+    # Um banco parado na versão 3, de antes dos pacientes
+    with monkeypatch.context() as m:
+        m.setattr(core, "VERSAO_ESQUEMA", 3)
+        ServicoEstoque(db).inicializar()
+    conn = db.conexao()
+    with conn:
+        remedio_id = conn.execute(
+            "INSERT INTO remedios (nome, doses_por_dia, estoque_atual) VALUES ('Losartana', 1, 30)"
+        ).lastrowid
+        conn.execute(
+            "INSERT INTO historico_estoque (remedio_id, quantidade_adicionada, data_adicao) VALUES (?, 30, '2023-12-01 08:00:00')",
+            (remedio_id,)
+        )
+
+    servico = ServicoEstoque(db)
+    servico.inicializar()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == core.VERSAO_ESQUEMA
+    assert servico.listar_pacientes() == [(PACIENTE_PADRAO, core.NOME_PACIENTE_PADRAO)]
+    assert servico.obter(remedio_id, paciente_id=PACIENTE_PADRAO)[1:4] == ("Losartana", 1, 30)
+    assert conn.execute("SELECT paciente_id FROM historico_estoque").fetchall() == [(PACIENTE_PADRAO,)]
+
+
+def test_mesmo_nome_em_dois_pacientes(servico):
+    ana = servico.cadastrar_paciente("Ana")
+    primeiro = servico.cadastrar("Losartana", 1, 30)
+    segundo = servico.cadastrar("Losartana", 2, 10, paciente_id=ana)
+
+    assert primeiro != segundo
+    assert servico.contar(PACIENTE_PADRAO) == servico.contar(ana) == 1
+    with pytest.raises(core.RemedioDuplicado):
+        servico.cadastrar("Losartana", 1, 5, paciente_id=ana)
+
+
+def test_lista_busca_e_alertas_de_um_paciente(servico):
+    ana = servico.cadastrar_paciente("Ana")
+    servico.cadastrar("Losartana", 1, 2) # Acaba em 2 dias: alerta
+    servico.cadastrar("Dipirona", 1, 90)
+    da_ana = servico.cadastrar("Losartana", 1, 3, paciente_id=ana)
+    servico.cadastrar("Insulina", 1, 90, paciente_id=ana)
+
+    assert [linha[1] for linha in servico.listar(0, 10, paciente_id=ana)] == ["Losartana", "Insulina"]
+    assert [linha[0] for linha in servico.listar(0, 10, busca="losartana", paciente_id=ana)] == [da_ana]
+    assert len(servico.listar(0, 10, busca="losartana")) == 2
+
+    alertas = servico.verificar_alertas(ana)
+    assert [alerta.remedio_id for alerta in alertas] == [da_ana]
+    assert alertas[0].paciente == "Ana" # Com mais de um paciente, o alerta diz de quem é
+    assert len(servico.verificar_alertas()) == 2
+
+
+def test_transferencia_cadastra_o_paciente_na_importacao(servico, tmp_path):
+    banco = servico.db.caminho
+    arquivo = tmp_path / "remedios.csv"
+    arquivo.write_text("nome,doses_por_dia,estoque\nLosartana,1,30\n", encoding="utf-8")
+
+    # Na exportação o paciente precisa existir
+    assert transferencia.main(["exportar", "remedios", str(tmp_path / "saida.csv"), "--banco", banco, "--paciente", "Ana"]) == 2
+    assert [nome for _, nome in servico.listar_pacientes()] == [core.NOME_PACIENTE_PADRAO]
+
+    assert transferencia.main(["importar", "remedios", str(arquivo), "--banco", banco, "--paciente", "Ana"]) == 0
+    ana = servico.obter_paciente_id("Ana")
+    assert [linha[1:4] for linha in servico.listar(0, 10, paciente_id=ana)] == [("Losartana", 1, 30)]
+    assert servico.contar(PACIENTE_PADRAO) == 0
+
+    saida = tmp_path / "saida.csv"
+    assert transferencia.main(["exportar", "remedios", str(saida), "--banco", banco, "--paciente", "Ana"]) == 0
+    assert saida.read_text(encoding="utf-8").splitlines()[1].startswith("Losartana,1,30")
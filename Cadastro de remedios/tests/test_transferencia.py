@@ -0,0 +1,53 @@
+"""Importação de remédios sobre remédios com horários."""
+import transferencia
+
+
+def _importar(servico, registros):
+    erros = []
+    gravados = transferencia.importar(servico, "remedios", enumerate(registros, 2), ao_erro=erros.append)
+    return gravados, erros
+
+
+def test_importacao_nao_muda_as_doses_dos_remedios_com_horarios(servico):
+    remedio_id = servico.cadastrar("Losartana", 1, 10)
+    servico.definir_horarios(remedio_id, [(8 * 60, 1), (20 * 60, 1)])
+
+    gravados, erros = _importar(servico, [
+        {"nome": "Losartana", "doses_por_dia": 3, "estoque": 90},
+        {"nome": "Dipirona", "doses_por_dia": 1, "estoque": 5},
+    ])
+
+    assert gravados == 1
+    assert [erro.linha for erro in erros] == [2]
+    assert "horários" in erros[0].mensagem
+    assert servico.obter(remedio_id)[2:4] == (2, 10)
+    assert [(minuto, quantidade) for _, minuto, quantidade in servico.horarios(remedio_id)] == [(480, 1), (1200, 1)]
+
+
+def test_importacao_com_as_mesmas_doses_atualiza_o_estoque(servico):
+    remedio_id = servico.cadastrar("Losartana", 1, 10)
+    servico.definir_horarios(remedio_id, [(8 * 60, 1), (20 * 60, 1)])
+
+    gravados, erros = _importar(servico, [{"nome": "Losartana", "doses_por_dia": 2, "estoque": 90}])
+
+    assert (gravados, erros) == (1, [])
+    assert servico.obter(remedio_id)[2:4] == (2, 90)
+    assert len(servico.horarios(remedio_id)) == 2
+
+
+def test_importacao_registra_o_estoque_inicial_so_dos_remedios_novos(servico):
+    existente = servico.cadastrar("Losartana", 1, 10)
+
+    gravados, erros = _importar(servico, [
+        {"nome": "Losartana", "doses_por_dia": 1, "estoque": 90},
+        {"nome": "Dipirona", "doses_por_dia": 1, "estoque": 5},
+        {"nome": "Dipirona", "doses_por_dia": 2, "estoque": 12}, # Repetido no lote: vale o último
+        {"nome": "Omeprazol", "doses_por_dia": 1, "estoque": 0},
+    ])
+
+    assert (gravados, erros) == (4, [])
+    assert [quantidade for _, quantidade in servico.historico(existente)] == [10] # Atualizado, não reposto
+    dipirona, omeprazol = (servico.listar(0, 1, busca=nome)[0][0] for nome in ("dipirona", "omeprazol"))
+    assert [quantidade for _, quantidade in servico.historico(dipirona)] == [12]
+    assert servico.historico(omeprazol) == []
+    assert servico.consumo(dipirona).reposicoes == 1 # E as estatísticas de consumo, pelo gatilho
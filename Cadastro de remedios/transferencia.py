@@ -0,0 +1,259 @@
+"""
+Importação e exportação em lote dos remédios e do histórico (CSV ou JSONL).
+
+Os arquivos são lidos e escritos linha a linha: a importação valida cada
+registro com as mesmas regras do cadastro e grava em lotes de
+'tamanho_lote' registros por transação (remédios com o mesmo nome são
+atualizados, mas as doses por dia dos que têm horários só mudam pelos
+horários); a exportação percorre as consultas sem carregar as tabelas.
+Os erros são informados por linha, sem interromper a importação. Cada
+arquivo é de um paciente (--paciente; sem ele, o paciente padrão): na
+importação o paciente é cadastrado se ainda não existir.
+
+Uso:
+  python transferencia.py importar {remedios,historico} arquivo [--formato csv|jsonl] [--banco remedios.db] [--paciente nome]
+  python transferencia.py exportar {remedios,historico} arquivo [--formato csv|jsonl] [--banco remedios.db] [--paciente nome]
+
+Use '-' como arquivo para ler da entrada padrão ou escrever na saída padrão.
+"""
+import argparse
+import contextlib
+import csv
+import json
+import os
+import sqlite3
+import sys
+from collections import namedtuple
+from datetime import datetime
+
+from banco import GerenciadorConexoes
+from remedios_core import (
+    DB_PATH, LIMITE_DIAS_PADRAO, PACIENTE_PADRAO, ErroValidacao, PacienteNaoEncontrado,
+    ServicoEstoque, ValorInvalido, formatar_data, validar_remedio, validar_valores,
+)
+
+TAMANHO_LOTE = 1000 # Registros gravados por transação
+FORMATOS = ("csv", "jsonl")
+UNIDADES = ("comprimido", "ml")
+
+# Campos de cada tipo de arquivo, na ordem das colunas do CSV
+CAMPOS = {
+    "remedios": ("nome", "doses_por_dia", "estoque", "unidade", "limite_dias"),
+    "historico": ("nome", "quantidade", "data_adicao"),
+}
+
+ErroLinha = namedtuple("ErroLinha", "linha mensagem")
+
+
+def formato_do_arquivo(caminho, formato=None):
+    """O formato pedido ou, se não houver, o da extensão do arquivo (CSV por padrão)."""
+    if formato:
+        return formato
+    return "jsonl" if os.path.splitext(caminho)[1].lower() in (".jsonl", ".json") else "csv"
+
+
+# --- Leitura ---
+
+def ler_registros(arquivo, formato):
+    """Gera (número da linha, registro) do arquivo; um registro JSONL inválido vem como None."""
+    if formato == "csv":
+        leitor = csv.DictReader(arquivo)
+        for registro in leitor:
+            yield leitor.line_num, registro
+        return
+
+    for numero, texto in enumerate(arquivo, 1):
+        if not texto.strip():
+            continue
+        try:
+            yield numero, json.loads(texto)
+        except json.JSONDecodeError:
+            yield numero, None
+
+
+def _texto(registro, campo, padrao=None):
+    valor = registro.get(campo)
+    if valor is None or str(valor).strip() == "":
+        if padrao is None:
+            raise ValorInvalido(f"Campo '{campo}' ausente.")
+        return padrao
+    return str(valor).strip()
+
+
+def _inteiro(registro, campo, padrao=None):
+    valor = registro.get(campo)
+    if valor is None or str(valor).strip() == "":
+        if padrao is None:
+            raise ValorInvalido(f"Campo '{campo}' ausente.")
+        return padrao
+    if isinstance(valor, bool) or (isinstance(valor, float) and not valor.is_integer()):
+        raise ValorInvalido(f"Campo '{campo}' não é um número inteiro: {valor!r}.")
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValorInvalido(f"Campo '{campo}' não é um número inteiro: {valor!r}.") from None
+
+
+def validar_registro_remedio(registro):
+    """(nome, doses_por_dia, estoque, unidade, limite_dias) de um registro; levanta ErroValidacao."""
+    if not isinstance(registro, dict):
+        raise ValorInvalido("A linha não é um objeto JSON.")
+    nome = _texto(registro, "nome")
+    doses_por_dia = _inteiro(registro, "doses_por_dia")
+    estoque = _inteiro(registro, "estoque", 0)
+    unidade = _texto(registro, "unidade", "comprimido").lower()
+    limite_dias = _inteiro(registro, "limite_dias", LIMITE_DIAS_PADRAO)
+    if unidade not in UNIDADES:
+        raise ValorInvalido(f"Unidade desconhecida: '{unidade}'. Use {' ou '.join(UNIDADES)}.")
+    nome = validar_remedio(nome, doses_por_dia, estoque, limite_dias)
+    return nome, doses_por_dia, estoque, unidade, limite_dias
+
+
+def validar_registro_reposicao(registro):
+    """(nome, quantidade, data_adicao) de um registro de histórico; levanta ErroValidacao."""
+    if not isinstance(registro, dict):
+        raise ValorInvalido("A linha não é um objeto JSON.")
+    nome = _texto(registro, "nome")
+    quantidade = _inteiro(registro, "quantidade")
+    if quantidade <= 0:
+        raise ValorInvalido("A quantidade deve ser um número positivo.")
+    validar_valores((quantidade,))
+    texto_data = _texto(registro, "data_adicao")
+    try:
+        data_adicao = datetime.fromisoformat(texto_data)
+    except ValueError:
+        raise ValorInvalido(f"Data inválida: '{texto_data}'. Use AAAA-MM-DD ou AAAA-MM-DD HH:MM:SS.") from None
+    return nome, quantidade, formatar_data(data_adicao)
+
+
+# --- Importação e exportação ---
+
+def importar(servico, tipo, registros, tamanho_lote=TAMANHO_LOTE, ao_erro=None, paciente_id=PACIENTE_PADRAO):
+    """
+    Valida e grava os registros (pares (linha, registro) de ler_registros) do paciente em lotes.
+    Cada registro rejeitado vai para 'ao_erro' como um ErroLinha. Retorna quantos
+    registros foram gravados.
+    """
+    validar = validar_registro_remedio if tipo == "remedios" else validar_registro_reposicao
+    ao_erro = ao_erro or (lambda erro: None)
+    gravados = 0
+    lote = [] # (linha, registro validado)
+
+    def gravar():
+        if tipo == "remedios":
+            rejeitados = servico.gravar_remedios([registro for _, registro in lote], paciente_id)
+            for posicao in rejeitados:
+                linha, (nome, doses_por_dia, _, _, _) = lote[posicao]
+                ao_erro(ErroLinha(linha, f"O remédio '{nome}' tem horários definidos: as doses por dia "
+                                         f"({doses_por_dia}) só mudam pelos horários."))
+            return len(lote) - len(rejeitados)
+        faltando = servico.gravar_reposicoes([registro for _, registro in lote], paciente_id)
+        for posicao in faltando:
+            linha, (nome, _, _) = lote[posicao]
+            ao_erro(ErroLinha(linha, f"O remédio '{nome}' não está cadastrado."))
+        return len(lote) - len(faltando)
+
+    for linha, registro in registros:
+        try:
+            lote.append((linha, validar(registro)))
+        except ErroValidacao as e:
+            ao_erro(ErroLinha(linha, str(e)))
+            continue
+        if len(lote) >= tamanho_lote:
+            gravados += gravar()
+            lote = []
+    if lote:
+        gravados += gravar()
+    return gravados
+
+
+def exportar(servico, tipo, arquivo, formato, paciente_id=PACIENTE_PADRAO):
+    """Escreve todos os remédios ou todo o histórico do paciente no arquivo. Retorna quantos registros escreveu."""
+    if tipo == "remedios":
+        linhas = servico.exportar_remedios(paciente_id)
+    else:
+        linhas = servico.exportar_historico(paciente_id)
+    campos = CAMPOS[tipo]
+    total = 0
+    if formato == "csv":
+        escritor = csv.writer(arquivo)
+        escritor.writerow(campos)
+        for linha in linhas:
+            escritor.writerow(linha)
+            total += 1
+    else:
+        for linha in linhas:
+            arquivo.write(json.dumps(dict(zip(campos, linha)), ensure_ascii=False) + "\n")
+            total += 1
+    return total
+
+
+@contextlib.contextmanager
+def _abrir(caminho, modo, formato):
+    if caminho == "-":
+        yield sys.stdin if modo == "r" else sys.stdout
+        return
+    # 'utf-8-sig' aceita os CSV salvos pelo Excel (com BOM)
+    codificacao = "utf-8-sig" if modo == "r" else "utf-8"
+    with open(caminho, modo, encoding=codificacao, newline="" if formato == "csv" else None) as arquivo:
+        yield arquivo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa ou exporta remédios e histórico em CSV ou JSONL.")
+    parser.add_argument("acao", choices=("importar", "exportar"))
+    parser.add_argument("tipo", choices=tuple(CAMPOS))
+    parser.add_argument("arquivo", help="Arquivo CSV/JSONL ('-' para a entrada/saída padrão)")
+    parser.add_argument("--formato", choices=FORMATOS, help="Padrão: pela extensão do arquivo")
+    parser.add_argument("--banco", default=DB_PATH, help="Banco de dados (padrão: o do programa)")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="Registros por transação na importação")
+    parser.add_argument("--paciente", help="Nome do paciente (padrão: o paciente padrão)")
+    args = parser.parse_args(argv)
+
+    formato = formato_do_arquivo(args.arquivo, args.formato)
+    db = GerenciadorConexoes(args.banco)
+    servico = ServicoEstoque(db)
+    try:
+        servico.inicializar()
+        servico.debitar_dias() # O estoque importado é o de hoje, como no programa
+
+        paciente_id = PACIENTE_PADRAO
+        if args.paciente:
+            try:
+                paciente_id = servico.obter_paciente_id(args.paciente)
+            except PacienteNaoEncontrado:
+                if args.acao == "exportar":
+                    print(f"O paciente '{args.paciente}' não está cadastrado.", file=sys.stderr)
+                    return 2
+                try:
+                    paciente_id = servico.cadastrar_paciente(args.paciente)
+                except ErroValidacao as e:
+                    print(f"Paciente inválido: {e}", file=sys.stderr)
+                    return 2
+
+        if args.acao == "exportar":
+            with _abrir(args.arquivo, "w", formato) as arquivo:
+                total = exportar(servico, args.tipo, arquivo, formato, paciente_id)
+            print(f"{total} registro(s) exportado(s).", file=sys.stderr)
+            return 0
+
+        erros = [0]
+
+        def mostrar_erro(erro):
+            erros[0] += 1
+            print(f"Linha {erro.linha}: {erro.mensagem}", file=sys.stderr)
+
+        with _abrir(args.arquivo, "r", formato) as arquivo:
+            total = importar(servico, args.tipo, ler_registros(arquivo, formato), args.lote, mostrar_erro, paciente_id)
+        print(f"{total} registro(s) importado(s), {erros[0]} com erro.", file=sys.stderr)
+        return 1 if erros[0] else 0
+    except sqlite3.Error as e:
+        # Os lotes gravados antes do erro continuam no banco
+        print(f"Erro de banco de dados: {e}", file=sys.stderr)
+        return 2
+    finally:
+        db.fechar_todas()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Verificação do estoque sem janela, para o agendador do sistema.
+
+Faz o que a janela faz na virada do dia (debita os dias passados) e, com
+--check, a verificação de alertas, e termina: sem criar a janela do Tk e
+sem importar o Tk, a bandeja (pystray/Pillow) nem o win10toast (só se o
+toast for de fato exibido). Os alertas vão para o destino escolhido em
+--notificacoes; a verificação é a incremental, então um remédio só volta a
+ser avisado quando sobe de nível (o nível avisado fica no banco e vale
+também para a janela).
+
+Uso (pelo programa principal ou direto):
+  gerenciador_remedios.py --check [--todos] [--notificacoes=toast|arquivo[:caminho]|console] [--banco=remedios.db]
+  gerenciador_remedios.py --debit-only [--banco=remedios.db]
+
+Código de saída: 0 sem alertas, 1 com alertas (enviados), 2 opções
+inválidas, 3 erro de banco de dados, 4 alertas que o destino não conseguiu
+exibir (não são dados como avisados e voltam na próxima verificação).
+O verificar_estoque.bat, feito para o Agendador de Tarefas, troca o 1 por 0.
+"""
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+
+from banco import GerenciadorConexoes
+from diagnostico import ARQUIVO_LOG, configurar_logging, metricas
+from notificacoes import Despachante, criar_backend
+from remedios_core import DB_PATH, ServicoEstoque
+
+SAIDA_OK = 0
+SAIDA_ALERTAS = 1
+SAIDA_ERRO_BANCO = 3 # O 2 é o do argparse para opções inválidas
+SAIDA_ERRO_ENVIO = 4
+
+logger = logging.getLogger(__name__)
+
+
+def verificar(servico, alertas=True, todos=False):
+    """
+    Debita os dias passados e, com 'alertas', verifica os alertas (todos os
+    remédios no limite, com 'todos'). Retorna (se algum dia foi debitado, alertas).
+    Os níveis dos alertas novos não são gravados aqui: quem os exibe chama
+    servico.registrar_alertas depois de exibi-los.
+    """
+    debitou = servico.debitar_dias()
+    if not alertas:
+        return debitou, []
+    return debitou, servico.verificar_alertas() if todos else servico.verificar_alertas_novos(registrar=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Débito do estoque e verificação de alertas sem janela.")
+    modo = parser.add_mutually_exclusive_group(required=True)
+    modo.add_argument("--check", action="store_true", help="Debita os dias passados e verifica os alertas")
+    modo.add_argument("--debit-only", action="store_true", help="Só debita os dias passados")
+    parser.add_argument("--todos", action="store_true", help="Avisa de todos os remédios no limite, não só dos novos")
+    parser.add_argument("--notificacoes", default="toast", help="toast (padrão), arquivo[:caminho] ou console")
+    parser.add_argument("--banco", default=DB_PATH, help="Banco de dados (padrão: o do programa)")
+    # As opções da janela (ex.: --minimized) são ignoradas
+    args, _ = parser.parse_known_args(argv)
+
+    inicio = time.perf_counter()
+    configurar_logging(ARQUIVO_LOG)
+
+    db = GerenciadorConexoes(args.banco)
+    servico = ServicoEstoque(db)
+    despachante = None
+    if args.check:
+        try:
+            # Sem thread: o processo só termina depois que o toast sai da tela
+            backend = criar_backend(args.notificacoes, em_thread=False)
+        except ValueError as e:
+            parser.error(str(e))
+        if backend is None:
+            logger.warning("win10toast não encontrado; os alertas vão para o console.")
+            backend = criar_backend("console")
+        # Os níveis só são gravados depois que o resumo é exibido: se o destino
+        # falhar, os mesmos alertas voltam na próxima verificação
+        despachante = Despachante(backend, intervalo_minimo_s=0,
+                                  ao_exibir=None if args.todos else servico.registrar_alertas)
+
+    try:
+        servico.inicializar()
+        debitou, alertas = verificar(servico, args.check, args.todos)
+        logger.info("Verificação sem janela: %s, %d alerta(s), %.0f ms.",
+                    "dias debitados" if debitou else "nenhum dia a debitar", len(alertas),
+                    (time.perf_counter() - inicio) * 1000)
+        if alertas:
+            despachante.enviar(alertas, forcar=True)
+    except sqlite3.Error as e:
+        logger.error("Erro de banco de dados na verificação: %s", e)
+        return SAIDA_ERRO_BANCO
+    finally:
+        db.fechar_todas()
+
+    logger.debug("Métricas:\n%s", metricas.resumo())
+    if alertas and despachante.pendentes():
+        return SAIDA_ERRO_ENVIO
+    return SAIDA_ALERTAS if alertas else SAIDA_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
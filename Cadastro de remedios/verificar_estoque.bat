@@ -0,0 +1,12 @@
+@echo off
+REM Para o Agendador de Tarefas do Windows (ex.: todo dia e ao fazer logon).
+REM Debita o estoque dos dias passados e avisa dos remédios que entraram no
+REM limite de alerta, sem abrir a janela. Termina com 0 (sem alertas ou
+REM alertas enviados) ou >= 2 (erro; ver remedios.log na pasta do usuário):
+REM o 1 do --check (alertas enviados) vira 0, porque o Agendador de Tarefas
+REM mostra qualquer código diferente de 0 como falha na execução.
+cd /d "%~dp0"
+
+pythonw.exe gerenciador_remedios.py --check
+if %ERRORLEVEL% EQU 1 exit /b 0
+exit /b %ERRORLEVEL%